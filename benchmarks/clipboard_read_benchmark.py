@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Per-read clipboard latency: subprocess-per-read versus the persistent backend.
+
+Needs a desktop session (X11, Wayland, macOS or Windows) with something on
+the clipboard. Run from the repository root:
+
+    python benchmarks/clipboard_read_benchmark.py --reads 200
+
+"before" repeats the old read path: an image read then a text read, each
+spawning xclip/wl-paste on Linux. "after" is get_clipboard_content() with
+the persistent X11 connection (when python-xlib and $DISPLAY are available)
+and the change-token probe cache.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from clipboard_platform import ClipboardPlatform  # noqa: E402
+
+
+def legacy_read(clipboard: ClipboardPlatform):
+    """Image probe then text read, without the persistent backend"""
+    return clipboard.get_image() or clipboard.get_text()
+
+
+def measure(read, reads: int) -> list:
+    """Time each call of read() in milliseconds"""
+    timings = []
+    for _ in range(reads):
+        start = time.perf_counter()
+        read()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<8} mean {statistics.mean(timings):8.3f} ms   "
+          f"p50 {statistics.median(timings):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reads', type=int, default=100)
+    args = parser.parse_args()
+
+    before = ClipboardPlatform()
+    # Force the subprocess backends
+    before._x11_checked = True
+    before._x11 = None
+
+    after = ClipboardPlatform()
+    print(f"Platform: {after.os_type}, subprocess backend: "
+          f"{getattr(after, 'linux_backend', None)}, "
+          f"persistent X11 connection: {after._get_x11() is not None}")
+
+    report('before', measure(lambda: legacy_read(before), args.reads))
+    report('after', measure(after.get_clipboard_content, args.reads))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
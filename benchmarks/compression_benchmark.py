@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Bytes saved versus CPU cost of text clip compression.
+
+Run from the repository root:
+
+    python benchmarks/compression_benchmark.py --sizes 1024 16384 262144
+
+Each corpus is cut into clips of the given sizes and compressed with
+every available codec (zstd needs Python 3.14+ or ``zstandard``). The
+report shows the stored size relative to the raw text, and compression
+and decompression time per clip. Clips compress_text() leaves plain
+(below the threshold or saving too little) count at their raw size.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import base64
+import random
+import argparse
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+REPO_DIR = os.path.join(SRC_DIR, '..')
+sys.path.insert(0, SRC_DIR)
+
+from clip_compression import (  # noqa: E402
+    DEFAULT_LEVELS, DEFAULT_THRESHOLD, available_encodings, compress_text, decompress_text
+)
+
+
+def corpus_logs(size: int) -> str:
+    """Application log lines with timestamps, levels and request IDs"""
+    rng = random.Random(1)
+    levels = ['INFO', 'INFO', 'INFO', 'DEBUG', 'WARNING', 'ERROR']
+    lines = []
+    while sum(map(len, lines)) < size:
+        lines.append(
+            f"2024-03-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:"
+            f"{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d},{rng.randint(0, 999):03d} "
+            f"{rng.choice(levels):7s} [worker-{rng.randint(1, 16)}] "
+            f"request_id={rng.getrandbits(64):016x} path=/api/clipboard/{rng.randint(1, 999)} "
+            f"status={rng.choice([200, 200, 200, 404, 500])} "
+            f"duration_ms={rng.uniform(0.5, 900):.1f}\n"
+        )
+    return ''.join(lines)
+
+
+def corpus_code(size: int) -> str:
+    """Python source of this repository"""
+    sources = ''.join(
+        open(path, encoding='utf-8').read()
+        for path in sorted(glob.glob(os.path.join(SRC_DIR, '*.py')))
+    )
+    return (sources * (size // len(sources) + 1))[:size]
+
+
+def corpus_json(size: int) -> str:
+    """Pretty-printed API responses"""
+    rng = random.Random(2)
+    history = []
+    while len(json.dumps(history, indent=2)) < size:
+        history.append({
+            'id': f"{rng.getrandbits(96):024x}",
+            'seq': len(history) + 1,
+            'content_type': 'text',
+            'preview': f"copied snippet number {rng.randint(1, 10 ** 6)}",
+            'size': rng.randint(10, 5000),
+            'timestamp': 1700000000 + rng.uniform(0, 10 ** 6)
+        })
+    return json.dumps(history, indent=2)[:size]
+
+
+def corpus_prose(size: int) -> str:
+    """Markdown documentation of this repository"""
+    docs = ''.join(
+        open(path, encoding='utf-8').read()
+        for path in sorted(glob.glob(os.path.join(REPO_DIR, '*.md')))
+    )
+    return (docs * (size // len(docs) + 1))[:size]
+
+
+def corpus_base64(size: int) -> str:
+    """Base64 of random bytes (tokens, keys, pasted binaries)"""
+    return base64.b64encode(random.Random(3).randbytes(size))[:size].decode()
+
+
+CORPORA = {
+    'logs': corpus_logs,
+    'code': corpus_code,
+    'json': corpus_json,
+    'prose': corpus_prose,
+    'base64': corpus_base64,
+}
+
+
+def measure(text: str, encoding: str, level: int, threshold: int, repeat: int) -> tuple:
+    """Stored size, compress and decompress microseconds per clip"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        content, used = compress_text(text, encoding, threshold, level)
+    compress_us = (time.perf_counter() - start) * 1e6 / repeat
+
+    stored = len(content) if used else len(text.encode('utf-8'))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decompress_text(content, used)
+    decompress_us = (time.perf_counter() - start) * 1e6 / repeat
+    return stored, compress_us, decompress_us
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 16384, 262144])
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--levels', type=int, nargs='*',
+                        help='Levels to try (default: each codec default plus 1)')
+    args = parser.parse_args()
+
+    print(f"{'corpus':8s} {'size':>8s} {'codec':10s} {'stored':>7s} "
+          f"{'saved':>9s} {'compress':>11s} {'decompress':>11s}")
+    for name, make in CORPORA.items():
+        for size in args.sizes:
+            text = make(size)
+            raw = len(text.encode('utf-8'))
+            repeat = max(3, 2_000_000 // max(raw, 1))
+            for encoding in available_encodings():
+                for level in args.levels or sorted({1, DEFAULT_LEVELS[encoding]}):
+                    stored, compress_us, decompress_us = measure(
+                        text, encoding, level, args.threshold, repeat
+                    )
+                    print(f"{name:8s} {raw:8d} {encoding + '-' + str(level):10s} "
+                          f"{stored / raw:6.1%} {raw - stored:9d} "
+                          f"{compress_us:8.1f} us {decompress_us:8.1f} us")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
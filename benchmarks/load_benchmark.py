@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Load test of the sync path: POST a clip, receive it on every subscriber.
+
+Run from the repository root:
+
+    python benchmarks/load_benchmark.py --users 100 --subscribers 1000 \\
+        --rate 200 --duration 30 --output load.json
+
+The harness starts the web server (webapp.py, or asgi_app.py with
+``--app asgi``; ``--workers N`` runs N processes sharing rooms through a
+LocalBroker), connects Socket.IO subscribers spread over ``--users``
+users from ``--processes`` processes, and posts clips at ``--rate`` per
+second with the ``--mix`` of payloads. Each clip carries its send time,
+so subscribers measure copy-to-receive latency directly.
+
+By default the server uses an in-memory stand-in for MongoDB; pass
+``--db sqlite`` for the embedded SQLite backend (a temporary file shared
+by the workers) or ``--db mongo`` to use the MongoDB at
+MONGODB_HOST/MONGODB_PORT. The
+report (also written as JSON with ``--output``) has latency
+percentiles, publish and delivery throughput and server memory.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import hashlib
+import argparse
+import secrets
+import threading
+import subprocess
+import tempfile
+import statistics
+import multiprocessing
+from collections import defaultdict
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+# Content prefix of benchmark clips: bench:<clip id>:<send time>:
+CLIP_PREFIX = 'bench'
+
+
+class MemoryCRUD:
+    """In-memory stand-in for the MongoCRUD methods the sync path uses"""
+
+    def __init__(self, keep: int = 1000) -> None:
+        """Initialize the store
+
+        Args:
+            keep (int): Newest transactions kept per user
+        """
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._seq = defaultdict(int)
+        self._transactions = defaultdict(list)
+        self._blobs = {}
+
+    def next_sequence(self, user_id, count=1):
+        with self._lock:
+            self._seq[user_id] += count
+            return self._seq[user_id] - count + 1
+
+    def get_last_sequence(self, user_id):
+        with self._lock:
+            return self._seq[user_id]
+
+    def get_last_stored_sequence(self, user_id):
+        with self._lock:
+            history = self._transactions[user_id]
+            return max((t['seq'] for t in history), default=0)
+
+    def insert_blob(self, data, mime_type='image/png'):
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._blobs.setdefault(digest, {'data': data, 'mime_type': mime_type})
+        return digest
+
+    def get_blob(self, digest):
+        with self._lock:
+            return self._blobs.get(digest)
+
+    def insert_transaction(self, user_id, obj, image_digest=None, seq=None):
+        if seq is None:
+            seq = self.next_sequence(user_id)
+        self._store(user_id, [self._transaction(user_id, obj, image_digest, seq)])
+        return self
+
+    def insert_transactions(self, user_id, objs):
+        first_seq = self.next_sequence(user_id, len(objs))
+        transactions = [
+            self._transaction(user_id, obj, None, first_seq + offset)
+            for offset, obj in enumerate(objs)
+        ]
+        self._store(user_id, transactions)
+        return transactions
+
+    def get_transactions_since(self, user_id, since, limit=500):
+        with self._lock:
+            return [t for t in self._transactions[user_id] if t['seq'] > since][:limit]
+
+    def _transaction(self, user_id, obj, image_digest, seq):
+        return {
+            '_id': f"{user_id}-{seq}",
+            'user_id': user_id,
+            'seq': seq,
+            'content': obj.get_content(),
+            'content_type': obj.get_content_type(),
+            'image_digest': image_digest,
+            'timestamp': time.time()
+        }
+
+    def _store(self, user_id, transactions):
+        with self._lock:
+            history = self._transactions[user_id]
+            history.extend(transactions)
+            del history[:-self.keep]
+
+
+def serve(args) -> None:
+    """Run one server process (``--serve`` mode)"""
+    os.chdir(SRC_DIR)
+    if args.app == 'asgi':
+        import uvicorn
+        import asgi_app as server
+        if args.db == 'memory':
+            server.db = MemoryCRUD()
+        uvicorn.run(server.app, host='127.0.0.1', port=args.port, log_level='warning')
+    else:
+        import webapp as server
+        if args.db == 'memory':
+            server.db = MemoryCRUD()
+        server.socketio.run(server.app, host='127.0.0.1', port=args.port,
+                            allow_unsafe_werkzeug=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Server on port {port} did not start")
+
+
+def rss_mb(pid: int):
+    """Resident memory of a process in MiB (None where /proc is missing)"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def parse_mix(spec: str) -> list:
+    """Parse ``kind:size=weight,...`` (kind is text or png)"""
+    mix = []
+    for item in spec.split(','):
+        kind_size, _, weight = item.partition('=')
+        kind, _, size = kind_size.partition(':')
+        if kind not in ('text', 'png'):
+            raise ValueError(f"Unknown payload kind: {kind!r}")
+        mix.append((kind, int(size), float(weight or 1)))
+    return mix
+
+
+def percentiles(samples: list) -> dict:
+    """Latency summary in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        'count': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'p99': pick(0.99),
+        'p999': pick(0.999),
+        'max': ordered[-1]
+    }
+
+
+def subscriber_process(urls, assignments, encodings, ready, stop, results) -> None:
+    """Connect the assigned subscribers and time every clip they receive"""
+    import socketio
+    from clip_compression import decode_event
+
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def on_update(data):
+        received = time.time()
+        decode_event(data)
+        parts = (data.get('content') or '').split(':', 3)
+        if len(parts) >= 3 and parts[0] == CLIP_PREFIX:
+            with lock:
+                latencies.append((received - float(parts[2])) * 1000)
+
+    clients = []
+    for index, user_id in assignments:
+        client = socketio.Client(reconnection=False)
+        client.on('clipboard_update', on_update)
+        join = {'user_id': user_id}
+        if encodings:
+            join['encodings'] = encodings
+        try:
+            client.connect(urls[index % len(urls)], transports=['websocket'])
+            client.emit('join', join)
+            clients.append(client)
+        except Exception:
+            errors += 1
+    ready.put((len(clients), errors))
+
+    stop.wait()
+    for client in clients:
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+    results.put((latencies, errors))
+
+
+def publish(urls, users, mix, rate, duration, threads, subscribers_per_user) -> dict:
+    """Post clips open-loop at the target rate from several threads"""
+    import requests
+
+    weights = [weight for _, _, weight in mix]
+    interval = threads / rate
+    http_latencies, expected = [], []
+    counters = {'sent': 0, 'errors': 0, 'bytes': 0}
+    error_kinds = defaultdict(int)
+    lock = threading.Lock()
+    start = time.time() + 0.5
+    ids = iter(range(10 ** 12))
+
+    def run(offset):
+        session = requests.Session()
+        rng = random.Random(offset)
+        next_send = start + offset * interval / threads
+        while next_send < start + duration:
+            time.sleep(max(0.0, next_send - time.time()))
+            next_send += interval
+            kind, size, _ = rng.choices(mix, weights)[0]
+            user_id = rng.choice(users)
+            url = urls[rng.randrange(len(urls))]
+            with lock:
+                clip_id = next(ids)
+            sent_at = time.time()
+            label = f"{CLIP_PREFIX}:{clip_id}:{sent_at:.6f}:"
+            try:
+                if kind == 'png':
+                    body = b'\x89PNG\r\n\x1a\n' + rng.randbytes(max(size - 8, 0))
+                    response = session.post(
+                        f"{url}/api/clipboard/{user_id}/image",
+                        params={'content': label}, data=body,
+                        headers={'Content-Type': 'image/png'}, timeout=30
+                    )
+                else:
+                    body = label + 'x' * max(size - len(label), 0)
+                    response = session.post(f"{url}/api/clipboard", json={
+                        'user_id': user_id, 'content': body
+                    }, timeout=30)
+                error = None if response.status_code == 200 else str(response.status_code)
+            except Exception as e:
+                error = type(e).__name__
+            elapsed = (time.time() - sent_at) * 1000
+            with lock:
+                if error is None:
+                    counters['sent'] += 1
+                    counters['bytes'] += len(body)
+                    http_latencies.append(elapsed)
+                    expected.append(subscribers_per_user[user_id])
+                else:
+                    counters['errors'] += 1
+                    error_kinds[error] += 1
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = max(time.time() - start, 1e-9)
+    return {
+        'sent': counters['sent'],
+        'errors': counters['errors'],
+        'errors_by_kind': dict(error_kinds),
+        'bytes': counters['bytes'],
+        'rate': counters['sent'] / elapsed,
+        'http_latency_ms': percentiles(http_latencies),
+        'expected_deliveries': sum(expected)
+    }
+
+
+def run_benchmark(args) -> dict:
+    """Start the servers and subscribers, drive the load and collect results"""
+    env = dict(os.environ)
+    # The memory stand-in replaces the SQLite store once the app is imported
+    data_dir = tempfile.mkdtemp(prefix='syncclipboard-bench-')
+    env['STORAGE_BACKEND'] = 'mongo' if args.db == 'mongo' else 'sqlite'
+    env['SQLITE_PATH'] = os.path.join(data_dir, 'clipboard.db')
+    broker = None
+    if args.workers > 1:
+        from socket_manager import LocalBroker
+        env['SOCKETIO_BROKER_AUTHKEY'] = secrets.token_hex(16)
+        broker = LocalBroker(authkey=env['SOCKETIO_BROKER_AUTHKEY'].encode()).start()
+        env['SOCKETIO_MESSAGE_QUEUE'] = broker.url
+
+    ports = [free_port() for _ in range(args.workers)]
+    servers = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port),
+             '--app', args.app, '--db', args.db],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for port in ports
+    ]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    subscribers = []
+    stop = multiprocessing.Event()
+    try:
+        for port in ports:
+            wait_for_port(port)
+        rss_start = [rss_mb(server.pid) for server in servers]
+
+        users = list(range(1, args.users + 1))
+        assignments = [(i, users[i % len(users)]) for i in range(args.subscribers)]
+        subscribers_per_user = defaultdict(int)
+        for _, user_id in assignments:
+            subscribers_per_user[user_id] += 1
+
+        ready, results = multiprocessing.Queue(), multiprocessing.Queue()
+        encodings = args.encodings.split(',') if args.encodings else []
+        for p in range(args.processes):
+            process = multiprocessing.Process(
+                target=subscriber_process,
+                args=(urls, assignments[p::args.processes], encodings, ready, stop, results)
+            )
+            process.start()
+            subscribers.append(process)
+        connected = connect_errors = 0
+        for _ in subscribers:
+            count, errors = ready.get(timeout=args.connect_timeout)
+            connected += count
+            connect_errors += errors
+        # Let the last join messages be handled before the clock starts
+        time.sleep(1.0)
+
+        peak = list(rss_start)
+        sampling = threading.Event()
+
+        def sample_memory():
+            while not sampling.wait(0.5):
+                for i, server in enumerate(servers):
+                    rss = rss_mb(server.pid)
+                    if rss is not None:
+                        peak[i] = max(peak[i] or 0, rss)
+
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+        published = publish(
+            urls, users, parse_mix(args.mix), args.rate, args.duration,
+            args.publishers, subscribers_per_user
+        )
+        time.sleep(args.drain)
+        sampling.set()
+        rss_end = [rss_mb(server.pid) for server in servers]
+
+        stop.set()
+        latencies, receive_errors = [], 0
+        for _ in subscribers:
+            samples, errors = results.get(timeout=60)
+            latencies.extend(samples)
+            receive_errors += errors
+    finally:
+        stop.set()
+        for process in subscribers:
+            process.join(10)
+        for server in servers:
+            server.terminate()
+            server.wait(10)
+        if broker is not None:
+            broker.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    expected = published.pop('expected_deliveries')
+    return {
+        'config': {
+            'app': args.app, 'db': args.db, 'workers': args.workers,
+            'users': args.users, 'subscribers': args.subscribers,
+            'processes': args.processes, 'rate': args.rate,
+            'duration': args.duration, 'mix': args.mix,
+            'encodings': args.encodings or None
+        },
+        'subscribers': {'connected': connected, 'errors': connect_errors + receive_errors},
+        'publish': published,
+        'delivery': {
+            'expected': expected,
+            'received': len(latencies),
+            'ratio': len(latencies) / expected if expected else None,
+            'rate': len(latencies) / args.duration,
+            'latency_ms': percentiles(latencies)
+        },
+        'server_rss_mb': {
+            'start': sum(r or 0 for r in rss_start),
+            'peak': sum(r or 0 for r in peak),
+            'end': sum(r or 0 for r in rss_end)
+        }
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--app', choices=['webapp', 'asgi'], default='webapp',
+                        help='Server to test')
+    parser.add_argument('--db', choices=['memory', 'sqlite', 'mongo'], default='memory')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Server processes sharing rooms through a LocalBroker')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--processes', type=int, default=4,
+                        help='Processes hosting the subscribers')
+    parser.add_argument('--rate', type=float, default=50, help='Clips posted per second')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load')
+    parser.add_argument('--publishers', type=int, default=8, help='Posting threads')
+    parser.add_argument('--mix', default='text:256=0.6,text:16384=0.3,png:262144=0.1',
+                        help='Payloads as kind:size=weight (kind is text or png)')
+    parser.add_argument('--encodings', default='',
+                        help='Codecs subscribers announce, e.g. zlib')
+    parser.add_argument('--drain', type=float, default=3, help='Seconds to wait for deliveries')
+    parser.add_argument('--connect-timeout', type=float, default=300)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return 0
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Desktop client startup time and clipboard tool lookup overhead.
+
+Run from the repository root:
+
+    python benchmarks/startup_benchmark.py --runs 10
+
+Startup is the wall time of a fresh interpreter importing main_client,
+minus an empty interpreter. Tool lookup compares the old per-call
+``which`` subprocess with the cached ClipboardPlatform._command_exists.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from clipboard_platform import ClipboardPlatform  # noqa: E402
+
+
+def time_interpreter(code: str, runs: int) -> float:
+    """Median wall time in milliseconds of running code in a new interpreter"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def time_call(func, calls: int) -> float:
+    """Mean time in milliseconds of one call"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) * 1000 / calls
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = time_interpreter('pass', args.runs)
+    startup = time_interpreter('import main_client', args.runs)
+    print(f"import main_client: {startup - baseline:8.1f} ms "
+          f"(interpreter alone {baseline:.1f} ms)")
+
+    def which_subprocess():
+        subprocess.run(['which', 'xclip'], stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE, check=False)
+
+    print(f"which subprocess:   {time_call(which_subprocess, 20):8.3f} ms per lookup")
+    print(f"cached lookup:      "
+          f"{time_call(lambda: ClipboardPlatform._command_exists('xclip'), 10000):8.4f} "
+          f"ms per lookup")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""
+Asyncio server mode: an ASGI app built on python-socketio's AsyncServer.
+
+Exposes the same routes and join/clipboard_update events as webapp.py,
+both calling the request logic of clipboard_api, but serves every
+connection from one event loop instead of a thread per client. That logic
+blocks on the database, so it runs in a bounded thread pool and never
+stalls the loop.
+
+Run with an ASGI server, e.g.: uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import socketio
+
+from storage import storage_from_env
+from socket_manager import UserRooms, create_client_manager
+from retention import start_compactor_from_env
+from metrics import (
+    REGISTRY, CONTENT_TYPE, HTTP_REQUEST_SECONDS, SOCKET_CONNECTIONS,
+    record_broadcast, watch_socketio_server
+)
+import clipboard_api
+
+
+# Set SOCKETIO_MESSAGE_QUEUE to share rooms between several server processes
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins='*',
+    client_manager=create_client_manager(
+        os.getenv('SOCKETIO_MESSAGE_QUEUE'), asyncio_server=True
+    )
+)
+
+# MongoDB by default; STORAGE_BACKEND=sqlite uses an embedded database
+db = storage_from_env()
+# Clients announcing compression support get large text compressed
+user_rooms = UserRooms.from_env()
+watch_socketio_server(sio)
+
+# Threads available for blocking database calls
+db_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ASGI_DB_THREADS', '16')),
+    thread_name_prefix='db'
+)
+
+
+# Event loop serving the app, for emits made from the database threads
+event_loop = None
+
+INDEX_PAGE = os.path.join(os.path.dirname(__file__), 'templates', 'index.html')
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database call in the database thread pool"""
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    return await event_loop.run_in_executor(db_executor, lambda: func(*args, **kwargs))
+
+
+async def emit_to_user(event: str, user_id: int, payload: dict) -> None:
+    """Emit an event to every client of a user (see webapp.py)"""
+    record_broadcast(event, payload)
+    for data, rooms in user_rooms.emissions(user_id, payload):
+        await sio.emit(event, data, room=rooms)
+
+
+def emit_from_thread(event: str, user_id: int, payload: dict) -> None:
+    """Emit from a database thread, waiting until the event loop sent it
+
+    This is the ``emit`` of the clipboard_api calls made through run_db.
+    """
+    asyncio.run_coroutine_threadsafe(
+        emit_to_user(event, user_id, payload), event_loop
+    ).result()
+
+
+class HTTPError(Exception):
+    """Error returned to the client as a JSON response"""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    """Minimal view of an ASGI HTTP request"""
+
+    def __init__(self, scope: dict, body: bytes) -> None:
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        self.headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        self.body = body
+
+    @property
+    def mimetype(self) -> str:
+        """Content type of the body, without its parameters"""
+        return self.headers.get('content-type', '').split(';')[0].strip().lower()
+
+    def json(self) -> dict:
+        """Parse the body as a JSON object"""
+        try:
+            data = json.loads(self.body or b'{}')
+        except ValueError:
+            raise HTTPError(400, 'Invalid JSON body')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'Invalid JSON body')
+        return data
+
+    def arg(self, name: str, default=None):
+        """Get a query string argument"""
+        values = self.query.get(name)
+        return values[0] if values else default
+
+
+async def index(request: Request):
+    """Serve the main page"""
+    with open(INDEX_PAGE, 'rb') as page:
+        return 200, page.read(), [(b'content-type', b'text/html; charset=utf-8')]
+
+
+async def login(request: Request):
+    """Login endpoint"""
+    return await run_db(clipboard_api.login, db, request.json())
+
+
+async def register(request: Request):
+    """Register new user endpoint"""
+    return await run_db(clipboard_api.register, db, request.json())
+
+
+async def add_clipboard(request: Request):
+    """Add a new clipboard entry (text or image)"""
+    return await run_db(clipboard_api.add_clip, db, emit_from_thread, request.json())
+
+
+async def add_clipboard_image(request: Request, user_id: int):
+    """Add an image clipboard entry from raw PNG bytes (see webapp.py)"""
+    return await run_db(
+        clipboard_api.add_image, db, emit_from_thread, user_id, request.body,
+        content=request.arg('content'),
+        mime_type=request.mimetype,
+        trace_id=request.arg('trace_id')
+    )
+
+
+async def add_clipboard_batch(request: Request, user_id: int):
+    """Add several clipboard entries in one request (see clipboard_api.add_batch)"""
+    return await run_db(
+        clipboard_api.add_batch, db, emit_from_thread, user_id, request.json()
+    )
+
+
+async def get_clipboard_history(request: Request, user_id: int):
+    """Get clipboard history for a user (see clipboard_api.get_history)"""
+    return await run_db(
+        clipboard_api.get_history, db, user_id,
+        limit=request.arg('limit'),
+        view=request.arg('view'),
+        before=request.arg('before')
+    )
+
+
+async def get_clipboard_entry(request: Request, user_id: int, transaction_id: str):
+    """Get the full payload of a single clipboard entry"""
+    return await run_db(clipboard_api.get_entry, db, user_id, transaction_id)
+
+
+async def get_cache_stats(request: Request):
+    """Get history cache hit/miss counters"""
+    return clipboard_api.cache_stats(db)
+
+
+async def get_blob(request: Request, digest: str):
+    """Stream a stored blob (e.g. an image clip) by its digest"""
+    status, blob = await run_db(clipboard_api.get_blob, db, digest)
+    if status != 200:
+        return status, blob
+
+    # Blobs are content-addressed, so the digest is a strong, permanent ETag
+    etag = f'"{digest}"'
+    headers = [
+        (b'etag', etag.encode('latin-1')),
+        (b'cache-control', b'public, max-age=31536000, immutable'),
+    ]
+    if etag in request.headers.get('if-none-match', ''):
+        return 304, b'', headers
+    mime_type = blob.get('mime_type', 'application/octet-stream')
+    return 200, blob['data'], [(b'content-type', mime_type.encode('latin-1'))] + headers
+
+
+async def get_metrics(request: Request):
+    """Expose metrics in the Prometheus text format"""
+    if not REGISTRY.enabled:
+        return 404, {'success': False, 'message': 'Metrics are disabled'}
+    return 200, REGISTRY.render(), [(b'content-type', CONTENT_TYPE.encode('latin-1'))]
+
+
+# (method, path pattern, handler); a ``user_id`` group is passed as an int,
+# other named groups as strings. Paths matching several patterns go to the
+# first one with the request's method.
+ROUTES = [
+    ('GET', re.compile(r'^/$'), index),
+    ('POST', re.compile(r'^/api/login$'), login),
+    ('POST', re.compile(r'^/api/register$'), register),
+    ('POST', re.compile(r'^/api/clipboard$'), add_clipboard),
+    ('POST', re.compile(r'^/api/clipboard/(?P<user_id>-?\d+)/image$'), add_clipboard_image),
+    ('POST', re.compile(r'^/api/clipboard/(?P<user_id>-?\d+)/batch$'), add_clipboard_batch),
+    ('GET', re.compile(r'^/api/clipboard/(?P<user_id>-?\d+)$'), get_clipboard_history),
+    ('GET', re.compile(r'^/api/clipboard/(?P<user_id>-?\d+)/(?P<transaction_id>[^/]+)$'),
+     get_clipboard_entry),
+    ('GET', re.compile(r'^/api/cache/stats$'), get_cache_stats),
+    ('GET', re.compile(r'^/api/blob/(?P<digest>[^/]+)$'), get_blob),
+    ('GET', re.compile(r'^/metrics$'), get_metrics),
+]
+
+
+async def read_body(receive) -> bytes:
+    """Read the full request body from an ASGI receive channel"""
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def send_response(send, status: int, payload, headers=()) -> None:
+    """Send a response: JSON for a dict payload, bytes or text as they are
+
+    Args:
+        send: ASGI send channel
+        status (int): HTTP status
+        payload: dict, bytes or str body
+        headers: Extra (name, value) byte pairs, with the content type of a
+            non-JSON payload
+    """
+    headers = list(headers)
+    if isinstance(payload, dict):
+        body = json.dumps(payload).encode('utf-8')
+        headers.append((b'content-type', b'application/json'))
+    else:
+        body = payload.encode('utf-8') if isinstance(payload, str) else payload
+    headers.append((b'content-length', str(len(body)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def http_app(scope, receive, send):
+    """ASGI application serving the REST API"""
+    if scope['type'] != 'http':
+        return
+
+    allowed_path = False
+    for method, pattern, handler in ROUTES:
+        match = pattern.match(scope['path'])
+        if not match:
+            continue
+        allowed_path = True
+        if method != scope['method']:
+            continue
+
+        start = time.perf_counter()
+        request = Request(scope, await read_body(receive))
+        params = {
+            name: int(value) if name == 'user_id' else value
+            for name, value in match.groupdict().items()
+        }
+        headers = ()
+        try:
+            status, payload, *extra = await handler(request, **params)
+            if extra:
+                headers = extra[0]
+        except HTTPError as e:
+            status, payload = e.status, {'success': False, 'message': e.message}
+        except Exception as e:
+            status, payload = 500, {'success': False, 'message': str(e)}
+        await send_response(send, status, payload, headers)
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=method, endpoint=handler.__name__, status=status
+        )
+        return
+
+    if allowed_path:
+        await send_response(send, 405, {'success': False, 'message': 'Method not allowed'})
+    else:
+        await send_response(send, 404, {'success': False, 'message': 'Not found'})
+
+
+@sio.event
+async def connect(sid, environ):
+    """Handle client connection"""
+    print('Client connected')
+    SOCKET_CONNECTIONS.inc()
+
+
+@sio.event
+async def disconnect(sid, *args):
+    """Handle client disconnection"""
+    print('Client disconnected')
+    SOCKET_CONNECTIONS.dec()
+
+
+@sio.event
+async def join(sid, data):
+    """Join a room based on user_id, replaying entries missed since ``since``"""
+    user_id = data.get('user_id') if isinstance(data, dict) else None
+    if user_id:
+        # enter_room is a coroutine on recent python-socketio releases only
+        room, encoding = user_rooms.join(user_id, data.get('encodings'))
+        entered = sio.enter_room(sid, room)
+        if inspect.isawaitable(entered):
+            await entered
+        print(f'User {user_id} joined their room')
+        replay = await run_db(clipboard_api.build_replay, db, user_id, data.get('since'))
+        record_broadcast('clipboard_replay', replay)
+        await sio.emit('clipboard_replay', user_rooms.encode(replay, encoding), to=sid)
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    start_compactor_from_env(db)
+    uvicorn.run(app, host='0.0.0.0', port=5000)
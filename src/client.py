@@ -1,27 +1,50 @@
+from __future__ import annotations
+
+import time
 import signal
 import pyperclip
-import pyautogui as pgui
-from pynput.keyboard import Key, Listener, KeyCode
-from clipboard_observer import ClipboardSubject
-from clipboard_platform import get_clipboard
+from typing import TYPE_CHECKING
+from clipboard_observer import ClipboardSubject, ClipDeduplicator
+from clipboard_platform import ClipboardWatcher, get_clipboard
 from clip_object import ClipObject
+from clip_buffer import ClipRingBuffer
+from tracing import TRACER
+
+# pynput and pyautogui are slow to import: they are loaded when the
+# keyboard listener is created and on the first paste, respectively
+if TYPE_CHECKING:
+    from pynput.keyboard import Key, Listener
 
 
 class Client(ClipboardSubject):
     """Client that monitors clipboard and notifies observers of changes"""
 
-    def __init__(self, user_id: int = None) -> None:
+    def __init__(
+        self,
+        user_id: int = None,
+        history_size: int = 100,
+        history_bytes: int = 32 * 1024 * 1024,
+        spill_dir: str = None
+    ) -> None:
         """Initialize the client
 
         Args:
             user_id (int): The ID of the logged-in user
+            history_size (int): Copies and pastes kept in each buffer
+            history_bytes (int): Payload bytes each buffer keeps in memory
+            spill_dir (str): Directory older image payloads are moved to
+                instead of being dropped (optional)
         """
-        super().__init__()
+        # Repeated Ctrl+C and echoes of server updates are not uploaded
+        super().__init__(deduplicator=ClipDeduplicator())
         self.user_id = user_id
         self.pressed_keys: list[Key] = list()
-        self.copied_stuff: list[str] = list()
-        self.pasted_stuff: list[str] = list()
+        self.copied_stuff = ClipRingBuffer(history_size, history_bytes, spill_dir)
+        self.pasted_stuff = ClipRingBuffer(history_size, history_bytes, spill_dir)
         self.clipboard = get_clipboard()  # Get singleton clipboard instance
+        # Set by start_watching; replaces reading the clipboard on Ctrl+C
+        self.watcher: ClipboardWatcher = None
+        from pynput.keyboard import Listener
         self.listener = Listener(
             on_press=self.__on_press,
             on_release=self.__on_release
@@ -34,6 +57,7 @@ class Client(ClipboardSubject):
         Args:
             key (Key): The key that was pressed
         """
+        from pynput.keyboard import Key, KeyCode
         print(f"__on_press - key: {key}")
         if key == Key.ctrl or Key.ctrl in self.get_read_buffer():
             self.pressed_keys.append(key)
@@ -41,21 +65,18 @@ class Client(ClipboardSubject):
                 f"__on_press - read buffer: {self.get_read_buffer()}"
             )
             if KeyCode.from_char('c') in self.get_read_buffer():
+                # The watcher already reports every copy
+                if self.watcher is not None:
+                    return
                 # Get clipboard content (text or image)
+                started = time.time()
                 clip_obj = self.clipboard.get_clipboard_content()
 
                 if clip_obj:
-                    # Store in buffer
-                    self.copied_stuff.append(clip_obj)
-                    print(
-                        f"__on_press - copied {clip_obj.get_content_type()}: "
-                        f"{clip_obj.get_content()[:50] if len(clip_obj.get_content()) > 50 else clip_obj.get_content()}"
-                    )
-
-                    # Notify observers if user is logged in
-                    if self.user_id is not None:
-                        self.notify(self.user_id, clip_obj)
+                    TRACER.begin(clip_obj, started)
+                    self.__on_copy(clip_obj)
             elif KeyCode.from_char('v') in self.get_read_buffer():
+                import pyautogui as pgui
                 if len(self.get_copied_buffer()) != 0:
                     pasting: str = pyperclip.copy(
                         self.get_copied_buffer()[-1]
@@ -77,6 +98,60 @@ class Client(ClipboardSubject):
                         f"{self.pasted_stuff}"
                     )
 
+    def __on_copy(self, clip_obj: ClipObject) -> None:
+        """Store a copied content and notify observers
+
+        Args:
+            clip_obj (ClipObject): The copied content
+        """
+        # Store in buffer
+        self.copied_stuff.append(clip_obj)
+        print(
+            f"__on_copy - copied {clip_obj.get_content_type()}: "
+            f"{clip_obj.get_content()[:50] if len(clip_obj.get_content()) > 50 else clip_obj.get_content()}"
+        )
+
+        # Notify observers if user is logged in
+        if self.user_id is not None:
+            self.notify(self.user_id, clip_obj)
+
+    def start_watching(self) -> ClipboardWatcher:
+        """Report copies from clipboard change events instead of Ctrl+C
+
+        Catches copies made with the mouse or menus too, and no longer
+        reads the clipboard on every key press.
+
+        Returns:
+            ClipboardWatcher: The running watcher
+        """
+        if self.watcher is None:
+            self.watcher = ClipboardWatcher(self.__on_copy, clipboard=self.clipboard)
+            self.watcher.start()
+        return self.watcher
+
+    def remember_remote(self, clip_obj: ClipObject) -> None:
+        """Record a clip received from the server before it is written to
+        the clipboard, so it is neither reported nor uploaded back
+
+        Args:
+            clip_obj (ClipObject): The received clip
+        """
+        self.deduplicator.remember(clip_obj)
+        if self.watcher is not None:
+            self.watcher.remember(clip_obj)
+
+    def stop_watching(self) -> None:
+        """Stop the clipboard watcher"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def close(self) -> None:
+        """Stop the clipboard watcher and delete spilled clip files"""
+        self.stop_watching()
+        self.copied_stuff.clear()
+        self.pasted_stuff.clear()
+
     def __on_release(self, key: Key) -> bool:
         """Handle key release events
 
@@ -86,6 +161,7 @@ class Client(ClipboardSubject):
         Returns:
             bool: False to stop listener, None to continue
         """
+        from pynput.keyboard import Key, KeyCode
         print(f"__on_release - key: {key}")
         if key != KeyCode.from_char('c') or \
            key != KeyCode.from_char('v'):
@@ -115,6 +191,7 @@ class Client(ClipboardSubject):
 
     def start_listening_debug(self) -> None:
         """Start the keyboard listener in debug mode (blocking)"""
+        from pynput.keyboard import Listener
         with Listener(
             on_press=self.__on_press,
             on_release=self.__on_release
@@ -129,19 +206,19 @@ class Client(ClipboardSubject):
         """
         return self.pressed_keys
 
-    def get_copied_buffer(self) -> list[str]:
+    def get_copied_buffer(self) -> ClipRingBuffer:
         """Get the copied content buffer
 
         Returns:
-            list[str]: List of copied content
+            ClipRingBuffer: Bounded list of copied content
         """
         return self.copied_stuff
 
-    def get_pasted_buffer(self) -> list[str]:
+    def get_pasted_buffer(self) -> ClipRingBuffer:
         """Get the pasted content buffer
 
         Returns:
-            list[str]: List of pasted content
+            ClipRingBuffer: Bounded list of pasted content
         """
         return self.pasted_stuff
 
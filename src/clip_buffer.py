@@ -0,0 +1,171 @@
+import os
+import itertools
+import threading
+from collections import deque
+from typing import Optional
+
+from clip_object import ClipObject
+
+# Spill file numbers, shared by the buffers of a process (e.g. the copied
+# and pasted buffers of a client) which may spill to the same directory
+_spill_file_ids = itertools.count()
+
+
+def estimate_item_bytes(item) -> int:
+    """Estimate the memory held by a buffered clip
+
+    Args:
+        item: A ClipObject or a string
+
+    Returns:
+        int: Approximate payload size in bytes
+    """
+    if isinstance(item, ClipObject):
+        size = len(item.get_content() or '')
+        if item._image_bytes is not None:
+            # get_image_data() (e.g. to upload the clip) caches the base64
+            # text next to the bytes: 4 characters per 3 bytes
+            size += len(item._image_bytes) + 4 * ((len(item._image_bytes) + 2) // 3)
+        elif item.image_data:
+            size += len(item.image_data)
+        return size
+    if isinstance(item, (str, bytes)):
+        return len(item)
+    return 0
+
+
+class _SpilledClip:
+    """Image clip whose payload was moved to a file"""
+
+    __slots__ = ('path', 'content')
+
+    def __init__(self, path: str, content: str) -> None:
+        self.path = path
+        self.content = content
+
+    def load(self) -> ClipObject:
+        """Read the clip back from its file"""
+        with open(self.path, 'rb') as f:
+            clip_obj = ClipObject.from_image_bytes(f.read())
+        clip_obj.content = self.content
+        return clip_obj
+
+
+class ClipRingBuffer:
+    """Bounded, list-like history of clips
+
+    Keeps at most ``max_items`` entries and ``max_bytes`` of payload in
+    memory. Over the byte limit, older image payloads are written to
+    ``spill_dir`` when one is given; otherwise (or if that is not enough)
+    the oldest entries are dropped. The newest entry always stays in memory.
+    """
+
+    def __init__(
+        self,
+        max_items: int = 100,
+        max_bytes: int = 32 * 1024 * 1024,
+        spill_dir: Optional[str] = None
+    ) -> None:
+        """Initialize the buffer
+
+        Args:
+            max_items (int): Maximum number of entries
+            max_bytes (int): Maximum payload bytes held in memory
+            spill_dir (Optional[str]): Directory for spilled image payloads
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        self._items: deque = deque()
+        # In-memory size of each entry (0 once spilled)
+        self._sizes: deque = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def append(self, item) -> None:
+        """Add an entry, evicting or spilling older ones if needed
+
+        Args:
+            item: A ClipObject or a string
+        """
+        with self._lock:
+            size = estimate_item_bytes(item)
+            self._items.append(item)
+            self._sizes.append(size)
+            self._bytes += size
+
+            while len(self._items) > self.max_items:
+                self._drop_oldest()
+            if self._bytes > self.max_bytes and self.spill_dir:
+                self._spill_older()
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                self._drop_oldest()
+
+    def clear(self) -> None:
+        """Remove every entry and its spilled file"""
+        with self._lock:
+            while self._items:
+                self._drop_oldest()
+
+    @property
+    def memory_bytes(self) -> int:
+        """Payload bytes currently held in memory"""
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):
+        with self._lock:
+            if isinstance(index, slice):
+                entries = list(self._items)[index]
+            else:
+                entries = [self._items[index]]
+        loaded = [
+            entry.load() if isinstance(entry, _SpilledClip) else entry
+            for entry in entries
+        ]
+        return loaded if isinstance(index, slice) else loaded[0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __repr__(self) -> str:
+        return f"ClipRingBuffer({len(self)} items, {self._bytes} bytes in memory)"
+
+    def _spill_older(self) -> None:
+        """Move image payloads, oldest first, to disk (caller holds the lock)"""
+        for index in range(len(self._items) - 1):
+            if self._bytes <= self.max_bytes:
+                return
+            entry = self._items[index]
+            if not (isinstance(entry, ClipObject) and entry.is_image()):
+                continue
+            image_bytes = entry.get_image_bytes()
+            if not image_bytes:
+                continue
+            path = os.path.join(
+                self.spill_dir, f"clip-{os.getpid()}-{next(_spill_file_ids)}.png"
+            )
+            try:
+                with open(path, 'wb') as f:
+                    f.write(image_bytes)
+            except OSError as e:
+                print(f"Error spilling clip to disk: {e}")
+                return
+            self._items[index] = _SpilledClip(path, entry.get_content())
+            self._bytes -= self._sizes[index]
+            self._sizes[index] = 0
+
+    def _drop_oldest(self) -> None:
+        """Remove the oldest entry (caller holds the lock)"""
+        entry = self._items.popleft()
+        self._bytes -= self._sizes.popleft()
+        if isinstance(entry, _SpilledClip):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
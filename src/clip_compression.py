@@ -0,0 +1,223 @@
+"""
+Transparent compression of large text clips.
+
+Used for stored transactions (MongoCRUD.enable_compression) and for
+Socket.IO payloads sent to clients that announced they can decode them.
+zlib is always available; zstd needs Python 3.14+ or the ``zstandard``
+package (``pip install -e ".[zstd]"``).
+
+A compressed text is sent or stored as bytes next to a
+``content_encoding`` field naming the codec; text without that field is
+plain.
+"""
+import zlib
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple, Union
+
+# Texts shorter than this many bytes are never compressed
+DEFAULT_THRESHOLD = 1024
+
+# Compression is skipped unless it saves at least this fraction
+MIN_SAVING = 0.1
+
+DEFAULT_LEVELS = {'zlib': 6, 'zstd': 3}
+
+
+@lru_cache(maxsize=None)
+def _load_zstd():
+    """Import a zstd implementation on first use
+
+    Returns:
+        (compress, decompress) functions, or None if zstd is unavailable
+    """
+    try:
+        from compression import zstd
+        return (
+            lambda data, level: zstd.compress(data, level=level),
+            zstd.decompress
+        )
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return (
+        lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data)
+    )
+
+
+def available_encodings() -> List[str]:
+    """Get the encodings this process can compress and decompress
+
+    Returns:
+        List[str]: Encoding names, preferred first
+    """
+    encodings = ['zlib']
+    if _load_zstd() is not None:
+        encodings.insert(0, 'zstd')
+    return encodings
+
+
+def negotiate(accepted: Optional[Iterable[str]]) -> Optional[str]:
+    """Pick the encoding used for a peer
+
+    Args:
+        accepted (Optional[Iterable[str]]): Encodings the peer can decode,
+            preferred first
+
+    Returns:
+        Optional[str]: First accepted encoding available here, or None
+    """
+    if not isinstance(accepted, (list, tuple)):
+        return None
+    supported = available_encodings()
+    for encoding in accepted:
+        if encoding in supported:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress bytes
+
+    Args:
+        data (bytes): Raw data
+        encoding (str): 'zlib' or 'zstd'
+        level (Optional[int]): Compression level (codec default when None)
+
+    Raises:
+        ValueError: If the encoding is not available
+
+    Returns:
+        bytes: Compressed data
+    """
+    if level is None:
+        level = DEFAULT_LEVELS.get(encoding, 0)
+    if encoding == 'zlib':
+        return zlib.compress(data, level)
+    if encoding == 'zstd' and _load_zstd() is not None:
+        return _load_zstd()[0](data, level)
+    raise ValueError(f"Unsupported content encoding: {encoding!r}")
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """Decompress bytes produced by compress()
+
+    Args:
+        data (bytes): Compressed data
+        encoding (str): 'zlib' or 'zstd'
+
+    Raises:
+        ValueError: If the encoding is not available
+
+    Returns:
+        bytes: Raw data
+    """
+    if encoding == 'zlib':
+        return zlib.decompress(data)
+    if encoding == 'zstd' and _load_zstd() is not None:
+        return _load_zstd()[1](data)
+    raise ValueError(f"Unsupported content encoding: {encoding!r}")
+
+
+def compress_text(
+    text: str,
+    encoding: str,
+    threshold: int = DEFAULT_THRESHOLD,
+    level: Optional[int] = None
+) -> Tuple[Union[str, bytes], Optional[str]]:
+    """Compress a text if it is large enough and compresses well
+
+    Args:
+        text (str): The text
+        encoding (str): 'zlib' or 'zstd'
+        threshold (int): Minimum UTF-8 size in bytes worth compressing
+        level (Optional[int]): Compression level
+
+    Returns:
+        Tuple[Union[str, bytes], Optional[str]]: (compressed bytes,
+            encoding), or (text, None) when it is left as is
+    """
+    raw = text.encode('utf-8')
+    if len(raw) < threshold:
+        return text, None
+    compressed = compress(raw, encoding, level)
+    if len(compressed) > len(raw) * (1 - MIN_SAVING):
+        # Text with little redundancy is not worth decompressing later
+        return text, None
+    return compressed, encoding
+
+
+def decompress_text(content: Union[str, bytes], encoding: Optional[str]) -> str:
+    """Reverse compress_text
+
+    Args:
+        content (Union[str, bytes]): Stored or received content
+        encoding (Optional[str]): Its content_encoding (None for plain text)
+
+    Returns:
+        str: The text
+    """
+    if encoding is None:
+        return content
+    return decompress(bytes(content), encoding).decode('utf-8')
+
+
+def encode_event(
+    payload: dict,
+    encoding: Optional[str],
+    threshold: int = DEFAULT_THRESHOLD
+) -> dict:
+    """Compress the text of a clipboard event for a client
+
+    Handles single entries (clipboard_update) and payloads with an
+    ``entries`` list (clipboard_replay, clipboard_batch).
+
+    Args:
+        payload (dict): The plain event payload
+        encoding (Optional[str]): Encoding negotiated with the client
+        threshold (int): Minimum text size in bytes worth compressing
+
+    Returns:
+        dict: The payload itself if nothing was compressed, or a copy
+    """
+    if encoding is None:
+        return payload
+    encoded = _encode_entry(payload, encoding, threshold)
+    entries = payload.get('entries')
+    if entries:
+        encoded_entries = [_encode_entry(entry, encoding, threshold) for entry in entries]
+        if any(new is not old for new, old in zip(encoded_entries, entries)):
+            if encoded is payload:
+                encoded = dict(payload)
+            encoded['entries'] = encoded_entries
+    return encoded
+
+
+def decode_event(payload: dict) -> dict:
+    """Reverse encode_event on a received payload (modified in place)
+
+    Args:
+        payload (dict): The received event payload
+
+    Returns:
+        dict: The payload with plain text content
+    """
+    for entry in [payload] + list(payload.get('entries') or []):
+        encoding = entry.pop('content_encoding', None)
+        if encoding is not None:
+            entry['content'] = decompress_text(entry['content'], encoding)
+    return payload
+
+
+def _encode_entry(entry: dict, encoding: str, threshold: int) -> dict:
+    """Compress the content of one entry, returning it unchanged if not worth it"""
+    content = entry.get('content')
+    if entry.get('content_type', 'text') != 'text' or not isinstance(content, str):
+        return entry
+    compressed, used = compress_text(content, encoding, threshold)
+    if used is None:
+        return entry
+    return dict(entry, content=compressed, content_encoding=used)
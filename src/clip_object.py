@@ -1,4 +1,5 @@
 import base64
+import hashlib
 from typing import Optional
 
 
@@ -9,7 +10,8 @@ class ClipObject:
         self,
         content: str,
         content_type: str = "text",
-        image_data: Optional[str] = None
+        image_data: Optional[str] = None,
+        trace_id: Optional[str] = None
     ) -> None:
         """Initialize a clipboard object
 
@@ -17,10 +19,18 @@ class ClipObject:
             content (str): Text content or image description
             content_type (str): Either "text" or "image"
             image_data (str): Base64 encoded image data (if content_type is "image")
+            trace_id (Optional[str]): Trace id given at capture when tracing
+                is enabled (see tracing.py)
         """
         self.content = content
         self.content_type = content_type
         self.image_data = image_data
+        self.trace_id = trace_id
+        # Raw image bytes, kept when the clip was captured as bytes so
+        # binary uploads never go through base64
+        self._image_bytes: Optional[bytes] = None
+        # Computed on first use by get_content_hash
+        self._content_hash: Optional[str] = None
 
     def to_json(self) -> dict:
         """Convert to JSON-serializable dict
@@ -28,11 +38,14 @@ class ClipObject:
         Returns:
             dict: Dictionary representation
         """
-        return {
+        data = {
             "content": self.content,
             "content_type": self.content_type,
-            "image_data": self.image_data
+            "image_data": self.get_image_data()
         }
+        if self.trace_id is not None:
+            data["trace_id"] = self.trace_id
+        return data
 
     def get_content(self) -> str:
         """Get the text content
@@ -56,8 +69,28 @@ class ClipObject:
         Returns:
             Optional[str]: Base64 encoded image or None
         """
+        if self.image_data is None and self._image_bytes is not None:
+            self.image_data = base64.b64encode(self._image_bytes).decode('utf-8')
         return self.image_data
 
+    def get_content_hash(self) -> str:
+        """Get a SHA-256 digest identifying the clip's type and payload
+
+        Computed once: the clip must not be modified afterwards.
+
+        Returns:
+            str: Hex digest
+        """
+        if self._content_hash is None:
+            if self.is_image():
+                payload = self.get_image_bytes() or b''
+            else:
+                payload = (self.content or '').encode('utf-8')
+            digest = hashlib.sha256(self.content_type.encode('utf-8') + b'\0')
+            digest.update(payload)
+            self._content_hash = digest.hexdigest()
+        return self._content_hash
+
     def is_image(self) -> bool:
         """Check if this is an image clip
 
@@ -77,12 +110,12 @@ class ClipObject:
         Returns:
             ClipObject: New clipboard object with image
         """
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-        return ClipObject(
+        clip_obj = ClipObject(
             content=f"Image ({image_format})",
-            content_type="image",
-            image_data=image_b64
+            content_type="image"
         )
+        clip_obj._image_bytes = image_bytes
+        return clip_obj
 
     def get_image_bytes(self) -> Optional[bytes]:
         """Get the image as bytes
@@ -90,6 +123,8 @@ class ClipObject:
         Returns:
             Optional[bytes]: Decoded image bytes or None
         """
+        if self._image_bytes is not None:
+            return self._image_bytes
         if self.image_data:
             return base64.b64decode(self.image_data)
         return None
@@ -0,0 +1,361 @@
+"""
+Request logic shared by the Flask (webapp.py) and ASGI (asgi_app.py) servers.
+
+Each function takes the storage and, when it broadcasts, an ``emit``
+callable ``emit(event, user_id, payload)`` sending an event to every client
+of a user. They return ``(status, payload)`` with a JSON-serializable
+payload, and the front ends only turn requests into arguments and results
+into responses. The functions block on the database: the ASGI server runs
+them in its database thread pool.
+"""
+import re
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+from storage import BATCH_LIMIT, REPLAY_LIMIT, make_history_cursor
+from serializers import (
+    serialize_transaction, serialize_transaction_metadata, parse_clip_batch
+)
+from clip_user import ClipUser
+from clip_object import ClipObject
+from metrics import record_ingest
+from tracing import TRACER, clean_trace_id
+
+BLOB_DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Default and largest number of history entries per page
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_LIMIT = 200
+
+Result = Tuple[int, dict]
+Emit = Callable[[str, int, dict], None]
+
+
+def _error(status: int, message: str) -> Result:
+    return status, {'success': False, 'message': message}
+
+
+def login(db, data) -> Result:
+    """Check credentials
+
+    Args:
+        db (ClipboardStorage): The storage
+        data: Decoded JSON body with username and password
+    """
+    if not isinstance(data, dict):
+        return _error(400, 'Invalid JSON body')
+    user = db.get_user(data.get('username'), data.get('password'))
+    if user:
+        return 200, {
+            'success': True,
+            'user_id': user.get_id(),
+            'username': user.get_username()
+        }
+    return _error(401, 'Invalid credentials')
+
+
+def register(db, data) -> Result:
+    """Create a user
+
+    Args:
+        db (ClipboardStorage): The storage
+        data: Decoded JSON body with username, password and email
+    """
+    if not isinstance(data, dict):
+        return _error(400, 'Invalid JSON body')
+    try:
+        user = ClipUser(data.get('username'), data.get('password'), data.get('email'))
+        db.insert_user(user)
+    except Exception as e:
+        return _error(400, str(e))
+    return 200, {
+        'success': True,
+        'user_id': user.get_id(),
+        'username': user.get_username()
+    }
+
+
+def add_clip(db, emit: Emit, data) -> Result:
+    """Broadcast and store a clip posted as JSON (text or base64 image)
+
+    Args:
+        db (ClipboardStorage): The storage
+        emit (Emit): Sends an event to every client of a user
+        data: Decoded JSON body (user_id, content, content_type,
+            image_data, trace_id)
+    """
+    if not isinstance(data, dict):
+        return _error(400, 'Invalid JSON body')
+    user_id = data.get('user_id')
+    content = data.get('content')
+    content_type = data.get('content_type', 'text')
+    image_data = data.get('image_data')
+    trace_id = clean_trace_id(data.get('trace_id'))
+
+    if not user_id or not content:
+        return _error(400, 'Missing user_id or content')
+
+    try:
+        clip_obj = ClipObject(
+            content=content,
+            content_type=content_type,
+            image_data=image_data,
+            trace_id=trace_id
+        )
+        record_ingest(content_type, len(content) + len(image_data or ''))
+
+        # Notify all connected clients for this user first, so the broadcast
+        # does not wait on the database acknowledgement
+        seq = db.next_sequence(user_id)
+        with TRACER.span('server.emit', trace_id, seq=seq):
+            emit('clipboard_update', user_id, {
+                'user_id': user_id,
+                'seq': seq,
+                'content': content,
+                'content_type': content_type,
+                'image_data': image_data,
+                'timestamp': datetime.now().isoformat(),
+                'trace_id': trace_id
+            })
+
+        with TRACER.span('server.store', trace_id):
+            db.insert_transaction(user_id, clip_obj, seq=seq)
+    except Exception as e:
+        return _error(500, str(e))
+    return 200, {'success': True}
+
+
+def add_image(db, emit: Emit, user_id: int, image_bytes: bytes,
+              content: Optional[str] = None, mime_type: Optional[str] = None,
+              trace_id: Optional[str] = None) -> Result:
+    """Store and broadcast an image clip uploaded as raw bytes
+
+    Receivers get the digest and fetch the bytes from the blob route.
+
+    Args:
+        db (ClipboardStorage): The storage
+        emit (Emit): Sends an event to every client of a user
+        user_id (int): The user's ID
+        image_bytes (bytes): The request body
+        content (Optional[str]): Image description
+        mime_type (Optional[str]): Content type of the body
+        trace_id (Optional[str]): Trace id from the query string
+    """
+    content = content or 'Image (PNG)'
+    trace_id = clean_trace_id(trace_id)
+    if not mime_type or not mime_type.startswith('image/'):
+        mime_type = 'image/png'
+    if not image_bytes:
+        return _error(400, 'Missing image data')
+
+    try:
+        record_ingest('image', len(image_bytes))
+        with TRACER.span('server.blob', trace_id):
+            image_digest = db.insert_blob(image_bytes, mime_type)
+        # Wraps the raw bytes without base64 encoding them
+        clip_obj = ClipObject.from_image_bytes(image_bytes)
+        clip_obj.content = content
+        clip_obj.trace_id = trace_id
+
+        # The blob is stored above; the transaction is written after the
+        # broadcast
+        seq = db.next_sequence(user_id)
+        with TRACER.span('server.emit', trace_id, seq=seq):
+            emit('clipboard_update', user_id, {
+                'user_id': user_id,
+                'seq': seq,
+                'content': content,
+                'content_type': 'image',
+                'image_digest': image_digest,
+                'timestamp': datetime.now().isoformat(),
+                'trace_id': trace_id
+            })
+
+        with TRACER.span('server.store', trace_id):
+            db.insert_transaction(user_id, clip_obj, image_digest=image_digest, seq=seq)
+    except Exception as e:
+        return _error(500, str(e))
+    return 200, {'success': True, 'image_digest': image_digest}
+
+
+def add_batch(db, emit: Emit, user_id: int, data) -> Result:
+    """Store several clips with one insert and announce them in one event
+
+    The body is ``{"clips": [...]}`` with clips shaped like the body of
+    ``POST /api/clipboard``, oldest first. They are announced with a single
+    ``clipboard_batch`` event (same shape as ``clipboard_replay``).
+
+    Args:
+        db (ClipboardStorage): The storage
+        emit (Emit): Sends an event to every client of a user
+        user_id (int): The user's ID
+        data: Decoded JSON body
+    """
+    try:
+        clip_objs = parse_clip_batch(data, BATCH_LIMIT)
+    except ValueError as e:
+        return _error(400, str(e))
+
+    try:
+        for clip_obj in clip_objs:
+            record_ingest(
+                clip_obj.get_content_type(),
+                len(clip_obj.get_content()) + len(clip_obj.image_data or '')
+            )
+        trace_ids = [clip_obj.trace_id for clip_obj in clip_objs]
+        with TRACER.span('server.store', trace_ids, batch_size=len(clip_objs)):
+            transactions = db.insert_transactions(user_id, clip_objs)
+        with TRACER.span('server.emit', trace_ids, batch_size=len(clip_objs)):
+            emit('clipboard_batch', user_id, {
+                'user_id': user_id,
+                'entries': [serialize_transaction(trans) for trans in transactions],
+                'seq': transactions[-1]['seq'],
+                'truncated': False
+            })
+    except Exception as e:
+        return _error(500, str(e))
+    return 200, {
+        'success': True,
+        'count': len(transactions),
+        'first_seq': transactions[0]['seq'],
+        'last_seq': transactions[-1]['seq']
+    }
+
+
+def get_history(db, user_id: int, limit=None, view: Optional[str] = None,
+                before: Optional[str] = None) -> Result:
+    """Get a page of a user's history, newest first
+
+    ``view=metadata`` returns lightweight rows (no full text, no image
+    data); payloads are then fetched per item. Pages are chained by passing
+    the returned ``next_cursor`` as ``before``.
+
+    Args:
+        db (ClipboardStorage): The storage
+        user_id (int): The user's ID
+        limit: Page size from the query string, clamped to
+            1..HISTORY_PAGE_LIMIT
+        view (Optional[str]): 'metadata' for lightweight rows
+        before (Optional[str]): Cursor of the previous page
+    """
+    try:
+        limit = int(limit) if limit is not None else HISTORY_PAGE_SIZE
+    except ValueError:
+        limit = HISTORY_PAGE_SIZE
+    # A limit of 0 means no limit to MongoDB: never pass it through
+    limit = min(max(limit, 1), HISTORY_PAGE_LIMIT)
+    metadata_only = view == 'metadata'
+
+    try:
+        transactions = db.get_n_last_user_transaction(
+            user_id, limit, metadata_only=metadata_only, before=before
+        )
+    except ValueError as e:
+        return _error(400, str(e))
+    except Exception as e:
+        return _error(500, str(e))
+
+    serialize = serialize_transaction_metadata if metadata_only \
+        else serialize_transaction
+    # A full page means there may be older entries left
+    next_cursor = None
+    if transactions and len(transactions) == limit and '_id' in transactions[-1]:
+        next_cursor = make_history_cursor(transactions[-1])
+
+    return 200, {
+        'success': True,
+        'history': [serialize(trans) for trans in transactions],
+        'next_cursor': next_cursor
+    }
+
+
+def get_entry(db, user_id: int, transaction_id: str) -> Result:
+    """Get the full payload of a single history entry
+
+    Args:
+        db (ClipboardStorage): The storage
+        user_id (int): The user's ID
+        transaction_id (str): The entry's ID
+    """
+    try:
+        trans = db.get_user_transaction(user_id, transaction_id)
+    except Exception as e:
+        return _error(500, str(e))
+
+    if trans is None:
+        return _error(404, 'Entry not found')
+    return 200, {'success': True, 'entry': serialize_transaction(trans)}
+
+
+def cache_stats(db) -> Result:
+    """Get history cache hit/miss counters
+
+    Args:
+        db (ClipboardStorage): The storage
+    """
+    history_cache = getattr(db, 'history_cache', None)
+    if history_cache is None:
+        return 200, {'success': True, 'enabled': False}
+    return 200, {
+        'success': True,
+        'enabled': True,
+        'history_cache': history_cache.stats()
+    }
+
+
+def get_blob(db, digest: str) -> Result:
+    """Get a stored blob (e.g. an image clip) by its digest
+
+    Args:
+        db (ClipboardStorage): The storage
+        digest (str): SHA-256 hex digest
+
+    Returns:
+        Result: On success the payload is the blob document (``data`` and
+            ``mime_type``), which the front end streams as is
+    """
+    if not BLOB_DIGEST_PATTERN.match(digest):
+        return _error(400, 'Invalid digest')
+
+    try:
+        blob = db.get_blob(digest)
+    except Exception as e:
+        return _error(500, str(e))
+
+    if blob is None:
+        return _error(404, 'Blob not found')
+    return 200, blob
+
+
+def build_replay(db, user_id: int, since) -> dict:
+    """Build the ``clipboard_replay`` payload for a joining client
+
+    Args:
+        db (ClipboardStorage): The storage
+        user_id (int): The user's ID
+        since: Last sequence number seen by the client, or None
+
+    The returned sequence number is the one of the last stored entry the
+    client now has, never the counter: clips are announced before they are
+    stored, so the counter can be ahead of the stored entries, and resuming
+    from it would skip the clips still being written.
+
+    Returns:
+        dict: Missed entries (oldest first), the sequence number to resume
+            from and whether entries were left out
+    """
+    if not isinstance(since, int):
+        seq = db.get_last_stored_sequence(user_id)
+        return {'user_id': user_id, 'entries': [], 'seq': seq, 'truncated': False}
+    if since >= db.get_last_sequence(user_id):
+        # Nothing was reserved after ``since``: skip the replay query
+        return {'user_id': user_id, 'entries': [], 'seq': since, 'truncated': False}
+
+    transactions = db.get_transactions_since(user_id, since, limit=REPLAY_LIMIT)
+    return {
+        'user_id': user_id,
+        'entries': [serialize_transaction(trans) for trans in transactions],
+        # The client resumes after the last replayed entry
+        'seq': transactions[-1]['seq'] if transactions else since,
+        'truncated': len(transactions) == REPLAY_LIMIT
+    }
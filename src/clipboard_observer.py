@@ -1,5 +1,15 @@
+import time
+import threading
 from abc import ABC, abstractmethod
-from typing import List, TYPE_CHECKING
+from collections import OrderedDict
+from typing import List, Optional, TYPE_CHECKING
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from outbox import ClipOutbox
+from tracing import TRACER
+from upload_queue import UploadError, UploadQueue
 
 if TYPE_CHECKING:
     from clip_object import ClipObject
@@ -19,11 +29,122 @@ class ClipboardObserver(ABC):
         pass
 
 
+class ClipDeduplicator:
+    """Filters out clips whose content does not need to be uploaded
+
+    A clip is dropped when its content hash matches the last known clip
+    (being sent, sent, or written locally from a server update) or a clip
+    seen less than ``window`` seconds ago.
+
+    A clip that passes stays pending until its upload is reported:
+    confirm() records it once the server accepted it, forget() drops it
+    when the upload failed, so copying the same content again retries it.
+    """
+
+    def __init__(self, window: float = 2.0, max_recent: int = 64) -> None:
+        """Initialize the deduplicator
+
+        Args:
+            window (float): Seconds during which a repeated clip is dropped
+            max_recent (int): Number of recent content hashes remembered
+        """
+        self.window = window
+        self.max_recent = max_recent
+        self._last_hash: Optional[str] = None
+        # Hashes known to the server, and hashes whose upload is not reported
+        self._recent: 'OrderedDict[str, float]' = OrderedDict()
+        self._pending: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.passed = 0
+        self.suppressed = 0
+
+    def should_send(self, clip_obj: 'ClipObject') -> bool:
+        """Decide whether a clip must be sent, keeping it pending if so
+
+        Args:
+            clip_obj (ClipObject): The copied clip
+
+        Returns:
+            bool: False for duplicates and echoes
+        """
+        content_hash = clip_obj.get_content_hash()
+        now = time.monotonic()
+        with self._lock:
+            seen = [
+                seen_at for seen_at in (
+                    self._recent.get(content_hash), self._pending.get(content_hash)
+                ) if seen_at is not None
+            ]
+            if content_hash == self._last_hash or \
+                    any(now - seen_at < self.window for seen_at in seen):
+                self.suppressed += 1
+                return False
+            self._last_hash = content_hash
+            self._touch(self._pending, content_hash, now)
+            self.passed += 1
+            return True
+
+    def confirm(self, clip_obj: 'ClipObject') -> None:
+        """Record a clip the server accepted
+
+        Args:
+            clip_obj (ClipObject): The uploaded clip
+        """
+        content_hash = clip_obj.get_content_hash()
+        with self._lock:
+            copied_at = self._pending.pop(content_hash, None)
+            self._touch(
+                self._recent, content_hash,
+                time.monotonic() if copied_at is None else copied_at
+            )
+
+    def forget(self, clip_obj: 'ClipObject') -> None:
+        """Drop a clip whose upload failed, so copying it again sends it
+
+        Args:
+            clip_obj (ClipObject): The clip given up on
+        """
+        content_hash = clip_obj.get_content_hash()
+        with self._lock:
+            self._pending.pop(content_hash, None)
+            if self._last_hash == content_hash:
+                self._last_hash = None
+
+    def remember(self, clip_obj: 'ClipObject') -> None:
+        """Record a clip that is already known to the server
+
+        Called with server updates before they are written to the local
+        clipboard, so copying them back is not uploaded again.
+
+        Args:
+            clip_obj (ClipObject): The received clip
+        """
+        content_hash = clip_obj.get_content_hash()
+        with self._lock:
+            self._last_hash = content_hash
+            self._touch(self._recent, content_hash, time.monotonic())
+
+    def _touch(self, hashes: 'OrderedDict[str, float]', content_hash: str, now: float) -> None:
+        """Store a hash as the newest of hashes (caller holds the lock)"""
+        hashes[content_hash] = now
+        hashes.move_to_end(content_hash)
+        while len(hashes) > self.max_recent:
+            hashes.popitem(last=False)
+
+
 class ClipboardSubject:
     """Subject that notifies observers of clipboard changes"""
 
-    def __init__(self):
+    def __init__(self, deduplicator: Optional[ClipDeduplicator] = None):
+        """Initialize the subject
+
+        Args:
+            deduplicator (Optional[ClipDeduplicator]): Drops duplicate clips
+                before observers are notified
+        """
         self._observers: List[ClipboardObserver] = []
+        self.deduplicator = deduplicator
 
     def attach(self, observer: ClipboardObserver) -> None:
         """Attach an observer
@@ -50,47 +171,166 @@ class ClipboardSubject:
             user_id (int): The user ID who made the change
             clip_obj (ClipObject): The clipboard object (text or image)
         """
+        if self.deduplicator is not None and \
+                not self.deduplicator.should_send(clip_obj):
+            return
         for observer in self._observers:
             observer.update(user_id, clip_obj)
 
 
 class ServerClipboardObserver(ClipboardObserver):
-    """Observer that sends clipboard updates to the server"""
+    """Observer that sends clipboard updates to the server
 
-    def __init__(self, server_url: str):
+    Uploads run on a background UploadQueue over a keep-alive session,
+    so update() returns immediately even when the server is slow.
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        max_queue: int = 100,
+        max_retries: int = 5,
+        timeout: float = 10.0,
+        outbox_path: Optional[str] = None,
+        deduplicator: Optional[ClipDeduplicator] = None
+    ):
         """Initialize the server observer
 
         Args:
             server_url (str): The URL of the server API
+            max_queue (int): Clips waiting for upload before the oldest
+                are superseded
+            max_retries (int): Retries of a failed upload
+            timeout (float): Request timeout in seconds
+            outbox_path (Optional[str]): SQLite file keeping clips until the
+                server acknowledges them, so nothing copied while offline
+                is lost (in-memory queue when None)
+            deduplicator (Optional[ClipDeduplicator]): Told which uploads
+                succeeded and which were given up
         """
         self.server_url = server_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.outbox = ClipOutbox(outbox_path) if outbox_path else None
+        self.deduplicator = deduplicator
+        self.queue = UploadQueue(
+            self.send,
+            max_size=max_queue,
+            max_retries=max_retries,
+            store=self.outbox,
+            send_batch=self.send_batch,
+            on_sent=self._uploaded,
+            on_give_up=self._given_up
+        )
 
     def update(self, user_id: int, clip_obj: 'ClipObject') -> None:
-        """Send clipboard update to server
+        """Queue a clipboard update for upload
 
         Args:
             user_id (int): The user ID who made the change
             clip_obj (ClipObject): The clipboard object (text or image)
         """
-        import requests
+        with TRACER.span('client.enqueue', clip_obj.trace_id):
+            self.queue.put(user_id, clip_obj)
+
+    def send(self, user_id: int, clip_obj: 'ClipObject') -> None:
+        """Send a clipboard update to the server
+
+        Args:
+            user_id (int): The user ID who made the change
+            clip_obj (ClipObject): The clipboard object (text or image)
+
+        Raises:
+            UploadError: If the upload failed
+        """
+        trace = {"trace_id": clip_obj.trace_id} if clip_obj.trace_id else {}
         try:
-            # Send clipboard data to server
-            payload = {
-                "user_id": user_id,
-                "content": clip_obj.get_content(),
-                "content_type": clip_obj.get_content_type(),
-                "image_data": clip_obj.get_image_data()
-            }
-
-            response = requests.post(
-                f"{self.server_url}/api/clipboard",
-                json=payload
-            )
+            with TRACER.span('client.upload', clip_obj.trace_id):
+                if clip_obj.is_image():
+                    # Images go up as raw PNG bytes instead of base64 in JSON
+                    response = self.session.post(
+                        f"{self.server_url}/api/clipboard/{user_id}/image",
+                        params={"content": clip_obj.get_content(), **trace},
+                        data=clip_obj.get_image_bytes(),
+                        headers={"Content-Type": "image/png"},
+                        timeout=self.timeout
+                    )
+                else:
+                    # Send clipboard data to server
+                    payload = {
+                        "user_id": user_id,
+                        "content": clip_obj.get_content(),
+                        "content_type": clip_obj.get_content_type(),
+                        **trace
+                    }
+
+                    response = self.session.post(
+                        f"{self.server_url}/api/clipboard",
+                        json=payload,
+                        timeout=self.timeout
+                    )
+        except requests.RequestException as e:
+            raise UploadError(str(e)) from e
+
+        self._check_response(response, f"Clipboard {clip_obj.get_content_type()}")
 
-            if response.status_code == 200:
-                content_type = clip_obj.get_content_type()
-                print(f"Clipboard {content_type} sent to server successfully")
-            else:
-                print(f"Failed to send clipboard: {response.status_code}")
-        except Exception as e:
-            print(f"Error sending clipboard to server: {e}")
+    def send_batch(self, user_id: int, clips: List['ClipObject']) -> None:
+        """Send several clipboard updates to the server in one request
+
+        Used by the upload queue when clips piled up, e.g. in the outbox
+        while the server was unreachable.
+
+        Args:
+            user_id (int): The user ID who made the changes
+            clips (List[ClipObject]): The clips, oldest first
+
+        Raises:
+            UploadError: If the upload failed
+        """
+        trace_ids = [clip_obj.trace_id for clip_obj in clips]
+        try:
+            with TRACER.span('client.upload', trace_ids, batch_size=len(clips)):
+                response = self.session.post(
+                    f"{self.server_url}/api/clipboard/{user_id}/batch",
+                    json={"clips": [clip_obj.to_json() for clip_obj in clips]},
+                    timeout=self.timeout
+                )
+        except requests.RequestException as e:
+            raise UploadError(str(e)) from e
+
+        self._check_response(response, f"Batch of {len(clips)} clips")
+
+    def _uploaded(self, user_id: int, clip_obj: 'ClipObject') -> None:
+        """Tell the deduplicator the server accepted a clip"""
+        if self.deduplicator is not None:
+            self.deduplicator.confirm(clip_obj)
+
+    def _given_up(self, user_id: int, clip_obj: 'ClipObject') -> None:
+        """Tell the deduplicator a clip was dropped without being uploaded"""
+        if self.deduplicator is not None:
+            self.deduplicator.forget(clip_obj)
+
+    def _check_response(self, response: requests.Response, what: str) -> None:
+        """Raise an UploadError unless the server accepted the upload"""
+        if response.status_code == 200:
+            print(f"{what} sent to server successfully")
+            return
+        # Server errors and rate limiting are worth retrying, rejections are not
+        retryable = response.status_code >= 500 or response.status_code == 429
+        raise UploadError(
+            f"Failed to send clipboard: {response.status_code}", retryable=retryable
+        )
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Upload what is still queued (waiting at most timeout seconds)
+
+        Args:
+            timeout (float): Longest wait in seconds
+        """
+        stopped = self.queue.close(timeout)
+        self.session.close()
+        if self.outbox is not None and stopped:
+            self.outbox.close()
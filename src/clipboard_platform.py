@@ -6,22 +6,211 @@ supporting both text and image content.
 """
 import io
 import sys
+import time
+import select
+import shutil
+import functools
 import platform
+import threading
 import subprocess
 import tempfile
 import os
-from typing import Optional
+from typing import Callable, Optional
 from pathlib import Path
 
 import pyperclip
-from PIL import Image
-
-try:
-    from PIL import ImageGrab
-except ImportError:
-    ImageGrab = None
 
 from clip_object import ClipObject
+from tracing import TRACER
+
+
+@functools.lru_cache(maxsize=None)
+def find_command(command: str) -> Optional[str]:
+    """Locate an executable in PATH, probing each name once per process.
+
+    Args:
+        command (str): Executable name
+
+    Returns:
+        Optional[str]: Full path, or None if it is not installed
+    """
+    return shutil.which(command)
+
+
+# Tokens read when the owner does not answer TIMESTAMP (xclip, pyperclip and
+# many toolkits): they never change, so they cannot tell two copies apart
+EMPTY_TOKENS = (None, b'', '', ())
+
+
+def usable_token(token):
+    """Map an empty change token to None (no token: read every time).
+
+    Args:
+        token: Value returned by a change token probe
+
+    Returns:
+        The token, or None if it is empty
+    """
+    return None if token in EMPTY_TOKENS else token
+
+
+def _load_pil():
+    """Import PIL.Image on first use (it is slow to import)."""
+    from PIL import Image
+    return Image
+
+
+def _load_image_grab():
+    """Import PIL.ImageGrab on first use, or None where unsupported."""
+    try:
+        from PIL import ImageGrab
+    except ImportError:
+        return None
+    return ImageGrab
+
+
+class XlibClipboardBackend:
+    """Clipboard reads over one persistent X11 connection (python-xlib).
+
+    Every read is a selection conversion on a long-lived hidden window
+    instead of a new xclip process. Reads from several threads are
+    serialized over the connection.
+    """
+
+    # Window property the selection owner writes converted data to
+    PROPERTY = 'SYNCCLIPBOARD_SELECTION'
+
+    def __init__(self, display_name: Optional[str] = None, timeout: float = 1.0):
+        """Open the X11 connection.
+
+        Args:
+            display_name (Optional[str]): X display (defaults to $DISPLAY)
+            timeout (float): Seconds to wait for the selection owner
+
+        Raises:
+            Exception: If python-xlib is missing or the display unreachable
+        """
+        from Xlib import X, display
+
+        self._X = X
+        self._display = display.Display(display_name)
+        self._window = self._display.screen().root.create_window(
+            0, 0, 1, 1, 0, X.CopyFromParent,
+            event_mask=X.PropertyChangeMask
+        )
+        self.timeout = timeout
+        self._atoms: dict = {}
+        self._lock = threading.Lock()
+
+    def _atom(self, name: str) -> int:
+        """Intern an atom once."""
+        if name not in self._atoms:
+            self._atoms[name] = self._display.intern_atom(name)
+        return self._atoms[name]
+
+    def _wait_event(self, matches: Callable, deadline: float):
+        """Wait for an event of our window matching a predicate."""
+        while True:
+            while self._display.pending_events():
+                event = self._display.next_event()
+                if matches(event):
+                    return event
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            select.select([self._display], [], [], remaining)
+
+    def _convert(self, target: str):
+        """Ask the selection owner for a target (caller holds the lock).
+
+        Returns:
+            Property reply with property_type, format and value, or None
+        """
+        X = self._X
+        prop = self._atom(self.PROPERTY)
+        self._window.convert_selection(
+            self._atom('CLIPBOARD'), self._atom(target), prop, X.CurrentTime
+        )
+        self._display.flush()
+
+        event = self._wait_event(
+            lambda e: e.type == X.SelectionNotify,
+            time.monotonic() + self.timeout
+        )
+        if event is None or event.property == X.NONE:
+            return None
+
+        reply = self._window.get_full_property(prop, X.AnyPropertyType)
+        self._window.delete_property(prop)
+        self._display.flush()
+        if reply is not None and reply.property_type == self._atom('INCR'):
+            reply.value = self._read_incr(prop)
+        return reply
+
+    def _read_incr(self, prop: int) -> Optional[bytes]:
+        """Receive a large selection sent in INCR chunks."""
+        X = self._X
+        chunks = []
+        while True:
+            event = self._wait_event(
+                lambda e: e.type == X.PropertyNotify and e.atom == prop
+                and e.state == X.PropertyNewValue,
+                time.monotonic() + self.timeout
+            )
+            if event is None:
+                return None
+            reply = self._window.get_full_property(prop, X.AnyPropertyType)
+            self._window.delete_property(prop)
+            self._display.flush()
+            if reply is None or not reply.value:
+                return b''.join(chunks)
+            chunks.append(bytes(reply.value))
+
+    def read(self, target: str) -> Optional[bytes]:
+        """Read the clipboard converted to a target.
+
+        Args:
+            target (str): Target name, e.g. 'image/png' or 'UTF8_STRING'
+
+        Returns:
+            Optional[bytes]: The data, or None if the owner cannot provide it
+        """
+        with self._lock:
+            reply = self._convert(target)
+        if reply is None or reply.value is None:
+            return None
+        value = reply.value
+        return value if isinstance(value, bytes) else bytes(value)
+
+    def targets(self) -> Optional[frozenset]:
+        """List the targets the clipboard owner offers.
+
+        Returns:
+            Optional[frozenset]: Target names, or None if nobody owns it
+        """
+        with self._lock:
+            reply = self._convert('TARGETS')
+            if reply is None or reply.format != 32:
+                return None
+            return frozenset(
+                self._display.get_atom_name(atom) for atom in reply.value
+            )
+
+    def timestamp(self):
+        """Time at which the current owner acquired the clipboard.
+
+        Returns:
+            A comparable change token, or None when nobody owns the
+            clipboard or the owner does not support TIMESTAMP
+        """
+        with self._lock:
+            reply = self._convert('TIMESTAMP')
+        return tuple(reply.value) if reply is not None and reply.value else None
+
+    def close(self) -> None:
+        """Close the X11 connection."""
+        with self._lock:
+            self._display.close()
 
 
 class ClipboardPlatform:
@@ -34,10 +223,19 @@ class ClipboardPlatform:
     def __init__(self):
         """Initialize clipboard platform handler with detected OS."""
         self.os_type = platform.system().lower()
+        # Persistent X11 connection, opened on first use (see _get_x11)
+        self._x11: Optional[XlibClipboardBackend] = None
+        self._x11_checked = False
+        # Probe and payload caches, valid while the change token is unchanged
+        self._targets_token = None
+        self._targets: Optional[frozenset] = None
+        self._content_token = None
+        self._content: Optional[ClipObject] = None
         self._detect_linux_backend()
 
     def _detect_linux_backend(self) -> None:
         """Detect available clipboard backend on Linux."""
+        self.linux_backend = None
         if self.os_type != 'linux':
             return
 
@@ -49,40 +247,137 @@ class ClipboardPlatform:
         # Check for Wayland tools
         elif self._command_exists('wl-paste'):
             self.linux_backend = 'wayland'
-        else:
-            self.linux_backend = None
+
+    def _get_x11(self) -> Optional[XlibClipboardBackend]:
+        """Get the persistent X11 backend if python-xlib and a display are available."""
+        if not self._x11_checked:
+            self._x11_checked = True
+            if self.os_type == 'linux' and os.getenv('DISPLAY'):
+                try:
+                    self._x11 = XlibClipboardBackend()
+                except Exception:
+                    self._x11 = None
+        return self._x11
 
     @staticmethod
     def _command_exists(command: str) -> bool:
-        """Check if a command exists in PATH."""
+        """Check if a command exists in PATH (cached, see find_command)."""
+        return find_command(command) is not None
+
+    def get_change_token(self):
+        """Get a cheap value that changes whenever the clipboard changes.
+
+        Compared between two polls to skip reading an unchanged payload.
+
+        Returns:
+            A comparable token, or None if this platform has no cheap one
+        """
         try:
-            subprocess.run(
-                ['which', command],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=False
-            )
-            return True
+            if self.os_type == 'windows':
+                import ctypes
+                return ctypes.windll.user32.GetClipboardSequenceNumber()
+
+            elif self.os_type == 'darwin':
+                try:
+                    from AppKit import NSPasteboard
+                except ImportError:
+                    return None
+                return NSPasteboard.generalPasteboard().changeCount()
+
+            elif self.os_type == 'linux' and self._get_x11() is not None:
+                return self._x11.timestamp()
+
+            elif self.os_type == 'linux' and self.linux_backend == 'xclip':
+                # Time at which the current owner acquired the selection
+                result = subprocess.run(
+                    ['xclip', '-selection', 'clipboard', '-t', 'TIMESTAMP', '-o'],
+                    capture_output=True,
+                    check=False
+                )
+                if result.returncode != 0:
+                    return None
+                return usable_token(result.stdout.strip())
+
+            # Wayland has no synchronous equivalent: a counter driven by
+            # wl-paste --watch could lag behind a Ctrl+C read and serve
+            # stale cached content, so reads there are never cached
+            return None
+
         except Exception:
-            return False
+            return None
+
+    def get_targets(self, token=None) -> Optional[frozenset]:
+        """Get the content types offered by the clipboard.
+
+        Cached until the change token moves.
+
+        Args:
+            token: Change token already read by the caller, if any
+
+        Returns:
+            Optional[frozenset]: MIME types / target names, or None when the
+                platform cannot list them cheaply
+        """
+        if token is None:
+            token = self.get_change_token()
+        if token is not None and token == self._targets_token:
+            return self._targets
+
+        targets = self._read_targets()
+        if token is not None:
+            self._targets_token, self._targets = token, targets
+        return targets
+
+    def _read_targets(self) -> Optional[frozenset]:
+        """List the clipboard content types without reading the payload."""
+        if self.os_type != 'linux':
+            return None
+        try:
+            if self._get_x11() is not None:
+                return self._x11.targets() or frozenset()
+
+            if not self.linux_backend:
+                return None
+            elif self.linux_backend == 'wayland':
+                command = ['wl-paste', '--list-types']
+            elif self.linux_backend == 'xclip' or self._command_exists('xclip'):
+                command = ['xclip', '-selection', 'clipboard', '-t', 'TARGETS', '-o']
+            else:
+                return None
+            result = subprocess.run(command, capture_output=True, check=False)
+            return frozenset(result.stdout.decode('utf-8', 'replace').split())
+        except Exception:
+            return None
 
     def get_clipboard_content(self) -> Optional[ClipObject]:
         """Get content from clipboard (text or image).
 
+        The result is cached until the change token moves, and the image
+        read is skipped when the content types show there is no image.
+
         Returns:
             Optional[ClipObject]: ClipObject with content or None if empty
         """
+        token = self.get_change_token()
+        if token is not None and token == self._content_token:
+            return self._content
+
         # Try to get image first (images have priority)
-        image = self.get_image()
-        if image:
-            return image
+        targets = self.get_targets(token)
+        image = None
+        if targets is None or 'image/png' in targets:
+            image = self.get_image()
 
-        # Fall back to text
-        text = self.get_text()
-        if text:
-            return ClipObject(content=text, content_type="text")
+        if image:
+            content = image
+        else:
+            # Fall back to text
+            text = self.get_text()
+            content = ClipObject(content=text, content_type="text") if text else None
 
-        return None
+        if token is not None:
+            self._content_token, self._content = token, content
+        return content
 
     def get_text(self) -> Optional[str]:
         """Get text from clipboard.
@@ -91,7 +386,11 @@ class ClipboardPlatform:
             Optional[str]: Text content or None
         """
         try:
-            text = pyperclip.paste()
+            if self._get_x11() is not None:
+                data = self._x11.read('UTF8_STRING')
+                text = data.decode('utf-8', 'replace') if data else None
+            else:
+                text = pyperclip.paste()
             return text if text else None
         except Exception as e:
             print(f"Error getting text from clipboard: {e}")
@@ -116,6 +415,7 @@ class ClipboardPlatform:
     def _get_image_windows(self) -> Optional[ClipObject]:
         """Get image from Windows clipboard."""
         try:
+            ImageGrab = _load_image_grab()
             if ImageGrab is None:
                 return None
 
@@ -124,7 +424,7 @@ class ClipboardPlatform:
             if img is None or isinstance(img, list):
                 return None
 
-            if isinstance(img, Image.Image):
+            if isinstance(img, _load_pil().Image):
                 # Convert image to bytes
                 img_byte_arr = io.BytesIO()
                 img.save(img_byte_arr, format='PNG')
@@ -165,10 +465,11 @@ class ClipboardPlatform:
                         os.unlink(tmp_path)
 
             # Fall back to PIL ImageGrab (works on macOS)
+            ImageGrab = _load_image_grab()
             if ImageGrab is not None:
                 img = ImageGrab.grabclipboard()
 
-                if img and isinstance(img, Image.Image):
+                if img and isinstance(img, _load_pil().Image):
                     img_byte_arr = io.BytesIO()
                     img.save(img_byte_arr, format='PNG')
                     img_bytes = img_byte_arr.getvalue()
@@ -181,13 +482,18 @@ class ClipboardPlatform:
             return None
 
     def _get_image_linux(self) -> Optional[ClipObject]:
-        """Get image from Linux clipboard using xclip or wl-paste."""
-        if not self.linux_backend:
+        """Get image from Linux clipboard over X11, or using xclip or wl-paste."""
+        if not self.linux_backend and self._get_x11() is None:
             print("No clipboard backend available. Install xclip, xsel, or wl-clipboard")
             return None
 
         try:
-            if self.linux_backend == 'xclip':
+            if self._get_x11() is not None:
+                img_bytes = self._x11.read('image/png')
+                if img_bytes:
+                    return ClipObject.from_image_bytes(img_bytes, "PNG")
+
+            elif self.linux_backend == 'xclip':
                 result = subprocess.run(
                     ['xclip', '-selection', 'clipboard', '-t', 'image/png', '-o'],
                     capture_output=True,
@@ -269,7 +575,7 @@ class ClipboardPlatform:
                 return False
 
             # Convert bytes to PIL Image
-            img = Image.open(io.BytesIO(img_bytes))
+            img = _load_pil().open(io.BytesIO(img_bytes))
 
             # Use win32clipboard if available
             try:
@@ -384,31 +690,15 @@ class ClipboardPlatform:
         """
         try:
             if self.os_type == 'windows' or self.os_type == 'darwin':
+                ImageGrab = _load_image_grab()
                 if ImageGrab is not None:
                     img = ImageGrab.grabclipboard()
-                    return isinstance(img, Image.Image)
+                    return isinstance(img, _load_pil().Image)
                 return False
 
             elif self.os_type == 'linux':
-                if not self.linux_backend:
-                    return False
-
-                if self.linux_backend in ['xclip', 'xsel']:
-                    # Check if clipboard has image/png target
-                    result = subprocess.run(
-                        ['xclip', '-selection', 'clipboard', '-t', 'TARGETS', '-o'],
-                        capture_output=True,
-                        check=False
-                    )
-                    return b'image/png' in result.stdout
-
-                elif self.linux_backend == 'wayland':
-                    result = subprocess.run(
-                        ['wl-paste', '--list-types'],
-                        capture_output=True,
-                        check=False
-                    )
-                    return b'image/png' in result.stdout
+                targets = self.get_targets()
+                return targets is not None and 'image/png' in targets
 
             return False
 
@@ -416,6 +706,185 @@ class ClipboardPlatform:
             return False
 
 
+class ClipboardWatcher:
+    """Watches the clipboard and reports every new content.
+
+    Uses a change-notification mechanism when one is available:
+
+    - ``wl-paste --watch`` on Wayland
+    - ``clipnotify`` (X11 selection owner change events) on X11
+
+    Otherwise polls the clipboard, comparing a cheap change token (see
+    ClipboardPlatform.get_change_token) before reading the payload. The
+    polling interval grows while nothing changes and drops back to the
+    minimum after a change.
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[ClipObject], None],
+        clipboard: Optional[ClipboardPlatform] = None,
+        min_interval: float = 0.1,
+        max_interval: float = 2.0,
+        backoff: float = 1.5
+    ):
+        """Initialize the watcher.
+
+        Args:
+            on_change (Callable[[ClipObject], None]): Called with each new
+                clipboard content, from the watcher thread
+            clipboard (Optional[ClipboardPlatform]): Clipboard to watch
+                (defaults to the shared instance)
+            min_interval (float): Shortest polling interval in seconds
+            max_interval (float): Longest polling interval in seconds
+            backoff (float): Interval growth factor while nothing changes
+        """
+        self.on_change = on_change
+        self.clipboard = clipboard or get_clipboard()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        self._last_key = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._process: Optional[subprocess.Popen] = None
+        self.mode = self._select_mode()
+
+    def _select_mode(self) -> str:
+        """Pick the best change detection mechanism available."""
+        if self.clipboard.os_type == 'linux':
+            if os.getenv('WAYLAND_DISPLAY') and find_command('wl-paste'):
+                return 'wayland'
+            if os.getenv('DISPLAY') and find_command('clipnotify'):
+                return 'clipnotify'
+        return 'poll'
+
+    def remember(self, clip: ClipObject) -> None:
+        """Treat a content as already seen.
+
+        Call before putting a content on the clipboard that must not be
+        reported back (e.g. an update received from the server).
+
+        Args:
+            clip (ClipObject): The content about to be set
+        """
+        with self._lock:
+            self._last_key = clip.get_content_hash()
+
+    def check(self) -> bool:
+        """Read the clipboard and report its content if it changed.
+
+        Returns:
+            bool: True if a new content was reported
+        """
+        started = time.time()
+        clip = self.clipboard.get_clipboard_content()
+        if clip is None:
+            return False
+        key = clip.get_content_hash()
+        with self._lock:
+            if key == self._last_key:
+                return False
+            self._last_key = key
+
+        TRACER.begin(clip, started)
+        try:
+            self.on_change(clip)
+        except Exception as e:
+            print(f"Error handling clipboard change: {e}")
+        return True
+
+    def start(self) -> None:
+        """Start watching in a background thread."""
+        if self._thread is not None:
+            return
+        # The content present at startup is not a change
+        clip = self.clipboard.get_clipboard_content()
+        if clip is not None:
+            self.remember(clip)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching."""
+        self._stop.set()
+        process = self._process
+        if process is not None:
+            process.terminate()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        """Watcher thread main loop."""
+        try:
+            if self.mode == 'wayland':
+                self._watch_wayland()
+            elif self.mode == 'clipnotify':
+                self._watch_clipnotify()
+        except Exception as e:
+            print(f"Clipboard notifications unavailable ({e}), polling instead")
+        if not self._stop.is_set():
+            self.mode = 'poll'
+            self._poll()
+
+    def _watch_wayland(self) -> None:
+        """Read one line per clipboard change from wl-paste --watch."""
+        self._process = subprocess.Popen(
+            ['wl-paste', '--watch', 'echo', 'changed'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            for _ in self._process.stdout:
+                if self._stop.is_set():
+                    return
+                self.check()
+        finally:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+        if not self._stop.is_set():
+            raise RuntimeError("wl-paste --watch exited")
+
+    def _watch_clipnotify(self) -> None:
+        """Block in clipnotify, which exits on each selection change."""
+        while not self._stop.is_set():
+            self._process = subprocess.Popen(
+                ['clipnotify', '-s', 'clipboard'],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            if self._stop.is_set():
+                self._process.terminate()
+            returncode = self._process.wait()
+            self._process = None
+            if self._stop.is_set():
+                return
+            if returncode != 0:
+                raise RuntimeError(f"clipnotify exited with status {returncode}")
+            self.check()
+
+    def _poll(self) -> None:
+        """Poll with an adaptive interval, reading the payload only when
+        the change token moved (or when there is no token)."""
+        token = usable_token(self.clipboard.get_change_token())
+        interval = self.min_interval
+        while not self._stop.wait(interval):
+            new_token = usable_token(self.clipboard.get_change_token())
+            changed = False
+            if new_token is None or new_token != token:
+                token = new_token
+                changed = self.check()
+            if changed:
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+
+
 # Singleton instance for convenience
 _clipboard = None
 
@@ -1,30 +1,634 @@
 import os
+import sys
 import time
-from pymongo import MongoClient
+import atexit
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional, Union
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.common import MAX_POOL_SIZE
+from pymongo.errors import DuplicateKeyError
+from pymongo.cursor import Cursor
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.read_preferences import (
+    Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+)
+from pymongo.write_concern import WriteConcern
 from bson.objectid import ObjectId
 
 from clip_user import ClipUser
 from clip_object import ClipObject
+from write_behind import WriteBehindQueue
+from history_cache import HistoryCache
+import metrics
+# The shared helpers and limits are still importable from here
+from storage import (  # noqa: F401
+    BATCH_LIMIT, PREVIEW_LENGTH, REPLAY_LIMIT, ClipboardStorage, decode_transaction,
+    make_history_cursor, metadata_view, parse_history_cursor, storage_from_env
+)
 
 
-class MongoCRUD:
-    """MongoDB CRUD operations for clipboard synchronization"""
+# Projection used for metadata-only history rows: never ships full text
+# content or inline image data
+TRANSACTION_METADATA_PROJECTION = {
+    "seq": 1,
+    "content_type": 1,
+    "image_digest": 1,
+    "size": 1,
+    "timestamp": 1,
+    # Compressed text keeps its preview in plain fields next to the payload
+    "preview": {"$cond": [
+        {"$ifNull": ["$content_encoding", False]},
+        "$preview",
+        {"$substrCP": ["$content", 0, PREVIEW_LENGTH]}
+    ]},
+    "truncated": {"$cond": [
+        {"$ifNull": ["$content_encoding", False]},
+        "$truncated",
+        {"$gt": [{"$strLenCP": "$content"}, PREVIEW_LENGTH]}
+    ]},
+}
+
+# Plan stages meaning a query is not fully served by an index
+UNINDEXED_PLAN_STAGES = {"COLLSCAN", "SORT"}
+
+
+def _plan_stages(plan) -> list:
+    """Collect every stage name of an explain() winning plan
+
+    Args:
+        plan: The (nested) winning plan document
+
+    Returns:
+        list: Stage names, outermost first
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+# MongoClient pool and timeout options read by mongo_client_options
+CLIENT_OPTION_VARIABLES = {
+    'MONGODB_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGODB_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGODB_MAX_CONNECTING': 'maxConnecting',
+    'MONGODB_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGODB_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGODB_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+    'MONGODB_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGODB_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+}
+
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primarypreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondarypreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+
+def mongo_connection_string() -> str:
+    """Get the MongoDB URI from MONGODB_HOST and MONGODB_PORT"""
+    mongo_host = os.getenv('MONGODB_HOST', 'localhost')
+    mongo_port = int(os.getenv('MONGODB_PORT', '27017'))
+    return f"mongodb://{mongo_host}:{mongo_port}/"
+
+
+def mongo_client_options() -> dict:
+    """Get the MongoClient options set in the environment
+
+    Each variable of CLIENT_OPTION_VARIABLES that is set becomes the
+    matching option; pymongo's defaults apply to the others (a pool of
+    100 connections, waiting for one without time limit).
+
+    Returns:
+        dict: Keyword arguments for MongoClient
+    """
+    return {
+        option: int(os.environ[variable])
+        for variable, option in CLIENT_OPTION_VARIABLES.items()
+        if os.getenv(variable)
+    }
+
+
+def parse_read_preference(
+    mode: Optional[str],
+    max_staleness: Optional[float] = None
+):
+    """Build a read preference from its mode name
+
+    Args:
+        mode (Optional[str]): primary, primaryPreferred, secondary,
+            secondaryPreferred or nearest (case-insensitive)
+        max_staleness (Optional[float]): Seconds a secondary may lag behind
+            to be read from (at least 90; ignored for primary)
+
+    Raises:
+        ValueError: If the mode is unknown
+
+    Returns:
+        The read preference, or None when mode is empty
+    """
+    if not mode:
+        return None
+    preference = READ_PREFERENCES.get(mode.lower())
+    if preference is None:
+        raise ValueError(f"Unknown read preference: {mode!r}")
+    if preference is Primary:
+        return Primary()
+    return preference(max_staleness=int(max_staleness) if max_staleness else -1)
+
+
+def parse_write_concern(
+    w: Optional[Union[str, int]],
+    wtimeout_ms: Optional[int] = None
+) -> Optional[WriteConcern]:
+    """Build a write concern from its ``w`` value
+
+    Args:
+        w (Optional[Union[str, int]]): Number of acknowledging members
+            (0 for unacknowledged writes) or 'majority'
+        wtimeout_ms (Optional[int]): Longest wait for the acknowledgements
+
+    Raises:
+        ValueError: If w is neither a number nor 'majority'
+
+    Returns:
+        Optional[WriteConcern]: The write concern, or None when w is empty
+    """
+    if w is None or w == '':
+        return None
+    if isinstance(w, str):
+        if w.isdigit():
+            w = int(w)
+        elif w != 'majority':
+            raise ValueError(f"Invalid write concern: {w!r}")
+    if w == 0:
+        # Unacknowledged writes cannot have a timeout
+        return WriteConcern(w=0)
+    return WriteConcern(w=w, wtimeout=wtimeout_ms)
+
+
+class PoolMetricsListener(ConnectionPoolListener):
+    """Feeds MongoDB connection pool events into the pool metrics
+
+    Open and checked-out connections and the pool size are gauges per
+    server address; the time an operation waits for a connection is a
+    histogram, which grows first when requests pile up on the pool.
+    """
 
     def __init__(self) -> None:
-        """Initialize MongoDB connection and collections"""
-        # Support Docker environment variables
-        mongo_host = os.getenv('MONGODB_HOST', 'localhost')
-        mongo_port = int(os.getenv('MONGODB_PORT', '27017'))
+        # A checkout starts and ends on the thread running the operation
+        self._checkout_started = threading.local()
 
-        connection_string = f"mongodb://{mongo_host}:{mongo_port}/"
-        self.client = MongoClient(connection_string)
-        self.prod_env = self.client['prod_env']
-        self.users = self.prod_env['users']
-        self.transactions = self.prod_env['transactions']
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event) -> None:
+        metrics.MONGO_POOL_MAX_SIZE.set(
+            event.options.get('maxPoolSize', MAX_POOL_SIZE), address=self._address(event)
+        )
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        metrics.MONGO_POOL_CONNECTIONS.inc(address=self._address(event))
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        metrics.MONGO_POOL_CONNECTIONS.dec(address=self._address(event))
+
+    def connection_check_out_started(self, event) -> None:
+        self._checkout_started.value = time.perf_counter()
+
+    def connection_check_out_failed(self, event) -> None:
+        address = self._address(event)
+        self._observe_wait(address)
+        metrics.MONGO_POOL_CHECKOUT_FAILURES.inc(address=address, reason=event.reason)
+
+    def connection_checked_out(self, event) -> None:
+        address = self._address(event)
+        self._observe_wait(address)
+        metrics.MONGO_POOL_CHECKED_OUT.inc(address=address)
+
+    def connection_checked_in(self, event) -> None:
+        metrics.MONGO_POOL_CHECKED_OUT.dec(address=self._address(event))
+
+    def _observe_wait(self, address: str) -> None:
+        started = getattr(self._checkout_started, 'value', None)
+        if started is not None:
+            self._checkout_started.value = None
+            metrics.MONGO_POOL_WAIT_SECONDS.observe(
+                time.perf_counter() - started, address=address
+            )
+
+
+_shared_clients: dict = {}
+_shared_clients_lock = threading.Lock()
+
+
+def shared_client() -> MongoClient:
+    """Get the MongoClient of this process for the environment settings
+
+    Every MongoCRUD.from_env() of a process uses this client, so they
+    share one connection pool. It is created with connect=False: a server
+    that imports the app before forking workers (e.g. gunicorn --preload)
+    opens no connection in the parent, and pymongo gives each worker
+    fresh pools after the fork.
+
+    Returns:
+        MongoClient: The shared client
+    """
+    connection_string = mongo_connection_string()
+    options = mongo_client_options()
+    key = (connection_string, tuple(sorted(options.items())))
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            listeners = [PoolMetricsListener()] if metrics.REGISTRY.enabled else []
+            client = MongoClient(
+                connection_string, connect=False, event_listeners=listeners, **options
+            )
+            _shared_clients[key] = client
+    return client
+
+
+class MongoCRUD(ClipboardStorage):
+    """MongoDB CRUD operations for clipboard synchronization"""
+
+    def __init__(self, client: Optional[MongoClient] = None) -> None:
+        """Initialize MongoDB connection and collections
+
+        Args:
+            client (Optional[MongoClient]): Client to use, e.g.
+                shared_client(); a dedicated one is created from the
+                environment when None
+        """
+        super().__init__()
+        if client is None:
+            client = MongoClient(mongo_connection_string(), **mongo_client_options())
+        self.client = client
+        # Per operation class settings, see configure_operations
+        self.history_read_preference = None
+        self.clip_write_concern: Optional[WriteConcern] = None
+        self.account_write_concern: Optional[WriteConcern] = None
+        self._bind_collections()
+        # Optional batching of transaction inserts, see enable_write_behind
+        self.write_behind: Optional[WriteBehindQueue] = None
+        # Optional cache of recent history, see enable_history_cache
+        self.history_cache: Optional[HistoryCache] = None
+
+    @staticmethod
+    def from_env() -> 'MongoCRUD':
+        """Create a MongoCRUD configured from environment variables
+
+        WRITE_BEHIND_BATCH_SIZE (0 disables), WRITE_BEHIND_MAX_DELAY_MS and
+        WRITE_BEHIND_DURABLE configure write-behind batching;
+        HISTORY_CACHE_USERS (0, the default, disables; ignored when
+        SOCKETIO_MESSAGE_QUEUE is set), HISTORY_CACHE_MAX_BYTES and
+        HISTORY_CACHE_DEPTH configure the history cache; compression and
+        metrics are set up by ClipboardStorage.configure_from_env.
+        Indexes are created in the background unless MONGODB_ENSURE_INDEXES
+        is false, so they exist whichever server imports the app.
+
+        The instance uses the process-wide shared_client(), whose pool and
+        timeouts come from CLIENT_OPTION_VARIABLES.
+        MONGODB_HISTORY_READ_PREFERENCE (with
+        MONGODB_HISTORY_MAX_STALENESS_S), MONGODB_CLIP_WRITE_CONCERN,
+        MONGODB_ACCOUNT_WRITE_CONCERN and MONGODB_WRITE_TIMEOUT_MS are
+        passed to configure_operations.
+
+        Returns:
+            MongoCRUD: The configured instance
+        """
+        db = MongoCRUD(shared_client())
+        max_staleness = os.getenv('MONGODB_HISTORY_MAX_STALENESS_S')
+        wtimeout_ms = os.getenv('MONGODB_WRITE_TIMEOUT_MS')
+        db.configure_operations(
+            history_read_preference=os.getenv('MONGODB_HISTORY_READ_PREFERENCE'),
+            clip_write_concern=os.getenv('MONGODB_CLIP_WRITE_CONCERN'),
+            account_write_concern=os.getenv('MONGODB_ACCOUNT_WRITE_CONCERN'),
+            max_staleness=float(max_staleness) if max_staleness else None,
+            wtimeout_ms=int(wtimeout_ms) if wtimeout_ms else None
+        )
+
+        write_behind_batch_size = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '0'))
+        if write_behind_batch_size > 0:
+            db.enable_write_behind(
+                max_batch=write_behind_batch_size,
+                max_delay=float(os.getenv('WRITE_BEHIND_MAX_DELAY_MS', '50')) / 1000,
+                durable=os.getenv('WRITE_BEHIND_DURABLE', 'false').lower() == 'true'
+            )
+
+        # Each process only sees its own writes, so the cache stays off when
+        # several server processes share the database
+        history_cache_users = int(os.getenv('HISTORY_CACHE_USERS', '0'))
+        if history_cache_users > 0 and os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+            print("History cache disabled: several server processes share the database")
+        elif history_cache_users > 0:
+            db.enable_history_cache(
+                max_users=history_cache_users,
+                max_bytes=int(os.getenv('HISTORY_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+                depth=int(os.getenv('HISTORY_CACHE_DEPTH', '50'))
+            )
+
+        if os.getenv('MONGODB_ENSURE_INDEXES', 'true').lower() == 'true':
+            db.ensure_indexes_in_background()
+        return db.configure_from_env()
 
     def get_db(self) -> MongoClient:
         return self.client
 
+    def _bind_collections(self) -> None:
+        """Get the collections with the per operation class settings"""
+        self.prod_env = self.client['prod_env']
+        self.users = self.prod_env.get_collection(
+            'users', write_concern=self.account_write_concern
+        )
+        self.transactions = self.prod_env.get_collection(
+            'transactions', write_concern=self.clip_write_concern
+        )
+        self.blobs = self.prod_env.get_collection(
+            'blobs', write_concern=self.clip_write_concern
+        )
+        # History pages may be read from secondaries; replays after a
+        # sequence number, single entries, cache loads and retention
+        # always go to the primary
+        self.history = self.prod_env.get_collection(
+            'transactions', read_preference=self.history_read_preference
+        )
+        # Per-user sequence counters, see next_sequence; always acknowledged
+        # so two clips never get the same number
+        self.counters = self.prod_env['counters']
+
+    def configure_operations(
+        self,
+        history_read_preference: Optional[str] = None,
+        clip_write_concern: Optional[Union[str, int]] = None,
+        account_write_concern: Optional[Union[str, int]] = None,
+        max_staleness: Optional[float] = None,
+        wtimeout_ms: Optional[int] = None
+    ) -> 'MongoCRUD':
+        """Set the read preference and write concerns per operation class
+
+        Unset values keep the client's defaults (primary reads, acknowledged
+        writes).
+
+        Args:
+            history_read_preference (Optional[str]): Read preference of the
+                history queries, e.g. 'secondaryPreferred'
+            clip_write_concern (Optional[Union[str, int]]): ``w`` of clip and
+                blob writes, e.g. 1, or 0 to not wait for acknowledgement
+            account_write_concern (Optional[Union[str, int]]): ``w`` of user
+                account writes, e.g. 'majority'
+            max_staleness (Optional[float]): Seconds a secondary may lag
+                behind to serve history
+            wtimeout_ms (Optional[int]): Longest wait for the write
+                acknowledgements
+
+        Raises:
+            ValueError: If a read preference or write concern is invalid
+
+        Returns:
+            MongoCRUD: self
+        """
+        self.history_read_preference = parse_read_preference(
+            history_read_preference, max_staleness
+        )
+        self.clip_write_concern = parse_write_concern(clip_write_concern, wtimeout_ms)
+        self.account_write_concern = parse_write_concern(account_write_concern, wtimeout_ms)
+        self._bind_collections()
+        return self
+
+    def enable_write_behind(
+        self,
+        max_batch: int = 100,
+        max_delay: float = 0.05,
+        durable: bool = False
+    ):
+        """Buffer transaction inserts and write them with insert_many
+
+        insert_transaction then returns before MongoDB acknowledges the
+        write, unless ``durable`` is set. Pending writes are flushed on
+        close() and at interpreter exit.
+
+        Args:
+            max_batch (int): Flush once this many transactions are pending
+            max_delay (float): Maximum seconds a transaction stays buffered
+            durable (bool): Make insert_transaction wait for its batch to be
+                acknowledged (still one round trip per batch)
+
+        Returns:
+            MongoCRUD: self for chaining
+        """
+        if self.write_behind is None:
+            self.write_behind = WriteBehindQueue(
+                self._write_transactions,
+                max_batch=max_batch,
+                max_delay=max_delay,
+                durable=durable
+            )
+            atexit.register(self.close)
+        return self
+
+    def enable_history_cache(
+        self,
+        max_users: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        depth: int = 50
+    ):
+        """Serve recent history reads from an in-process LRU cache
+
+        The cache is filled on read, updated by insert_transaction and
+        invalidated by updates and deletes made through this instance.
+
+        Args:
+            max_users (int): Maximum number of users kept
+            max_bytes (int): Maximum estimated size of cached entries
+            depth (int): Number of newest transactions cached per user
+
+        Returns:
+            MongoCRUD: self for chaining
+        """
+        self.history_cache = HistoryCache(
+            max_users=max_users,
+            max_bytes=max_bytes,
+            depth=depth
+        )
+        return self
+
+    def _write_transactions(self, transactions: list) -> None:
+        """Write a batch of buffered transactions in one round trip"""
+        self.transactions.insert_many(transactions, ordered=False)
+
+    def flush(self):
+        """Wait until every buffered transaction has been written
+
+        Returns:
+            MongoCRUD: self for chaining
+        """
+        if self.write_behind is not None:
+            self.write_behind.flush()
+        return self
+
+    def close(self) -> None:
+        """Flush buffered transactions and stop the write-behind thread"""
+        if self.write_behind is not None:
+            self.write_behind.close()
+
+    def ensure_indexes(self):
+        """Create the indexes backing every query method
+
+        Safe to call on every startup: existing indexes are left untouched.
+
+        Returns:
+            MongoCRUD: self for chaining
+        """
+        # History reads filter on user_id and order by (timestamp, _id)
+        self.transactions.create_index(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_timestamp_id"
+        )
+        # Blob garbage collection looks up remaining references by digest
+        self.transactions.create_index(
+            [("image_digest", ASCENDING)],
+            name="image_digest",
+            partialFilterExpression={"image_digest": {"$type": "string"}}
+        )
+        # The orphan sweep walks blobs older than its grace period
+        self.blobs.create_index([("created_at", ASCENDING)], name="created_at")
+        # Delta sync replays a user's entries after a sequence number
+        self.transactions.create_index(
+            [("user_id", ASCENDING), ("seq", ASCENDING)],
+            name="user_id_seq"
+        )
+        self.users.create_index([("username", ASCENDING)], name="username", unique=True)
+        self.users.create_index([("id", ASCENDING)], name="id", unique=True)
+        return self
+
+    def ensure_indexes_in_background(self) -> threading.Thread:
+        """Run ensure_indexes in a daemon thread
+
+        Importing the app does not wait for the database this way; a
+        failure is printed and the server keeps running without indexes.
+
+        Returns:
+            threading.Thread: The started thread
+        """
+        def run():
+            try:
+                self.ensure_indexes()
+            except Exception as e:
+                print(f"Error creating database indexes: {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def ensure_ttl_index(self, max_age: float):
+        """Let MongoDB expire transactions older than max_age seconds
+
+        Creates a TTL index on ``created_at``, or updates its expiry when it
+        already exists. Only transactions carrying ``created_at`` expire.
+
+        Args:
+            max_age (float): Age in seconds after which transactions expire
+
+        Returns:
+            MongoCRUD: self for chaining
+        """
+        expire_after = int(max_age)
+        if "created_at_ttl" in self.transactions.index_information():
+            self.prod_env.command(
+                "collMod", self.transactions.name,
+                index={"name": "created_at_ttl", "expireAfterSeconds": expire_after}
+            )
+        else:
+            self.transactions.create_index(
+                [("created_at", ASCENDING)],
+                name="created_at_ttl",
+                expireAfterSeconds=expire_after
+            )
+        return self
+
+    def _query_plan_probes(self) -> list:
+        """Queries issued by the CRUD methods, shaped for explain()
+
+        Returns:
+            list: (name, collection, filter, sort, limit) tuples
+        """
+        probe_user_id = 0
+        probe_id = ObjectId()
+        history_sort = [("timestamp", -1), ("_id", -1)]
+        return [
+            ("get_user", self.users,
+             {"username": "", "password": 0}, None, 1),
+            ("get_user_by_id", self.users, {"id": probe_user_id}, None, 1),
+            ("get_last_user_transaction", self.transactions,
+             {"user_id": probe_user_id}, [("timestamp", -1)], 1),
+            ("get_n_last_user_transaction", self.transactions,
+             {"user_id": probe_user_id}, history_sort, 50),
+            ("get_n_last_user_transaction(before)", self.transactions,
+             {"user_id": probe_user_id, "$or": [
+                 {"timestamp": {"$lt": 0.0}},
+                 {"timestamp": 0.0, "_id": {"$lt": probe_id}}
+             ]}, history_sort, 50),
+            ("get_last_stored_sequence", self.transactions,
+             {"user_id": probe_user_id}, [("seq", -1)], 1),
+            ("get_transactions_since", self.transactions,
+             {"user_id": probe_user_id, "seq": {"$gt": 0}}, [("seq", 1)],
+             REPLAY_LIMIT),
+            ("get_user_transaction", self.transactions,
+             {"_id": probe_id, "user_id": probe_user_id}, None, 1),
+            ("delete_user", self.transactions,
+             {"user_id": probe_user_id}, None, 0),
+            ("update_transaction", self.transactions, {"_id": probe_id}, None, 1),
+            ("get_blob", self.blobs, {"_id": ""}, None, 1),
+            ("delete_orphan_blobs", self.blobs,
+             {"created_at": {"$lte": datetime.now(timezone.utc)}}, None, 0),
+            ("delete_orphan_blobs(references)", self.transactions,
+             {"image_digest": ""}, None, 1),
+        ]
+
+    def check_query_plans(self) -> dict:
+        """Explain each query method and report the ones not backed by an index
+
+        Returns:
+            dict: Query name -> list of winning plan stages, only for queries
+                whose plan contains a collection scan or an in-memory sort
+        """
+        unindexed = {}
+        for name, collection, query, sort, limit in self._query_plan_probes():
+            cursor = collection.find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            cursor = cursor.limit(limit)
+            stages = _plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+            if UNINDEXED_PLAN_STAGES.intersection(stages):
+                unindexed[name] = stages
+        return unindexed
+
     def insert_user(self, user: ClipUser):
         """Insert a new user into the database
 
@@ -37,26 +641,190 @@ class MongoCRUD:
         self.users.insert_one(user.to_json())
         return self
 
-    def insert_transaction(self, user_id: int, obj: ClipObject):
+    def insert_blob(self, data: bytes, mime_type: str = "image/png") -> str:
+        """Store a binary payload once, addressed by its SHA-256 digest
+
+        Identical payloads map to the same digest, so copying the same
+        screenshot many times only stores its bytes once.
+
+        Args:
+            data (bytes): Raw payload (e.g. PNG bytes)
+            mime_type (str): MIME type served back with the blob
+
+        Returns:
+            str: Hex digest referencing the stored blob
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        now = datetime.now(timezone.utc)
+        # Storing a known blob again refreshes created_at: the orphan sweep
+        # spares recent blobs, whose transaction may not be written yet
+        refreshed = self.blobs.update_one({"_id": digest}, {"$set": {"created_at": now}})
+        if refreshed.matched_count == 0:
+            try:
+                self.blobs.insert_one({
+                    "_id": digest,
+                    "data": data,
+                    "size": len(data),
+                    "mime_type": mime_type,
+                    "created_at": now
+                })
+            except DuplicateKeyError:
+                # Another request stored the same blob concurrently
+                pass
+        return digest
+
+    def get_blob(self, digest: str) -> Optional[dict]:
+        """Get a stored blob by digest
+
+        Args:
+            digest (str): The blob's SHA-256 hex digest
+
+        Returns:
+            Optional[dict]: Blob document with data, size and mime_type, or None
+        """
+        return self.blobs.find_one({"_id": digest})
+
+    def insert_transaction(
+        self,
+        user_id: int,
+        obj: ClipObject,
+        image_digest: Optional[str] = None,
+        seq: Optional[int] = None
+    ):
         """Insert a clipboard transaction for a user
 
+        Image payloads are stored in the blob collection and the
+        transaction only keeps a reference to their digest.
+
         Args:
             user_id (int): The user's ID
             obj (ClipObject): The clipboard object to store
+            image_digest (Optional[str]): Digest of an image already stored
+                with insert_blob (skips re-reading the payload from obj)
+            seq (Optional[int]): Sequence number reserved with next_sequence
+                (one is assigned when omitted)
 
         Returns:
             MongoCRUD: self for chaining
         """
-        transaction = {
-            "user_id": user_id,
-            "content": obj.get_content(),
-            "content_type": obj.get_content_type(),
-            "image_data": obj.get_image_data(),
-            "timestamp": time.time()
-        }
-        self.transactions.insert_one(transaction)
+        if seq is None:
+            seq = self.next_sequence(user_id)
+        transaction = self._stored_form(
+            self._build_transaction(user_id, obj, image_digest, seq)
+        )
+        if self.write_behind is not None:
+            self.write_behind.put(transaction)
+        else:
+            self.transactions.insert_one(transaction)
+        if self.history_cache is not None:
+            self.history_cache.push(user_id, transaction)
         return self
 
+    def insert_transactions(self, user_id: int, objs: List[ClipObject]) -> list:
+        """Insert several clipboard transactions of a user in one round trip
+
+        One block of sequence numbers is reserved for the whole batch and
+        the transactions are written with a single insert_many, bypassing
+        write-behind since they already form a batch.
+
+        Args:
+            user_id (int): The user's ID
+            objs (List[ClipObject]): Clipboard objects, oldest first
+
+        Returns:
+            list: The stored transactions (with plain text content), in
+                sequence order
+        """
+        if not objs:
+            return []
+        first_seq = self.next_sequence(user_id, count=len(objs))
+        transactions = [
+            self._build_transaction(user_id, obj, None, first_seq + offset)
+            for offset, obj in enumerate(objs)
+        ]
+        stored = [self._stored_form(transaction) for transaction in transactions]
+        self.transactions.insert_many(stored, ordered=False)
+        if self.history_cache is not None:
+            for transaction in stored:
+                self.history_cache.push(user_id, transaction)
+        return transactions
+
+    def reserve_sequences(self, user_id: int, count: int = 1) -> int:
+        """Reserve the next sequence number(s) of a user's clipboard stream
+        in the counters collection (see ClipboardStorage.next_sequence)
+
+        Args:
+            user_id (int): The user's ID
+            count (int): Number of consecutive sequence numbers to reserve
+
+        Returns:
+            int: The first reserved sequence number (the very first one is 1)
+        """
+        counter = self.counters.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"] - count + 1
+
+    def get_last_sequence(self, user_id: int) -> int:
+        """Get the last sequence number reserved for a user
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            int: The last sequence number, or 0 if none was reserved
+        """
+        counter = self.counters.find_one({"_id": user_id})
+        return counter["seq"] if counter else 0
+
+    def get_last_stored_sequence(self, user_id: int) -> int:
+        """Get the highest sequence number of a user's stored transactions
+
+        Unlike get_last_sequence this never counts numbers reserved for
+        clips that are still being written.
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            int: The sequence number, or 0 if no transaction has one
+        """
+        if self.write_behind is not None:
+            self.write_behind.flush()
+        transaction = self.transactions.find_one(
+            {"user_id": user_id}, {"seq": 1}, sort=[("seq", DESCENDING)]
+        )
+        return (transaction or {}).get("seq") or 0
+
+    def get_transactions_since(
+        self,
+        user_id: int,
+        since: int,
+        limit: int = REPLAY_LIMIT
+    ) -> list:
+        """Get a user's transactions with a sequence number above ``since``
+
+        Args:
+            user_id (int): The user's ID
+            since (int): Last sequence number the caller has seen
+            limit (int): Maximum number of transactions returned
+
+        Returns:
+            list: Oldest-first transactions
+        """
+        # Buffered inserts must land first or the replay would skip them
+        if self.write_behind is not None:
+            self.write_behind.flush()
+        return [
+            decode_transaction(trans) for trans in
+            self.transactions.find({"user_id": user_id, "seq": {"$gt": since}})
+            .sort("seq", ASCENDING)
+            .limit(limit)
+        ]
+
     def get_user(self, username: str, password: str) -> ClipUser:
         """Get a user by username and password
 
@@ -95,26 +863,93 @@ class MongoCRUD:
         Returns:
             dict: The transaction data or empty dict if none found
         """
-        transaction = self.transactions.find_one(
+        transaction = self.history.find_one(
             {"user_id": user_id},
             sort=[("timestamp", -1)]
         )
-        return transaction if transaction else dict()
+        return decode_transaction(transaction) if transaction else dict()
 
-    def get_n_last_user_transaction(self, user_id: int, n: int) -> list[dict]:
+    def get_n_last_user_transaction(
+        self,
+        user_id: int,
+        n: int,
+        metadata_only: bool = False,
+        before: Optional[str] = None
+    ) -> list[dict]:
         """Get the last N clipboard transactions for a user
 
+        Entries are ordered newest first by (timestamp, _id). Passing the
+        cursor of the last entry of a page as ``before`` returns the next
+        page with a range query instead of skipping over earlier entries.
+
         Args:
             user_id (int): The user's ID
             n (int): Number of transactions to retrieve
+            metadata_only (bool): Only return id, content_type, size,
+                image_digest, a text preview and timestamp for each entry
+            before (Optional[str]): Cursor from make_history_cursor; only
+                older entries are returned
+
+        Raises:
+            ValueError: If ``before`` is not a valid cursor
 
         Returns:
             list[dict]: List of transaction data
         """
-        transactions = self.transactions.find(
-            {"user_id": user_id}
-        ).sort("timestamp", -1).limit(n)
-        return list(transactions)
+        cache = self.history_cache
+        if cache is not None and before is None and n <= cache.depth:
+            transactions = cache.get(user_id, n)
+            if transactions is None:
+                # Buffered inserts must land first: push() skipped them for
+                # this uncached user, so the loaded list would miss them
+                if self.write_behind is not None:
+                    self.write_behind.flush()
+                cache.begin_load(user_id)
+                # From the primary: a lagging secondary would fill the
+                # cache with a history missing the latest clips
+                transactions = list(self.transactions.find(
+                    {"user_id": user_id}
+                ).sort([("timestamp", -1), ("_id", -1)]).limit(cache.depth))
+                cache.put(user_id, transactions)
+                transactions = transactions[:n]
+            if metadata_only:
+                return [metadata_view(trans) for trans in transactions]
+            return [decode_transaction(trans) for trans in transactions]
+
+        query = {"user_id": user_id}
+        if before is not None:
+            timestamp, transaction_id = parse_history_cursor(before)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": transaction_id}}
+            ]
+
+        find_kwargs = {}
+        if metadata_only:
+            find_kwargs["projection"] = TRANSACTION_METADATA_PROJECTION
+        transactions = self.history.find(
+            query, **find_kwargs
+        ).sort([("timestamp", -1), ("_id", -1)]).limit(n)
+        if metadata_only:
+            return list(transactions)
+        return [decode_transaction(trans) for trans in transactions]
+
+    def get_user_transaction(self, user_id: int, transaction_id: str) -> Optional[dict]:
+        """Get a single transaction with its full payload
+
+        Args:
+            user_id (int): The user's ID (the transaction must belong to them)
+            transaction_id (str): The transaction's ID
+
+        Returns:
+            Optional[dict]: The transaction data or None if not found
+        """
+        if not ObjectId.is_valid(transaction_id):
+            return None
+        transaction = self.transactions.find_one(
+            {"_id": ObjectId(transaction_id), "user_id": user_id}
+        )
+        return decode_transaction(transaction) if transaction else None
 
     def update_user(self, user_id: int, update_data: dict):
         """Update user information
@@ -140,6 +975,8 @@ class MongoCRUD:
             MongoCRUD: self for chaining
         """
         self.transactions.update_one({"_id": ObjectId(transaction_id)}, {"$set": update_data})
+        if self.history_cache is not None:
+            self.history_cache.invalidate_transaction(transaction_id)
         return self
 
     def delete_user(self, user_id: int):
@@ -153,6 +990,8 @@ class MongoCRUD:
         """
         self.users.delete_one({"id": user_id})
         self.transactions.delete_many({"user_id": user_id})
+        if self.history_cache is not None:
+            self.history_cache.invalidate(user_id)
         return self
 
     def delete_transaction(self, transaction_id: str):
@@ -165,4 +1004,104 @@ class MongoCRUD:
             MongoCRUD: self for chaining
         """
         self.transactions.delete_one({"_id": ObjectId(transaction_id)})
+        if self.history_cache is not None:
+            self.history_cache.invalidate_transaction(transaction_id)
         return self
+
+    def get_user_ids_with_transactions(self) -> list:
+        """Get the IDs of every user that has stored transactions
+
+        Returns:
+            list: Distinct user IDs
+        """
+        return self.transactions.distinct("user_id")
+
+    def iter_user_transaction_sizes(self, user_id: int) -> Cursor:
+        """Iterate over a user's transactions newest first, sizes only
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            Cursor: Documents with _id, timestamp, size and image_digest
+        """
+        return self.transactions.find(
+            {"user_id": user_id},
+            projection={"_id": 1, "timestamp": 1, "size": 1, "image_digest": 1}
+        ).sort([("timestamp", -1), ("_id", -1)])
+
+    def delete_transactions(self, transaction_ids: list) -> int:
+        """Delete several transactions in one round trip
+
+        Args:
+            transaction_ids (list): ObjectIds of the transactions to delete
+
+        Returns:
+            int: Number of deleted transactions
+        """
+        if not transaction_ids:
+            return 0
+        result = self.transactions.delete_many({"_id": {"$in": list(transaction_ids)}})
+        if self.history_cache is not None:
+            for transaction_id in transaction_ids:
+                self.history_cache.invalidate_transaction(transaction_id)
+        return result.deleted_count
+
+    def delete_orphan_blobs(self, older_than: datetime) -> int:
+        """Delete blobs no transaction references, stored before older_than
+
+        Sweeps the whole blob collection, so blobs of transactions expired
+        by the TTL index or removed with their user are collected too.
+        Blobs stored (or stored again) after ``older_than`` are kept: their
+        transaction may still be on its way to the database.
+
+        Args:
+            older_than (datetime): Only blobs whose created_at is not later
+                are deleted
+
+        Returns:
+            int: Number of deleted blobs
+        """
+        self.flush()
+        deleted = 0
+        stale = {"created_at": {"$lte": older_than}}
+        for blob in self.blobs.find(stale, {"_id": 1}):
+            digest = blob["_id"]
+            if self.transactions.find_one({"image_digest": digest}, {"_id": 1}) is None:
+                # Matches nothing if insert_blob refreshed it in the meantime
+                deleted += self.blobs.delete_one(dict(stale, _id=digest)).deleted_count
+        return deleted
+
+
+def main() -> int:
+    """Database maintenance command line"""
+    parser = argparse.ArgumentParser(
+        description='SyncClipboard database maintenance'
+    )
+    parser.add_argument(
+        'command',
+        choices=['ensure-indexes', 'check-indexes'],
+        help='ensure-indexes: create missing indexes; '
+             'check-indexes: fail if a query method is not index-backed'
+    )
+    args = parser.parse_args()
+
+    # Both commands inspect or create the indexes themselves
+    os.environ['MONGODB_ENSURE_INDEXES'] = 'false'
+    db = storage_from_env()
+    if args.command == 'ensure-indexes':
+        db.ensure_indexes()
+        print('Indexes are up to date')
+        return 0
+
+    unindexed = db.check_query_plans()
+    for name, stages in unindexed.items():
+        print(f"NOT INDEXED  {name}: {' -> '.join(stages)}")
+    if unindexed:
+        return 1
+    print('All query methods are index-backed')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+# Rough per-entry bookkeeping cost added to the payload size
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def estimate_transaction_bytes(transaction: dict) -> int:
+    """Estimate the memory held by a cached transaction
+
+    Args:
+        transaction (dict): The transaction document
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    content = transaction.get('content')
+    image_data = transaction.get('image_data')
+    return (
+        ENTRY_OVERHEAD_BYTES
+        + (len(content) if isinstance(content, (str, bytes)) else 0)
+        + (len(image_data) if isinstance(image_data, (str, bytes)) else 0)
+    )
+
+
+class _UserHistory:
+    """Cached newest-first transactions of one user"""
+
+    def __init__(self, transactions: list, complete: bool) -> None:
+        self.transactions = transactions
+        # True when the user has no older transactions than the cached ones
+        self.complete = complete
+        self.size = sum(estimate_transaction_bytes(t) for t in transactions)
+
+
+class HistoryCache:
+    """Bounded LRU cache of each user's most recent transactions
+
+    Holds up to ``depth`` newest transactions for at most ``max_users``
+    users and ``max_bytes`` in total, evicting least recently used users.
+    """
+
+    def __init__(
+        self,
+        max_users: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        depth: int = 50
+    ) -> None:
+        """Initialize the cache
+
+        Args:
+            max_users (int): Maximum number of users kept
+            max_bytes (int): Maximum estimated size of all cached entries
+            depth (int): Number of newest transactions kept per user
+        """
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.depth = depth
+
+        self._users: 'OrderedDict[int, _UserHistory]' = OrderedDict()
+        # Transaction ID (as a string) -> user ID, for invalidation by ID
+        self._owners: dict = {}
+        # Users being loaded from the database -> True once a write raced the load
+        self._loading: dict = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int, n: int) -> Optional[list]:
+        """Get the newest n transactions of a user if they are cached
+
+        Args:
+            user_id (int): The user's ID
+            n (int): Number of transactions wanted
+
+        Returns:
+            Optional[list]: Newest-first transactions, or None on a miss
+        """
+        with self._lock:
+            history = self._users.get(user_id)
+            if history is None or (n > len(history.transactions) and not history.complete):
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return history.transactions[:n]
+
+    def begin_load(self, user_id: int) -> None:
+        """Mark the start of a database read that will be passed to put()
+
+        Writes for the user between begin_load() and put() make put() discard
+        the (possibly stale) result.
+
+        Args:
+            user_id (int): The user's ID
+        """
+        with self._lock:
+            self._loading.setdefault(user_id, False)
+
+    def put(self, user_id: int, transactions: list) -> None:
+        """Cache a user's newest transactions as loaded from the database
+
+        Args:
+            user_id (int): The user's ID
+            transactions (list): Newest-first transactions, as returned by a
+                query limited to ``depth`` entries
+        """
+        with self._lock:
+            if self._loading.pop(user_id, False):
+                return
+            self._remove(user_id)
+            history = _UserHistory(
+                list(transactions[:self.depth]),
+                complete=len(transactions) < self.depth
+            )
+            self._users[user_id] = history
+            self._size += history.size
+            for trans in history.transactions:
+                self._owners[str(trans.get('_id'))] = user_id
+            self._evict()
+
+    def push(self, user_id: int, transaction: dict) -> None:
+        """Add a newly written transaction to a cached user
+
+        Users that are not cached are left alone: their next read loads
+        the history from the database.
+
+        Args:
+            user_id (int): The user's ID
+            transaction (dict): The new transaction
+        """
+        with self._lock:
+            if user_id in self._loading:
+                self._loading[user_id] = True
+            history = self._users.get(user_id)
+            if history is None:
+                return
+            history.transactions.insert(0, transaction)
+            size = estimate_transaction_bytes(transaction)
+            history.size += size
+            self._size += size
+            self._owners[str(transaction.get('_id'))] = user_id
+
+            while len(history.transactions) > self.depth:
+                dropped = history.transactions.pop()
+                dropped_size = estimate_transaction_bytes(dropped)
+                history.size -= dropped_size
+                self._size -= dropped_size
+                self._owners.pop(str(dropped.get('_id')), None)
+                history.complete = False
+            self._evict()
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop everything cached for a user
+
+        Args:
+            user_id (int): The user's ID
+        """
+        with self._lock:
+            self._remove(user_id)
+
+    def invalidate_transaction(self, transaction_id) -> None:
+        """Drop the cached history holding a given transaction
+
+        Args:
+            transaction_id: The transaction's ID (ObjectId or string)
+        """
+        with self._lock:
+            user_id = self._owners.get(str(transaction_id))
+            if user_id is not None:
+                self._remove(user_id)
+
+    def stats(self) -> dict:
+        """Get cache counters
+
+        Returns:
+            dict: hits, misses, evictions, users and bytes
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'users': len(self._users),
+                'bytes': self._size
+            }
+
+    def _remove(self, user_id: int) -> None:
+        """Remove a user (caller holds the lock)"""
+        if user_id in self._loading:
+            self._loading[user_id] = True
+        history = self._users.pop(user_id, None)
+        if history is None:
+            return
+        self._size -= history.size
+        for trans in history.transactions:
+            self._owners.pop(str(trans.get('_id')), None)
+
+    def _evict(self) -> None:
+        """Evict least recently used users until within limits (caller holds the lock)"""
+        while self._users and (
+            len(self._users) > self.max_users or self._size > self.max_bytes
+        ):
+            user_id = next(iter(self._users))
+            self._remove(user_id)
+            self.evictions += 1
@@ -2,11 +2,13 @@
 """
 Main client application that combines clipboard monitoring with server sync
 """
+import os
 import sys
 import argparse
 from client import Client
 from clipboard_observer import ServerClipboardObserver
 from websocket_client import WebSocketClipboardClient
+from tracing import TRACER
 import threading
 
 
@@ -26,6 +28,51 @@ def main():
         default='http://localhost:5000',
         help='Server URL (default: http://localhost:5000)'
     )
+    parser.add_argument(
+        '--no-watch',
+        action='store_true',
+        help='Only read the clipboard on Ctrl+C instead of watching for changes'
+    )
+
+    parser.add_argument(
+        '--history-size',
+        type=int,
+        default=100,
+        help='Copies and pastes kept in local history (default: 100)'
+    )
+    parser.add_argument(
+        '--history-mb',
+        type=int,
+        default=32,
+        help='Memory used by each local history, in MiB (default: 32)'
+    )
+    parser.add_argument(
+        '--spill-dir',
+        type=str,
+        default=None,
+        help='Move older images of the local history to this directory '
+             'instead of dropping them'
+    )
+
+    parser.add_argument(
+        '--outbox',
+        type=str,
+        default=os.path.join(os.path.expanduser('~'), '.syncclipboard', 'outbox.db'),
+        help='File keeping clips until the server has them, so copies made '
+             'offline are sent later (default: ~/.syncclipboard/outbox.db)'
+    )
+    parser.add_argument(
+        '--no-outbox',
+        action='store_true',
+        help='Keep unsent clips in memory only'
+    )
+    parser.add_argument(
+        '--trace-file',
+        type=str,
+        default=None,
+        help='Append per-stage timings of each synced clip to this JSON lines '
+             'file (summarize with: python tracing.py summarize FILE...)'
+    )
 
     args = parser.parse_args()
 
@@ -33,15 +80,35 @@ def main():
     print(f"Connecting to server: {args.server}")
     print("Press Esc to stop the client\n")
 
+    if args.trace_file:
+        TRACER.configure(args.trace_file)
+
     # Create client instance
-    client = Client(user_id=args.user_id)
+    client = Client(
+        user_id=args.user_id,
+        history_size=args.history_size,
+        history_bytes=args.history_mb * 1024 * 1024,
+        spill_dir=args.spill_dir
+    )
 
     # Attach server observer to send updates
-    server_observer = ServerClipboardObserver(args.server)
+    server_observer = ServerClipboardObserver(
+        args.server,
+        outbox_path=None if args.no_outbox else args.outbox,
+        deduplicator=client.deduplicator
+    )
     client.attach(server_observer)
 
-    # Start WebSocket client to receive updates from server
-    ws_client = WebSocketClipboardClient(args.server, args.user_id)
+    # Report every copy (keyboard, mouse or menus) from clipboard changes
+    watcher = None if args.no_watch else client.start_watching()
+
+    # Start WebSocket client to receive updates from server; updates it
+    # applies are remembered by the client so they are not sent back
+    ws_client = WebSocketClipboardClient(
+        args.server,
+        args.user_id,
+        before_copy=client.remember_remote
+    )
 
     # Connect to WebSocket in a separate thread
     ws_thread = threading.Thread(target=ws_client.connect)
@@ -49,7 +116,10 @@ def main():
     ws_thread.start()
 
     print("Client is running. Monitor your clipboard!")
-    print("- Copy text (Ctrl+C) to sync to server")
+    if watcher:
+        print(f"- Copy anything to sync to server (watching: {watcher.mode})")
+    else:
+        print("- Copy text (Ctrl+C) to sync to server")
     print("- Paste text (Ctrl+V) to paste from local buffer")
     print("- Press Esc to quit\n")
 
@@ -59,7 +129,10 @@ def main():
     except KeyboardInterrupt:
         print("\nShutting down client...")
     finally:
+        client.close()
+        server_observer.close()
         ws_client.disconnect()
+        TRACER.close()
         print("Client stopped")
 
 
@@ -0,0 +1,433 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+A small self-contained registry (counters, gauges and histograms with
+labels) so the server needs no extra dependency. Recording a value costs
+a dictionary lookup and a short lock; gauges that are expensive to keep
+up to date are computed by callbacks only when /metrics is scraped.
+
+Set METRICS_ENABLED=false to turn instrumentation off: the metrics then
+ignore every update and the /metrics endpoint answers 404.
+"""
+import os
+import time
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers sub-millisecond cache hits up to slow database calls
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Clip content types used as label values; anything a client sends beyond
+# these is counted as 'other', so clients cannot create new time series
+CLIP_CONTENT_TYPES = frozenset({'text', 'image'})
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    """Base of the metric types: a family of children keyed by label values"""
+
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str,
+                 labels: Iterable[str] = ()) -> None:
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children: dict = {}
+        self._lock = threading.Lock()
+
+    def _child(self, label_values: tuple):
+        child = self._children.get(label_values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(label_values, self._new_child())
+        return child
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    @abstractmethod
+    def _new_child(self):
+        """Create the value holder of one label combination"""
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Render the exposition lines of every child"""
+
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return [0]
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Add amount to the counter of the given labels"""
+        if not self.registry.enabled:
+            return
+        child = self._child(self._key(labels))
+        with self._lock:
+            child[0] += amount
+
+    def value(self, **labels) -> float:
+        """Current value of the counter of the given labels"""
+        child = self._children.get(self._key(labels))
+        return child[0] if child else 0
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(child[0])}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, or is computed when scraped"""
+
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable[[], object]] = None
+
+    def _new_child(self):
+        return [0]
+
+    def set_function(self, function: Callable[[], object]) -> None:
+        """Compute the gauge on scrape
+
+        Args:
+            function (Callable): Returns a number, or a dict mapping label
+                value tuples to numbers
+        """
+        self._function = function
+
+    def set(self, value: float, **labels) -> None:
+        """Set the gauge of the given labels"""
+        if not self.registry.enabled:
+            return
+        self._child(self._key(labels))[0] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Add amount to the gauge of the given labels"""
+        if not self.registry.enabled:
+            return
+        child = self._child(self._key(labels))
+        with self._lock:
+            child[0] += amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        """Subtract amount from the gauge of the given labels"""
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        """Current value of the gauge of the given labels"""
+        child = self._children.get(self._key(labels))
+        return child[0] if child else 0
+
+    def samples(self) -> List[str]:
+        values: Dict[tuple, float] = {key: child[0] for key, child in list(self._children.items())}
+        if self._function is not None:
+            try:
+                computed = self._function()
+            except Exception:
+                computed = None
+            if isinstance(computed, dict):
+                values = dict(computed)
+            elif computed is not None:
+                values = {(): computed}
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        # Per-bucket counts (last one is +Inf), then sum and count
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observe(self, value: float, **labels) -> None:
+        """Record one observation for the given labels"""
+        if not self.registry.enabled:
+            return
+        child = self._child(self._key(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child[0][index] += 1
+            child[1] += value
+            child[2] += 1
+
+    def time(self, **labels) -> '_Timer':
+        """Context manager observing the duration of its block in seconds"""
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        """Number of observations of the given labels"""
+        child = self._children.get(self._key(labels))
+        return child[2] if child else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            with self._lock:
+                counts, total, count = list(child[0]), child[1], child[2]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    """Times a block into a histogram"""
+
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: Histogram, labels: dict) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self, enabled: bool = True) -> None:
+        """Initialize the registry
+
+        Args:
+            enabled (bool): When False, metric updates are ignored
+        """
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        """Get or create a counter"""
+        return self._register(Counter(self, name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Gauge:
+        """Get or create a gauge"""
+        return self._register(Gauge(self, name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        return self._register(Histogram(self, name, help_text, labels, buckets=buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format
+
+        Returns:
+            str: The exposition text
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry(
+    enabled=os.getenv('METRICS_ENABLED', 'true').lower() != 'false'
+)
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'syncclipboard_http_request_duration_seconds',
+    'HTTP request handling time by endpoint',
+    ('method', 'endpoint', 'status')
+)
+DB_OPERATION_SECONDS = REGISTRY.histogram(
+    'syncclipboard_db_operation_duration_seconds',
+    'MongoCRUD method call time',
+    ('method',)
+)
+INGESTED_BYTES = REGISTRY.counter(
+    'syncclipboard_ingested_bytes_total',
+    'Clipboard payload bytes received by the API',
+    ('content_type',)
+)
+INGESTED_CLIPS = REGISTRY.counter(
+    'syncclipboard_ingested_clips_total',
+    'Clipboard entries received by the API',
+    ('content_type',)
+)
+BROADCAST_BYTES = REGISTRY.counter(
+    'syncclipboard_broadcast_bytes_total',
+    'Clipboard payload bytes emitted to Socket.IO rooms (once per emit)',
+    ('event', 'content_type')
+)
+SOCKET_CONNECTIONS = REGISTRY.gauge(
+    'syncclipboard_socket_connections',
+    'Socket.IO connections open on this process'
+)
+SOCKET_ROOMS = REGISTRY.gauge(
+    'syncclipboard_socket_rooms',
+    'User rooms with at least one client on this process'
+)
+EMIT_QUEUE_DEPTH = REGISTRY.gauge(
+    'syncclipboard_emit_queue_depth',
+    'Packets waiting in the send queues of this process'
+)
+WRITE_BEHIND_DEPTH = REGISTRY.gauge(
+    'syncclipboard_write_behind_depth',
+    'Transactions buffered by write-behind and not yet written'
+)
+MONGO_POOL_CONNECTIONS = REGISTRY.gauge(
+    'syncclipboard_mongo_pool_connections',
+    'Connections open in the MongoDB pool of each server',
+    ('address',)
+)
+MONGO_POOL_CHECKED_OUT = REGISTRY.gauge(
+    'syncclipboard_mongo_pool_checked_out',
+    'MongoDB connections currently used by an operation',
+    ('address',)
+)
+MONGO_POOL_MAX_SIZE = REGISTRY.gauge(
+    'syncclipboard_mongo_pool_max_size',
+    'Largest number of connections the MongoDB pool may open',
+    ('address',)
+)
+MONGO_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    'syncclipboard_mongo_pool_wait_seconds',
+    'Time operations waited for a MongoDB connection',
+    ('address',)
+)
+MONGO_POOL_CHECKOUT_FAILURES = REGISTRY.counter(
+    'syncclipboard_mongo_pool_checkout_failures_total',
+    'Operations that got no MongoDB connection (timeout, error, closed pool)',
+    ('address', 'reason')
+)
+
+
+def instrument(obj, names: Iterable[str], histogram: Histogram = DB_OPERATION_SECONDS) -> None:
+    """Time calls to methods of an object
+
+    Each method is replaced on the instance by a wrapper observing its
+    duration with ``method=<name>``; the class is left untouched.
+
+    Args:
+        obj: The instance
+        names (Iterable[str]): Method names
+        histogram (Histogram): Where durations are recorded
+    """
+    for name in names:
+        setattr(obj, name, _timed(getattr(obj, name), name, histogram))
+
+
+def _timed(method: Callable, name: str, histogram: Histogram) -> Callable:
+    """Wrap a bound method so its calls are observed in a histogram"""
+    @wraps(method)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start, method=name)
+    return timed
+
+
+def _content_type_label(content_type) -> str:
+    if isinstance(content_type, str) and content_type in CLIP_CONTENT_TYPES:
+        return content_type
+    return 'other'
+
+
+def record_ingest(content_type: str, size: int) -> None:
+    """Count one clipboard entry received by the API"""
+    content_type = _content_type_label(content_type)
+    INGESTED_CLIPS.inc(content_type=content_type)
+    INGESTED_BYTES.inc(size, content_type=content_type)
+
+
+def record_broadcast(event: str, payload: dict) -> None:
+    """Count the payload bytes of a clipboard event emitted to a room
+
+    Text is measured in characters like record_ingest does, which is exact
+    for the ASCII base64 image data and avoids encoding a copy of
+    multi-megabyte payloads on every emit.
+    """
+    if not REGISTRY.enabled:
+        return
+    for entry in payload.get('entries') or [payload]:
+        content_type = _content_type_label(entry.get('content_type', 'text'))
+        size = 0
+        for field in ('content', 'image_data'):
+            value = entry.get(field)
+            if isinstance(value, (str, bytes, bytearray)):
+                size += len(value)
+        BROADCAST_BYTES.inc(size, event=event, content_type=content_type)
+
+
+def watch_socketio_server(server) -> None:
+    """Compute room count and send queue depth of a python-socketio server
+    on scrape
+
+    Args:
+        server: socketio.Server or socketio.AsyncServer
+    """
+    def rooms():
+        namespace = server.manager.rooms.get('/', {})
+        sids = namespace.get(None, {})
+        # Every client also has a room named after its sid
+        return sum(1 for room in namespace if room is not None and room not in sids)
+
+    def queue_depth():
+        return sum(
+            socket.queue.qsize() for socket in list(server.eio.sockets.values())
+        )
+
+    SOCKET_ROOMS.set_function(rooms)
+    EMIT_QUEUE_DEPTH.set_function(queue_depth)
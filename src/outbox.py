@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+from clip_object import ClipObject
+
+
+class ClipOutbox:
+    """Durable SQLite store of clips waiting for upload
+
+    Used as the store of an UploadQueue: every copied clip is recorded
+    before any network call and removed once the server acknowledged it,
+    so clips copied while offline (or before a crash) are replayed later.
+    Adding a clip drops waiting clips of the same user and content, and
+    the oldest ones once ``max_entries`` or ``max_bytes`` is exceeded.
+    """
+
+    # Waiting clips survive restarts
+    durable = True
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 1000,
+        max_bytes: int = 256 * 1024 * 1024
+    ) -> None:
+        """Open (or create) the outbox database
+
+        Args:
+            path (str): SQLite database file
+            max_entries (int): Maximum number of waiting clips
+            max_bytes (int): Maximum total payload size of waiting clips
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            # Must be set before the first table is created to take effect
+            self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id INTEGER NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " content_type TEXT NOT NULL,"
+                " content TEXT,"
+                " image BLOB,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " trace_id TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS outbox_user_hash"
+                " ON outbox (user_id, content_hash)"
+            )
+
+    def add(self, user_id: int, clip_obj: ClipObject, in_flight=()) -> int:
+        """Record a clip
+
+        Args:
+            user_id (int): The user ID who made the change
+            clip_obj (ClipObject): The clip
+            in_flight: IDs of clips being uploaded, never superseded
+
+        Returns:
+            int: Number of waiting clips it superseded
+        """
+        image = clip_obj.get_image_bytes() if clip_obj.is_image() else None
+        content = clip_obj.get_content() or ''
+        size = len(content.encode('utf-8')) + len(image or b'')
+        content_hash = clip_obj.get_content_hash()
+        keep = ','.join(str(int(entry_id)) for entry_id in in_flight)
+        not_in_flight = f" AND id NOT IN ({keep})" if keep else ""
+
+        with self._lock, self._conn:
+            superseded = self._conn.execute(
+                "DELETE FROM outbox WHERE user_id = ? AND content_hash = ?"
+                + not_in_flight,
+                (user_id, content_hash)
+            ).rowcount
+            self._conn.execute(
+                "INSERT INTO outbox (user_id, content_hash, content_type, content,"
+                " image, size, created_at, trace_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, content_hash, clip_obj.get_content_type(), content,
+                 image, size, time.time(), clip_obj.trace_id)
+            )
+            superseded += self._enforce_limits(not_in_flight)
+        return superseded
+
+    def _enforce_limits(self, not_in_flight: str) -> int:
+        """Delete the oldest waiting clips over the limits (caller holds the lock)"""
+        deleted = 0
+        while True:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outbox"
+            ).fetchone()
+            if count <= 1 or (count <= self.max_entries and total <= self.max_bytes):
+                return deleted
+            oldest = self._conn.execute(
+                "SELECT id FROM outbox WHERE id < (SELECT MAX(id) FROM outbox)"
+                + not_in_flight + " ORDER BY id LIMIT 1"
+            ).fetchone()
+            if oldest is None:
+                return deleted
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", oldest)
+            deleted += 1
+
+    def peek(self, limit: int) -> List[tuple]:
+        """Get the oldest waiting clips without removing them
+
+        Args:
+            limit (int): Maximum number of clips
+
+        Returns:
+            List[tuple]: (entry_id, user_id, clip) tuples, oldest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, user_id, content_type, content, image, trace_id FROM outbox"
+                " ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+        entries = []
+        for entry_id, user_id, content_type, content, image, trace_id in rows:
+            if content_type == 'image' and image is not None:
+                clip_obj = ClipObject.from_image_bytes(bytes(image))
+                clip_obj.content = content
+            else:
+                clip_obj = ClipObject(content=content, content_type=content_type)
+            clip_obj.trace_id = trace_id
+            entries.append((entry_id, user_id, clip_obj))
+        return entries
+
+    def remove(self, entry_ids: List[int]) -> None:
+        """Remove clips the server acknowledged (or rejected)
+
+        Args:
+            entry_ids (List[int]): IDs returned by peek
+        """
+        if not entry_ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM outbox WHERE id = ?", [(entry_id,) for entry_id in entry_ids]
+            )
+            # Give the pages of sent payloads back to the file system
+            self._conn.execute("PRAGMA incremental_vacuum")
+
+    def size_bytes(self) -> int:
+        """Get the total payload size of waiting clips
+
+        Returns:
+            int: Size in bytes
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM outbox"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database"""
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
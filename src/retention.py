@@ -0,0 +1,212 @@
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from storage import ClipboardStorage
+
+# Seconds an unreferenced blob is kept after it was last stored: an upload
+# stores its blob before the transaction referencing it
+BLOB_GRACE_PERIOD = 3600
+
+
+class RetentionPolicy:
+    """Limits on how much clipboard history is kept per user"""
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_age: Optional[float] = None,
+        max_bytes: Optional[int] = None
+    ) -> None:
+        """Initialize a retention policy (None disables a limit)
+
+        Args:
+            max_entries (Optional[int]): Keep at most this many newest entries
+            max_age (Optional[float]): Drop entries older than this many seconds
+            max_bytes (Optional[int]): Keep the newest entries whose sizes add
+                up to at most this many bytes
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def is_enabled(self) -> bool:
+        """Check if the policy limits anything
+
+        Returns:
+            bool: True if at least one limit is set
+        """
+        return any(
+            limit is not None
+            for limit in (self.max_entries, self.max_age, self.max_bytes)
+        )
+
+    @staticmethod
+    def from_env() -> 'RetentionPolicy':
+        """Build a policy from RETENTION_* environment variables
+
+        Returns:
+            RetentionPolicy: Policy from RETENTION_MAX_ENTRIES,
+                RETENTION_MAX_AGE_DAYS and RETENTION_MAX_BYTES
+        """
+        max_entries = os.getenv('RETENTION_MAX_ENTRIES')
+        max_age_days = os.getenv('RETENTION_MAX_AGE_DAYS')
+        max_bytes = os.getenv('RETENTION_MAX_BYTES')
+        return RetentionPolicy(
+            max_entries=int(max_entries) if max_entries else None,
+            max_age=float(max_age_days) * 86400 if max_age_days else None,
+            max_bytes=int(max_bytes) if max_bytes else None
+        )
+
+
+class HistoryCompactor:
+    """Background job deleting history that falls outside a retention policy"""
+
+    def __init__(
+        self,
+        db: 'ClipboardStorage',
+        policy: RetentionPolicy,
+        interval: float = 3600,
+        batch_size: int = 500,
+        blob_grace: float = BLOB_GRACE_PERIOD
+    ) -> None:
+        """Initialize the compactor
+
+        Args:
+            db (ClipboardStorage): Database to compact
+            policy (RetentionPolicy): Limits to enforce
+            interval (float): Seconds between two compaction passes
+            batch_size (int): Maximum transactions removed per delete call
+            blob_grace (float): Seconds before an unreferenced blob is deleted
+        """
+        self.db = db
+        self.policy = policy
+        self.interval = interval
+        self.batch_size = batch_size
+        self.blob_grace = blob_grace
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def compact_user(self, user_id: int, now: Optional[float] = None) -> int:
+        """Apply the retention policy to one user's history
+
+        Args:
+            user_id (int): The user's ID
+            now (Optional[float]): Reference time for max_age (defaults to now)
+
+        Returns:
+            int: Number of deleted transactions
+        """
+        now = time.time() if now is None else now
+        policy = self.policy
+        kept = 0
+        kept_bytes = 0
+        deleted = 0
+        batch = []
+
+        for trans in self.db.iter_user_transaction_sizes(user_id):
+            size = trans.get('size') or 0
+            expired = (
+                (policy.max_entries is not None and kept >= policy.max_entries)
+                or (policy.max_age is not None
+                    and trans.get('timestamp', now) < now - policy.max_age)
+                or (policy.max_bytes is not None
+                    and kept_bytes + size > policy.max_bytes)
+            )
+            if not expired:
+                kept += 1
+                kept_bytes += size
+                continue
+
+            batch.append(trans['_id'])
+            if len(batch) >= self.batch_size:
+                deleted += self.db.delete_transactions(batch)
+                batch = []
+
+        deleted += self.db.delete_transactions(batch)
+        return deleted
+
+    def compact_all(self) -> int:
+        """Apply the retention policy to every user, then delete the image
+        blobs no transaction references any more
+
+        The blob sweep also covers transactions expired by a TTL index or
+        deleted with their user.
+
+        Returns:
+            int: Number of deleted transactions
+        """
+        if not self.policy.is_enabled():
+            return 0
+        now = time.time()
+        deleted = 0
+        for user_id in self.db.get_user_ids_with_transactions():
+            if self._stop.is_set():
+                break
+            deleted += self.compact_user(user_id, now=now)
+        if not self._stop.is_set():
+            self.db.delete_orphan_blobs(
+                datetime.fromtimestamp(now - self.blob_grace, timezone.utc)
+            )
+        return deleted
+
+    def _run(self) -> None:
+        """Compaction loop run by the background thread"""
+        while not self._stop.is_set():
+            try:
+                deleted = self.compact_all()
+                if deleted:
+                    print(f"Retention: deleted {deleted} clipboard entries")
+            except Exception as e:
+                print(f"Error compacting clipboard history: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """Start compacting in a background thread"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def start_compactor_from_env(db: 'ClipboardStorage') -> Optional[HistoryCompactor]:
+    """Start history compaction when RETENTION_* limits are configured
+
+    RETENTION_INTERVAL_S sets the time between passes and
+    RETENTION_USE_TTL=true additionally lets MongoDB expire entries by age
+    (the SQLite backend has no TTL and relies on the compactor).
+
+    Args:
+        db (ClipboardStorage): Database to compact
+
+    Returns:
+        Optional[HistoryCompactor]: The running compactor, or None if no
+            limit is configured
+    """
+    policy = RetentionPolicy.from_env()
+    if not policy.is_enabled():
+        return None
+
+    # Let MongoDB expire old entries itself; the compactor still enforces
+    # the count and byte limits (and the age of entries without created_at)
+    # and deletes the blobs of expired entries
+    if policy.max_age and os.getenv('RETENTION_USE_TTL', 'false').lower() == 'true':
+        db.ensure_ttl_index(policy.max_age)
+
+    compactor = HistoryCompactor(
+        db,
+        policy,
+        interval=float(os.getenv('RETENTION_INTERVAL_S', '3600'))
+    )
+    compactor.start()
+    return compactor
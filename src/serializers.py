@@ -0,0 +1,86 @@
+from typing import List
+
+from clip_object import ClipObject
+from tracing import clean_trace_id
+
+
+def serialize_transaction(trans: dict) -> dict:
+    """Convert a stored transaction into its full API representation
+
+    Args:
+        trans (dict): The stored transaction
+
+    Returns:
+        dict: JSON-serializable entry
+    """
+    return {
+        'id': str(trans['_id']) if '_id' in trans else None,
+        'seq': trans.get('seq'),
+        'content': trans.get('content'),
+        'content_type': trans.get('content_type', 'text'),
+        'image_digest': trans.get('image_digest'),
+        # Only entries stored before the blob store carry inline data
+        'image_data': trans.get('image_data'),
+        'size': trans.get('size'),
+        'timestamp': trans.get('timestamp'),
+        'trace_id': trans.get('trace_id')
+    }
+
+
+def serialize_transaction_metadata(trans: dict) -> dict:
+    """Convert a metadata-only transaction into its API representation
+
+    Args:
+        trans (dict): The metadata-only transaction
+
+    Returns:
+        dict: JSON-serializable entry without payload
+    """
+    return {
+        'id': str(trans['_id']) if '_id' in trans else None,
+        'seq': trans.get('seq'),
+        'content_type': trans.get('content_type', 'text'),
+        'image_digest': trans.get('image_digest'),
+        'size': trans.get('size'),
+        'preview': trans.get('preview'),
+        'truncated': bool(trans.get('truncated')),
+        'timestamp': trans.get('timestamp')
+    }
+
+
+def parse_clip_batch(data: dict, limit: int) -> List[ClipObject]:
+    """Convert a batch upload body into clipboard objects
+
+    Args:
+        data (dict): Request body, ``{"clips": [{"content", "content_type",
+            "image_data", "trace_id"}, ...]}`` with the clips oldest first
+        limit (int): Maximum number of clips accepted
+
+    Raises:
+        ValueError: If the batch is empty, too large or has an invalid clip
+
+    Returns:
+        List[ClipObject]: The clips, in upload order
+    """
+    clips = data.get('clips') if isinstance(data, dict) else None
+    if not isinstance(clips, list) or not clips:
+        raise ValueError('Missing clips')
+    if len(clips) > limit:
+        raise ValueError(f'Too many clips (at most {limit} per batch)')
+
+    objs = []
+    for index, clip in enumerate(clips):
+        if not isinstance(clip, dict) or not clip.get('content'):
+            raise ValueError(f'Missing content in clip {index}')
+        content_type = clip.get('content_type', 'text')
+        if content_type not in ('text', 'image'):
+            raise ValueError(f'Invalid content_type in clip {index}')
+        if content_type == 'image' and not clip.get('image_data'):
+            raise ValueError(f'Missing image_data in clip {index}')
+        objs.append(ClipObject(
+            content=clip['content'],
+            content_type=content_type,
+            image_data=clip.get('image_data'),
+            trace_id=clean_trace_id(clip.get('trace_id'))
+        ))
+    return objs
@@ -0,0 +1,424 @@
+"""
+Message-queue backends letting several server processes share Socket.IO rooms.
+
+With a client manager in place, an emit to a user's room made by any server
+process reaches clients connected to every other process. Supported URLs:
+
+- ``redis://`` / ``rediss://``: Redis pub/sub (needs the ``redis`` package)
+- ``amqp://`` and other kombu URLs: RabbitMQ etc. (needs ``kombu``, or
+  ``aio_pika`` for the asyncio server)
+- ``local://host:port``: LocalBroker, a small fan-out broker over loopback
+  sockets for tests and single-host deployments without external services.
+  Every process must share the secret in SOCKETIO_BROKER_AUTHKEY.
+
+UserRooms names the room(s) of each user: clients that can decode
+compressed payloads join ``<user_id>:<encoding>`` instead of ``<user_id>``.
+"""
+import os
+import json
+import base64
+import asyncio
+import threading
+from multiprocessing.connection import Listener, Client
+from typing import Iterable, List, Optional, Tuple
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from clip_compression import DEFAULT_THRESHOLD, available_encodings, encode_event, negotiate
+
+
+DEFAULT_CHANNEL = 'syncclipboard'
+
+# First message of a LocalBroker connection, sent as raw bytes like the
+# data messages so the broker never unpickles anything
+ROLE_PUBLISH = b'publish'
+ROLE_SUBSCRIBE = b'subscribe'
+
+
+def broker_authkey() -> bytes:
+    """Get the LocalBroker shared secret from SOCKETIO_BROKER_AUTHKEY
+
+    There is no default: a key known to everyone would let anyone who can
+    reach the broker publish events to every user.
+
+    Raises:
+        ValueError: If the variable is not set
+
+    Returns:
+        bytes: The secret
+    """
+    authkey = os.getenv('SOCKETIO_BROKER_AUTHKEY')
+    if not authkey:
+        raise ValueError("SOCKETIO_BROKER_AUTHKEY must be set to use the local message broker")
+    return authkey.encode('utf-8')
+
+
+def _tag(value):
+    """Make bytes and tuples JSON-serializable, see encode_message"""
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, tuple):
+        return {'__tuple__': [_tag(item) for item in value]}
+    if isinstance(value, list):
+        return [_tag(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _tag(item) for key, item in value.items()}
+    return value
+
+
+def _untag(obj: dict):
+    if '__bytes__' in obj and len(obj) == 1:
+        return base64.b64decode(obj['__bytes__'])
+    if '__tuple__' in obj and len(obj) == 1:
+        return tuple(obj['__tuple__'])
+    return obj
+
+
+def encode_message(message) -> bytes:
+    """Serialize a pub/sub message for the LocalBroker
+
+    JSON rather than pickle, so a message can never run code where it is
+    read; bytes (compressed payloads) and tuples are tagged to survive.
+
+    Args:
+        message: JSON-compatible value, possibly holding bytes and tuples
+
+    Returns:
+        bytes: The encoded message
+    """
+    return json.dumps(_tag(message)).encode('utf-8')
+
+
+def decode_message(raw: bytes):
+    """Deserialize a message written by encode_message"""
+    return json.loads(raw, object_hook=_untag)
+
+
+def parse_local_url(url: str) -> Tuple[str, int]:
+    """Parse a ``local://host:port`` URL
+
+    Args:
+        url (str): The URL
+
+    Raises:
+        ValueError: If the URL has no host or port
+
+    Returns:
+        Tuple[str, int]: Broker address
+    """
+    host, _, port = url[len('local://'):].rstrip('/').rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid local message queue URL: {url!r}")
+    return host, int(port)
+
+
+class LocalBroker:
+    """Fan-out broker relaying every published message to all subscribers
+
+    Publishers and subscribers connect with multiprocessing.connection; the
+    first message on a connection says which role it takes.
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ('127.0.0.1', 0),
+        authkey: Optional[bytes] = None
+    ) -> None:
+        """Initialize the broker and bind its listening socket
+
+        Args:
+            address (Tuple[str, int]): Address to listen on (port 0 picks one)
+            authkey (Optional[bytes]): Shared secret required from connecting
+                processes (default: broker_authkey())
+        """
+        self._listener = Listener(address, authkey=authkey or broker_authkey())
+        self._subscribers: list = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """Address the broker listens on"""
+        return self._listener.address
+
+    @property
+    def url(self) -> str:
+        """``local://`` URL for create_client_manager"""
+        host, port = self.address
+        return f"local://{host}:{port}"
+
+    def start(self) -> 'LocalBroker':
+        """Accept connections in a background thread
+
+        Returns:
+            LocalBroker: self for chaining
+        """
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Accept connections in the calling thread"""
+        self._accept_loop()
+
+    def close(self) -> None:
+        """Stop accepting connections and drop subscribers"""
+        self._closed = True
+        self._listener.close()
+        with self._lock:
+            for conn in self._subscribers:
+                conn.close()
+            self._subscribers.clear()
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._closed:
+                    return
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn) -> None:
+        try:
+            role = conn.recv_bytes(maxlength=16)
+            if role == ROLE_SUBSCRIBE:
+                with self._lock:
+                    self._subscribers.append(conn)
+                return
+            if role != ROLE_PUBLISH:
+                conn.close()
+                return
+            while True:
+                self._fan_out(conn.recv_bytes())
+        except (EOFError, OSError):
+            conn.close()
+
+    def _fan_out(self, message: bytes) -> None:
+        with self._lock:
+            for conn in list(self._subscribers):
+                try:
+                    conn.send_bytes(message)
+                except OSError:
+                    self._subscribers.remove(conn)
+
+
+class _LocalBrokerClient:
+    """Publisher and subscriber connections to a LocalBroker"""
+
+    def __init__(self, url: str, authkey: Optional[bytes]) -> None:
+        self.address = parse_local_url(url)
+        self.authkey = authkey or broker_authkey()
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def publish(self, message: bytes) -> None:
+        with self._publish_lock:
+            if self._publisher is None:
+                self._publisher = Client(self.address, authkey=self.authkey)
+                self._publisher.send_bytes(ROLE_PUBLISH)
+            try:
+                self._publisher.send_bytes(message)
+            except OSError:
+                self._publisher = None
+                raise
+
+    def subscribe(self):
+        conn = Client(self.address, authkey=self.authkey)
+        conn.send_bytes(ROLE_SUBSCRIBE)
+        return conn
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    """Socket.IO client manager backed by a LocalBroker"""
+
+    name = 'local'
+
+    def __init__(
+        self,
+        url: str,
+        channel: str = DEFAULT_CHANNEL,
+        write_only: bool = False,
+        logger=None,
+        authkey: Optional[bytes] = None
+    ) -> None:
+        """Initialize the manager
+
+        Args:
+            url (str): Broker URL, ``local://host:port``
+            channel (str): Only messages of this channel are delivered
+            write_only (bool): Publish without listening (external emitters)
+            logger: Logger passed to the base manager
+            authkey (Optional[bytes]): Broker shared secret (default:
+                broker_authkey())
+        """
+        self._broker = _LocalBrokerClient(url, authkey)
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _publish(self, data):
+        self._broker.publish(encode_message({'channel': self.channel, 'data': data}))
+
+    def _listen(self):
+        conn = self._broker.subscribe()
+        while True:
+            message = decode_message(conn.recv_bytes())
+            if message.get('channel') == self.channel:
+                yield message['data']
+
+
+class AsyncLocalPubSubManager(AsyncPubSubManager):
+    """Asyncio Socket.IO client manager backed by a LocalBroker"""
+
+    name = 'asynclocal'
+
+    def __init__(
+        self,
+        url: str,
+        channel: str = DEFAULT_CHANNEL,
+        write_only: bool = False,
+        logger=None,
+        authkey: Optional[bytes] = None
+    ) -> None:
+        """Initialize the manager (same arguments as LocalPubSubManager)"""
+        self._broker = _LocalBrokerClient(url, authkey)
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    async def _publish(self, data):
+        message = encode_message({'channel': self.channel, 'data': data})
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._broker.publish, message
+        )
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(None, self._broker.subscribe)
+        while True:
+            raw = await loop.run_in_executor(None, conn.recv_bytes)
+            message = decode_message(raw)
+            if message.get('channel') == self.channel:
+                yield message['data']
+
+
+def create_client_manager(
+    url: Optional[str],
+    channel: str = DEFAULT_CHANNEL,
+    asyncio_server: bool = False
+):
+    """Create the Socket.IO client manager for a message queue URL
+
+    Args:
+        url (Optional[str]): Message queue URL, or None/empty for a
+            single-process server
+        channel (str): Pub/sub channel shared by the server processes
+        asyncio_server (bool): Build a manager for socketio.AsyncServer
+
+    Returns:
+        The client manager, or None to use the in-process default
+    """
+    if not url:
+        return None
+    if url.startswith('local://'):
+        manager_class = AsyncLocalPubSubManager if asyncio_server else LocalPubSubManager
+    elif url.startswith(('redis://', 'rediss://')):
+        manager_class = socketio.AsyncRedisManager if asyncio_server else socketio.RedisManager
+    else:
+        manager_class = socketio.AsyncAioPikaManager if asyncio_server else socketio.KombuManager
+    return manager_class(url, channel=channel)
+
+
+class UserRooms:
+    """Rooms a user's clients join, grouped by payload encoding
+
+    Every client of a user is in exactly one of the user's rooms, so an
+    event is emitted once per distinct payload: plain to ``<user_id>``
+    and compressed to ``<user_id>:<encoding>``.
+    """
+
+    def __init__(
+        self,
+        encodings: Iterable[str] = (),
+        threshold: int = DEFAULT_THRESHOLD
+    ) -> None:
+        """Initialize the room naming
+
+        Args:
+            encodings (Iterable[str]): Encodings offered to clients
+            threshold (int): Minimum text size in bytes worth compressing
+        """
+        self.encodings = list(encodings)
+        self.threshold = threshold
+
+    @staticmethod
+    def from_env() -> 'UserRooms':
+        """Create the room naming from SOCKET_COMPRESSION (on or off) and
+        SOCKET_COMPRESSION_THRESHOLD
+
+        Returns:
+            UserRooms: The configured instance
+        """
+        enabled = os.getenv('SOCKET_COMPRESSION', 'on').lower() != 'off'
+        return UserRooms(
+            available_encodings() if enabled else (),
+            int(os.getenv('SOCKET_COMPRESSION_THRESHOLD', str(DEFAULT_THRESHOLD)))
+        )
+
+    def join(self, user_id, accepted) -> Tuple[str, Optional[str]]:
+        """Pick the room of a joining client
+
+        Args:
+            user_id: The user's ID
+            accepted: Encodings the client can decode (``encodings`` of its
+                join message), preferred first
+
+        Returns:
+            Tuple[str, Optional[str]]: Room name and negotiated encoding
+        """
+        encoding = negotiate(accepted)
+        if encoding not in self.encodings:
+            return str(user_id), None
+        return f"{user_id}:{encoding}", encoding
+
+    def encode(self, payload: dict, encoding: Optional[str]) -> dict:
+        """Encode a payload for one client (e.g. its replay)"""
+        return encode_event(payload, encoding, self.threshold)
+
+    def emissions(self, user_id, payload: dict) -> List[Tuple[dict, List[str]]]:
+        """Split an event for a user into one emit per distinct payload
+
+        Args:
+            user_id: The user's ID
+            payload (dict): The plain event payload
+
+        Returns:
+            List[Tuple[dict, List[str]]]: (payload, rooms) pairs; small
+                payloads go to every room at once
+        """
+        plain_rooms = [str(user_id)]
+        emissions = [(payload, plain_rooms)]
+        for encoding in self.encodings:
+            room = f"{user_id}:{encoding}"
+            encoded = encode_event(payload, encoding, self.threshold)
+            if encoded is payload:
+                plain_rooms.append(room)
+            else:
+                emissions.append((encoded, [room]))
+        return emissions
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='SyncClipboard local message broker (needs SOCKETIO_BROKER_AUTHKEY)'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6380)
+    args = parser.parse_args()
+
+    try:
+        broker = LocalBroker((args.host, args.port))
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Local message broker listening on {broker.url}")
+    broker.serve_forever()
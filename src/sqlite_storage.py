@@ -0,0 +1,758 @@
+"""
+Embedded SQLite storage backend.
+
+Keeps users, transactions, image blobs and sequence counters in one
+SQLite file with the insert/history/update/delete semantics of
+MongoCRUD. Single-node deployments skip the network hop to a database
+server, and tests and benchmarks run without external services. Select
+it with STORAGE_BACKEND=sqlite and SQLITE_PATH (``:memory:`` keeps
+everything in memory).
+
+The database runs in WAL mode: readers never wait for the writer, and
+several server processes may share the file (SQLite serializes their
+writes). With ``synchronous=NORMAL`` a committed write survives a crash
+of the process but the last ones may be lost on power failure.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional
+from bson.objectid import ObjectId
+
+from clip_user import ClipUser
+from clip_object import ClipObject
+from storage import (
+    PREVIEW_LENGTH, REPLAY_LIMIT, ClipboardStorage, decode_transaction,
+    parse_history_cursor
+)
+
+# Transaction fields stored in their own column; any other field set by
+# update_transaction goes to the JSON ``extra`` column
+TRANSACTION_COLUMNS = (
+    "user_id", "seq", "content", "content_type", "content_encoding", "preview",
+    "truncated", "image_digest", "size", "timestamp", "created_at", "trace_id",
+)
+
+# Columns left out of returned transactions when NULL, as the matching
+# fields are absent from MongoDB documents that do not need them
+OPTIONAL_COLUMNS = {"content_encoding", "preview", "truncated", "trace_id"}
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS users ("
+    " id INTEGER PRIMARY KEY,"
+    " username TEXT NOT NULL UNIQUE,"
+    " doc TEXT NOT NULL)",
+    # content holds TEXT, or a BLOB when content_encoding is set
+    "CREATE TABLE IF NOT EXISTS transactions ("
+    " id TEXT PRIMARY KEY,"
+    " user_id INTEGER NOT NULL,"
+    " seq INTEGER,"
+    " content,"
+    " content_type TEXT NOT NULL DEFAULT 'text',"
+    " content_encoding TEXT,"
+    " preview TEXT,"
+    " truncated INTEGER,"
+    " image_digest TEXT,"
+    " size INTEGER,"
+    " timestamp REAL NOT NULL,"
+    " created_at REAL,"
+    " trace_id TEXT,"
+    " extra TEXT)",
+    "CREATE TABLE IF NOT EXISTS blobs ("
+    " digest TEXT PRIMARY KEY,"
+    " data BLOB NOT NULL,"
+    " size INTEGER NOT NULL,"
+    " mime_type TEXT NOT NULL,"
+    " created_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS counters ("
+    " user_id INTEGER PRIMARY KEY,"
+    " seq INTEGER NOT NULL)",
+)
+
+INDEXES = (
+    # History reads filter on user_id and order by (timestamp, id)
+    "CREATE INDEX IF NOT EXISTS transactions_user_timestamp"
+    " ON transactions (user_id, timestamp DESC, id DESC)",
+    # Delta sync replays a user's entries after a sequence number
+    "CREATE INDEX IF NOT EXISTS transactions_user_seq ON transactions (user_id, seq)",
+    # Blob garbage collection looks up remaining references by digest
+    "CREATE INDEX IF NOT EXISTS transactions_image_digest"
+    " ON transactions (image_digest) WHERE image_digest IS NOT NULL",
+    # The orphan sweep walks blobs older than its grace period
+    "CREATE INDEX IF NOT EXISTS blobs_created_at ON blobs (created_at)",
+)
+
+# Metadata-only history rows: a preview instead of the full text
+METADATA_SELECT = (
+    "SELECT id, seq, content_type, image_digest, size, timestamp,"
+    " CASE WHEN content_encoding IS NOT NULL THEN preview"
+    f" ELSE substr(COALESCE(content, ''), 1, {PREVIEW_LENGTH}) END AS preview,"
+    " CASE WHEN content_encoding IS NOT NULL THEN truncated"
+    f" ELSE length(COALESCE(content, '')) > {PREVIEW_LENGTH} END AS truncated"
+    " FROM transactions"
+)
+HISTORY_WHERE = " WHERE user_id = ?"
+HISTORY_BEFORE = " AND (timestamp, id) < (?, ?)"
+HISTORY_ORDER = " ORDER BY timestamp DESC, id DESC LIMIT ?"
+SINCE_QUERY = (
+    "SELECT * FROM transactions WHERE user_id = ? AND seq > ? ORDER BY seq LIMIT ?"
+)
+LAST_STORED_SEQUENCE_QUERY = "SELECT MAX(seq) FROM transactions WHERE user_id = ?"
+SIZES_QUERY = (
+    "SELECT id, timestamp, size, image_digest FROM transactions"
+    " WHERE user_id = ? ORDER BY timestamp DESC, id DESC"
+)
+ORPHAN_BLOB_DELETE = (
+    "DELETE FROM blobs WHERE created_at <= ?"
+    " AND NOT EXISTS (SELECT 1 FROM transactions WHERE image_digest = blobs.digest)"
+)
+
+
+def _to_timestamp(value) -> Optional[float]:
+    """Store datetimes (e.g. created_at) as Unix timestamps"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+def _transaction_row(transaction: dict) -> tuple:
+    """Get the column values of a transaction document, in INSERT order"""
+    values = [str(transaction["_id"])]
+    for column in TRANSACTION_COLUMNS:
+        value = transaction.get(column)
+        if column == "created_at":
+            value = _to_timestamp(value)
+        elif column == "truncated" and value is not None:
+            value = int(value)
+        values.append(value)
+    extra = {
+        key: value for key, value in transaction.items()
+        if key != "_id" and key not in TRANSACTION_COLUMNS
+    }
+    values.append(json.dumps(extra) if extra else None)
+    return tuple(values)
+
+
+def _transaction_doc(row: sqlite3.Row) -> dict:
+    """Convert a transactions row into a MongoDB-shaped document"""
+    transaction = {"_id": ObjectId(row["id"])}
+    for column in TRANSACTION_COLUMNS:
+        value = row[column]
+        if value is None and column in OPTIONAL_COLUMNS:
+            continue
+        if column == "created_at" and value is not None:
+            value = datetime.fromtimestamp(value, timezone.utc)
+        elif column == "truncated":
+            value = bool(value)
+        transaction[column] = value
+    if row["extra"]:
+        transaction.update(json.loads(row["extra"]))
+    return transaction
+
+
+class SQLiteCRUD(ClipboardStorage):
+    """SQLite CRUD operations for clipboard synchronization
+
+    One connection is shared by every thread behind a lock; each write
+    is a short transaction, so requests only queue for the time of the
+    statement itself.
+    """
+
+    def __init__(self, path: str = "syncclipboard.db") -> None:
+        """Open (or create) the database
+
+        Args:
+            path (str): SQLite database file, or ':memory:'
+        """
+        super().__init__()
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The timeout covers writes of other processes sharing the file
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            for statement in SCHEMA + INDEXES:
+                self._conn.execute(statement)
+
+    @staticmethod
+    def from_env() -> 'SQLiteCRUD':
+        """Create a SQLiteCRUD configured from environment variables
+
+        SQLITE_PATH sets the database file (default: syncclipboard.db);
+        compression and metrics are set up by
+        ClipboardStorage.configure_from_env.
+
+        Returns:
+            SQLiteCRUD: The configured instance
+        """
+        db = SQLiteCRUD(os.getenv('SQLITE_PATH', 'syncclipboard.db'))
+        return db.configure_from_env()
+
+    def close(self) -> None:
+        """Close the database"""
+        with self._lock:
+            self._conn.close()
+
+    def ensure_indexes(self):
+        """Create the indexes backing every query method
+
+        They are also created when the database is opened, so this only
+        restores indexes dropped by hand.
+
+        Returns:
+            SQLiteCRUD: self for chaining
+        """
+        with self._lock, self._conn:
+            for statement in INDEXES:
+                self._conn.execute(statement)
+        return self
+
+    def ensure_ttl_index(self, max_age: float):
+        """Accept a TTL request without doing anything
+
+        SQLite cannot expire rows by itself; the retention compactor
+        deletes entries older than max_age on each pass instead.
+
+        Args:
+            max_age (float): Age in seconds after which transactions expire
+
+        Returns:
+            SQLiteCRUD: self for chaining
+        """
+        return self
+
+    def _query_plan_probes(self) -> list:
+        """Queries issued by the CRUD methods, with placeholder parameters
+
+        Returns:
+            list: (name, sql, parameters) tuples
+        """
+        probe_id = str(ObjectId())
+        history = METADATA_SELECT + HISTORY_WHERE
+        return [
+            ("get_user", "SELECT doc FROM users WHERE username = ?", ("",)),
+            ("get_user_by_id", "SELECT doc FROM users WHERE id = ?", (0,)),
+            ("get_last_user_transaction",
+             "SELECT * FROM transactions" + HISTORY_WHERE + HISTORY_ORDER, (0, 1)),
+            ("get_n_last_user_transaction", history + HISTORY_ORDER, (0, 50)),
+            ("get_n_last_user_transaction(before)",
+             history + HISTORY_BEFORE + HISTORY_ORDER, (0, 0.0, probe_id, 50)),
+            ("get_last_stored_sequence", LAST_STORED_SEQUENCE_QUERY, (0,)),
+            ("get_transactions_since", SINCE_QUERY, (0, 0, REPLAY_LIMIT)),
+            ("get_user_transaction",
+             "SELECT * FROM transactions WHERE id = ? AND user_id = ?", (probe_id, 0)),
+            ("iter_user_transaction_sizes", SIZES_QUERY, (0,)),
+            ("delete_user", "DELETE FROM transactions WHERE user_id = ?", (0,)),
+            ("get_blob", "SELECT * FROM blobs WHERE digest = ?", ("",)),
+            ("delete_orphan_blobs", ORPHAN_BLOB_DELETE, (0.0,)),
+        ]
+
+    def check_query_plans(self) -> dict:
+        """Explain each query method and report the ones not backed by an index
+
+        Returns:
+            dict: Query name -> list of plan steps, only for queries whose
+                plan scans a table or sorts in a temporary b-tree
+        """
+        unindexed = {}
+        with self._lock:
+            for name, sql, parameters in self._query_plan_probes():
+                steps = [
+                    row["detail"] for row in
+                    self._conn.execute("EXPLAIN QUERY PLAN " + sql, parameters)
+                ]
+                if any(
+                    (step.startswith("SCAN") and "INDEX" not in step)
+                    or "TEMP B-TREE" in step
+                    for step in steps
+                ):
+                    unindexed[name] = steps
+        return unindexed
+
+    def insert_user(self, user: ClipUser):
+        """Insert a new user into the database
+
+        Args:
+            user (ClipUser): The user object to insert
+
+        Raises:
+            sqlite3.IntegrityError: If the username or ID is taken
+
+        Returns:
+            SQLiteCRUD: self for chaining
+        """
+        doc = user.to_json()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO users (id, username, doc) VALUES (?, ?, ?)",
+                (doc["id"], doc["username"], json.dumps(doc))
+            )
+        return self
+
+    def insert_blob(self, data: bytes, mime_type: str = "image/png") -> str:
+        """Store a binary payload once, addressed by its SHA-256 digest
+
+        Args:
+            data (bytes): Raw payload (e.g. PNG bytes)
+            mime_type (str): MIME type served back with the blob
+
+        Returns:
+            str: Hex digest referencing the stored blob
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock, self._conn:
+            # Storing a known blob again refreshes created_at: the orphan
+            # sweep spares recent blobs
+            self._conn.execute(
+                "INSERT INTO blobs (digest, data, size, mime_type, created_at)"
+                " VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (digest) DO UPDATE SET created_at = excluded.created_at",
+                (digest, data, len(data), mime_type, time.time())
+            )
+        return digest
+
+    def get_blob(self, digest: str) -> Optional[dict]:
+        """Get a stored blob by digest
+
+        Args:
+            digest (str): The blob's SHA-256 hex digest
+
+        Returns:
+            Optional[dict]: Blob document with data, size and mime_type, or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "_id": row["digest"],
+            "data": row["data"],
+            "size": row["size"],
+            "mime_type": row["mime_type"],
+            "created_at": datetime.fromtimestamp(row["created_at"], timezone.utc)
+        }
+
+    def _insert_rows(self, transactions: list) -> None:
+        """Write stored-form transactions in one SQLite transaction"""
+        columns = ("id",) + TRANSACTION_COLUMNS + ("extra",)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO transactions ({', '.join(columns)})"
+                f" VALUES ({', '.join('?' * len(columns))})",
+                [_transaction_row(transaction) for transaction in transactions]
+            )
+
+    def insert_transaction(
+        self,
+        user_id: int,
+        obj: ClipObject,
+        image_digest: Optional[str] = None,
+        seq: Optional[int] = None
+    ):
+        """Insert a clipboard transaction for a user
+
+        Args:
+            user_id (int): The user's ID
+            obj (ClipObject): The clipboard object to store
+            image_digest (Optional[str]): Digest of an image already stored
+                with insert_blob
+            seq (Optional[int]): Sequence number reserved with next_sequence
+                (one is assigned when omitted)
+
+        Returns:
+            SQLiteCRUD: self for chaining
+        """
+        if seq is None:
+            seq = self.next_sequence(user_id)
+        self._insert_rows([self._stored_form(
+            self._build_transaction(user_id, obj, image_digest, seq)
+        )])
+        return self
+
+    def insert_transactions(self, user_id: int, objs: List[ClipObject]) -> list:
+        """Insert several clipboard transactions of a user in one commit
+
+        Args:
+            user_id (int): The user's ID
+            objs (List[ClipObject]): Clipboard objects, oldest first
+
+        Returns:
+            list: The stored transactions (with plain text content), in
+                sequence order
+        """
+        if not objs:
+            return []
+        first_seq = self.next_sequence(user_id, count=len(objs))
+        transactions = [
+            self._build_transaction(user_id, obj, None, first_seq + offset)
+            for offset, obj in enumerate(objs)
+        ]
+        self._insert_rows([self._stored_form(transaction) for transaction in transactions])
+        return transactions
+
+    def reserve_sequences(self, user_id: int, count: int = 1) -> int:
+        """Reserve the next sequence number(s) of a user's clipboard stream
+        in the counters table (see ClipboardStorage.next_sequence)
+
+        Args:
+            user_id (int): The user's ID
+            count (int): Number of consecutive sequence numbers to reserve
+
+        Returns:
+            int: The first reserved sequence number (the very first one is 1)
+        """
+        with self._lock, self._conn:
+            # The write lock taken by the upsert is held until the commit,
+            # so the value read back is ours even with several processes
+            self._conn.execute(
+                "INSERT INTO counters (user_id, seq) VALUES (?, ?)"
+                " ON CONFLICT (user_id) DO UPDATE SET seq = seq + excluded.seq",
+                (user_id, count)
+            )
+            seq = self._conn.execute(
+                "SELECT seq FROM counters WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+        return seq - count + 1
+
+    def get_last_sequence(self, user_id: int) -> int:
+        """Get the last sequence number reserved for a user
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            int: The last sequence number, or 0 if none was reserved
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq FROM counters WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_last_stored_sequence(self, user_id: int) -> int:
+        """Get the highest sequence number of a user's stored transactions
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            int: The sequence number, or 0 if no transaction has one
+        """
+        with self._lock:
+            row = self._conn.execute(LAST_STORED_SEQUENCE_QUERY, (user_id,)).fetchone()
+        return row[0] or 0
+
+    def get_transactions_since(
+        self,
+        user_id: int,
+        since: int,
+        limit: int = REPLAY_LIMIT
+    ) -> list:
+        """Get a user's transactions with a sequence number above ``since``
+
+        Args:
+            user_id (int): The user's ID
+            since (int): Last sequence number the caller has seen
+            limit (int): Maximum number of transactions returned
+
+        Returns:
+            list: Oldest-first transactions
+        """
+        with self._lock:
+            rows = self._conn.execute(SINCE_QUERY, (user_id, since, limit)).fetchall()
+        return [decode_transaction(_transaction_doc(row)) for row in rows]
+
+    def _get_user_doc(self, where: str, value) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT doc FROM users WHERE {where} = ?", (value,)
+            ).fetchone()
+        return json.loads(row["doc"]) if row else None
+
+    def get_user(self, username: str, password: str) -> ClipUser:
+        """Get a user by username and password
+
+        Args:
+            username (str): The username
+            password (str): The password (will be hashed)
+
+        Returns:
+            ClipUser: The user object or None if not found
+        """
+        user_data = self._get_user_doc("username", username)
+        if user_data and user_data.get("password") == hash(password):
+            return ClipUser(user_data["username"], password, user_data["email"])
+        return None
+
+    def get_user_by_id(self, user_id: int) -> ClipUser:
+        """Get a user by their ID
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            ClipUser: The user object or None if not found
+        """
+        user_data = self._get_user_doc("id", user_id)
+        if user_data:
+            return ClipUser(user_data["username"], "", user_data["email"])
+        return None
+
+    def get_last_user_transaction(self, user_id: int) -> dict:
+        """Get the last clipboard transaction for a user
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            dict: The transaction data or empty dict if none found
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM transactions" + HISTORY_WHERE + HISTORY_ORDER, (user_id, 1)
+            ).fetchone()
+        return decode_transaction(_transaction_doc(row)) if row else dict()
+
+    def get_n_last_user_transaction(
+        self,
+        user_id: int,
+        n: int,
+        metadata_only: bool = False,
+        before: Optional[str] = None
+    ) -> list[dict]:
+        """Get the last N clipboard transactions for a user
+
+        Entries are ordered newest first by (timestamp, _id); ``before``
+        continues from a cursor with an index range instead of an offset.
+
+        Args:
+            user_id (int): The user's ID
+            n (int): Number of transactions to retrieve
+            metadata_only (bool): Only return id, content_type, size,
+                image_digest, a text preview and timestamp for each entry
+            before (Optional[str]): Cursor from make_history_cursor; only
+                older entries are returned
+
+        Raises:
+            ValueError: If ``before`` is not a valid cursor
+
+        Returns:
+            list[dict]: List of transaction data
+        """
+        sql = (METADATA_SELECT if metadata_only else "SELECT * FROM transactions") \
+            + HISTORY_WHERE
+        parameters = [user_id]
+        if before is not None:
+            timestamp, transaction_id = parse_history_cursor(before)
+            sql += HISTORY_BEFORE
+            parameters += [timestamp, str(transaction_id)]
+        parameters.append(n)
+
+        with self._lock:
+            rows = self._conn.execute(sql + HISTORY_ORDER, parameters).fetchall()
+        if not metadata_only:
+            return [decode_transaction(_transaction_doc(row)) for row in rows]
+        return [
+            {
+                "_id": ObjectId(row["id"]),
+                "seq": row["seq"],
+                "content_type": row["content_type"],
+                "image_digest": row["image_digest"],
+                "size": row["size"],
+                "timestamp": row["timestamp"],
+                "preview": row["preview"] or "",
+                "truncated": bool(row["truncated"])
+            }
+            for row in rows
+        ]
+
+    def get_user_transaction(self, user_id: int, transaction_id: str) -> Optional[dict]:
+        """Get a single transaction with its full payload
+
+        Args:
+            user_id (int): The user's ID (the transaction must belong to them)
+            transaction_id (str): The transaction's ID
+
+        Returns:
+            Optional[dict]: The transaction data or None if not found
+        """
+        if not ObjectId.is_valid(transaction_id):
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM transactions WHERE id = ? AND user_id = ?",
+                (str(ObjectId(transaction_id)), user_id)
+            ).fetchone()
+        return decode_transaction(_transaction_doc(row)) if row else None
+
+    def update_user(self, user_id: int, update_data: dict):
+        """Update user information
+
+        Args:
+            user_id (int): The user's ID
+            update_data (dict): Dictionary of fields to update
+
+        Returns:
+            SQLiteCRUD: self for chaining
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT doc FROM users WHERE id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return self
+            doc = dict(json.loads(row["doc"]), **update_data)
+            self._conn.execute(
+                "UPDATE users SET id = ?, username = ?, doc = ? WHERE id = ?",
+                (doc["id"], doc["username"], json.dumps(doc), user_id)
+            )
+        return self
+
+    def update_transaction(self, transaction_id: str, update_data: dict):
+        """Update a transaction
+
+        Args:
+            transaction_id (str): The transaction's ID
+            update_data (dict): Dictionary of fields to update
+
+        Raises:
+            ValueError: If update_data changes the _id
+
+        Returns:
+            SQLiteCRUD: self for chaining
+        """
+        if "_id" in update_data:
+            raise ValueError("The _id of a transaction cannot be changed")
+        transaction_id = str(ObjectId(transaction_id))
+        columns = {
+            key: _to_timestamp(value) for key, value in update_data.items()
+            if key in TRANSACTION_COLUMNS
+        }
+        extra = {
+            key: value for key, value in update_data.items()
+            if key not in TRANSACTION_COLUMNS
+        }
+        with self._lock, self._conn:
+            if extra:
+                row = self._conn.execute(
+                    "SELECT extra FROM transactions WHERE id = ?", (transaction_id,)
+                ).fetchone()
+                if row is None:
+                    return self
+                columns["extra"] = json.dumps(
+                    dict(json.loads(row["extra"] or "{}"), **extra)
+                )
+            if columns:
+                self._conn.execute(
+                    "UPDATE transactions SET "
+                    + ", ".join(f"{column} = ?" for column in columns)
+                    + " WHERE id = ?",
+                    list(columns.values()) + [transaction_id]
+                )
+        return self
+
+    def delete_user(self, user_id: int):
+        """Delete a user and all their transactions
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            SQLiteCRUD: self for chaining
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            self._conn.execute("DELETE FROM transactions WHERE user_id = ?", (user_id,))
+        return self
+
+    def delete_transaction(self, transaction_id: str):
+        """Delete a specific transaction
+
+        Args:
+            transaction_id (str): The transaction's ID
+
+        Returns:
+            SQLiteCRUD: self for chaining
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM transactions WHERE id = ?", (str(ObjectId(transaction_id)),)
+            )
+        return self
+
+    def get_user_ids_with_transactions(self) -> list:
+        """Get the IDs of every user that has stored transactions
+
+        Returns:
+            list: Distinct user IDs
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user_id FROM transactions").fetchall()
+        return [row[0] for row in rows]
+
+    def iter_user_transaction_sizes(self, user_id: int) -> Iterator[dict]:
+        """Iterate over a user's transactions newest first, sizes only
+
+        Args:
+            user_id (int): The user's ID
+
+        Returns:
+            Iterator[dict]: Documents with _id, timestamp, size and image_digest
+        """
+        with self._lock:
+            rows = self._conn.execute(SIZES_QUERY, (user_id,)).fetchall()
+        return iter([
+            {
+                "_id": ObjectId(row["id"]),
+                "timestamp": row["timestamp"],
+                "size": row["size"],
+                "image_digest": row["image_digest"]
+            }
+            for row in rows
+        ])
+
+    def delete_transactions(self, transaction_ids: Iterable) -> int:
+        """Delete several transactions in one commit
+
+        Args:
+            transaction_ids (Iterable): ObjectIds of the transactions to delete
+
+        Returns:
+            int: Number of deleted transactions
+        """
+        ids = [(str(transaction_id),) for transaction_id in transaction_ids]
+        if not ids:
+            return 0
+        with self._lock, self._conn:
+            return self._conn.executemany(
+                "DELETE FROM transactions WHERE id = ?", ids
+            ).rowcount
+
+    def delete_orphan_blobs(self, older_than: datetime) -> int:
+        """Delete blobs no transaction references, stored before older_than
+
+        Blobs stored (or stored again) after ``older_than`` are kept: their
+        transaction may not be written yet.
+
+        Args:
+            older_than (datetime): Only blobs whose created_at is not later
+                are deleted
+
+        Returns:
+            int: Number of deleted blobs
+        """
+        with self._lock, self._conn:
+            return self._conn.execute(
+                ORPHAN_BLOB_DELETE, (older_than.timestamp(),)
+            ).rowcount
@@ -0,0 +1,474 @@
+"""
+Storage interface of the clipboard servers and what its backends share.
+
+MongoCRUD (db_management.py) keeps clips in MongoDB. SQLiteCRUD
+(sqlite_storage.py) keeps them in an embedded SQLite database, for
+single-node deployments, tests and benchmarks that should not need a
+MongoDB server. STORAGE_BACKEND selects one in storage_from_env().
+
+Both return transactions as dicts shaped like the MongoDB documents
+(``_id`` is an ObjectId), so the servers, the serializers and the
+retention compactor work with either.
+"""
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional
+from bson.objectid import ObjectId
+
+from clip_user import ClipUser
+from clip_object import ClipObject
+from clip_compression import DEFAULT_THRESHOLD, compress_text, decompress_text
+import metrics
+
+
+# Number of characters of text content returned by metadata-only history
+PREVIEW_LENGTH = 200
+
+# Most entries a reconnecting client gets replayed in one batch
+REPLAY_LIMIT = 500
+
+# Most clips accepted by one batch upload
+BATCH_LIMIT = 500
+
+# Sequence numbers reserved per counter update, see enable_sequence_blocks
+SEQUENCE_BLOCK_SIZE = 100
+
+# Methods timed by enable_metrics (iter_* return lazy cursors and are skipped)
+INSTRUMENTED_METHODS = (
+    "insert_user", "insert_blob", "get_blob", "insert_transaction",
+    "insert_transactions", "next_sequence", "reserve_sequences",
+    "get_last_sequence", "get_last_stored_sequence",
+    "get_transactions_since", "get_user", "get_user_by_id",
+    "get_last_user_transaction", "get_n_last_user_transaction",
+    "get_user_transaction", "update_user", "update_transaction", "delete_user",
+    "delete_transaction", "get_user_ids_with_transactions",
+    "delete_transactions", "delete_orphan_blobs", "flush",
+)
+
+
+def metadata_view(transaction: dict) -> dict:
+    """Reduce a full transaction to its metadata-only form
+
+    Mirrors the metadata queries of the backends for transactions already in
+    memory (e.g. served from the history cache).
+
+    Args:
+        transaction (dict): The full transaction
+
+    Returns:
+        dict: The same fields the metadata projection returns
+    """
+    view = {
+        key: transaction[key]
+        for key in ("_id", "seq", "content_type", "image_digest", "size", "timestamp")
+        if key in transaction
+    }
+    if transaction.get("content_encoding"):
+        view["preview"] = transaction.get("preview", "")
+        view["truncated"] = transaction.get("truncated", False)
+        return view
+    content = transaction.get("content") or ""
+    view["preview"] = content[:PREVIEW_LENGTH]
+    view["truncated"] = len(content) > PREVIEW_LENGTH
+    return view
+
+
+def decode_transaction(transaction: dict) -> dict:
+    """Get a transaction with its text content decompressed
+
+    Args:
+        transaction (dict): A stored transaction
+
+    Returns:
+        dict: The transaction itself if its content is plain, or a copy
+            with plain text content and without the compression fields
+    """
+    encoding = transaction.get("content_encoding")
+    if not encoding:
+        return transaction
+    decoded = {
+        key: value for key, value in transaction.items()
+        if key not in ("content_encoding", "preview", "truncated")
+    }
+    decoded["content"] = decompress_text(transaction["content"], encoding)
+    return decoded
+
+
+def make_history_cursor(transaction: dict) -> str:
+    """Build an opaque pagination cursor pointing just after a transaction
+
+    Args:
+        transaction (dict): A transaction with ``timestamp`` and ``_id``
+
+    Returns:
+        str: Cursor to pass as ``before`` to fetch the following page
+    """
+    return f"{transaction['timestamp']!r}_{transaction['_id']}"
+
+
+def parse_history_cursor(cursor: str) -> tuple:
+    """Parse a cursor built by make_history_cursor
+
+    Args:
+        cursor (str): The cursor string
+
+    Raises:
+        ValueError: If the cursor is malformed
+
+    Returns:
+        tuple: (timestamp, ObjectId) of the last entry of the previous page
+    """
+    timestamp, _, transaction_id = cursor.rpartition('_')
+    if not timestamp or not ObjectId.is_valid(transaction_id):
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+    return float(timestamp), ObjectId(transaction_id)
+
+
+class ClipboardStorage(ABC):
+    """Users, clipboard transactions, image blobs and sequence counters
+
+    Subclasses implement the queries; building transactions, text
+    compression and method timings are shared.
+    """
+
+    def __init__(self) -> None:
+        # Optional batching of transaction inserts (MongoCRUD only)
+        self.write_behind = None
+        # Codec for large text content, see enable_compression
+        self.compression: Optional[str] = None
+        self.compression_threshold = DEFAULT_THRESHOLD
+        # Sequence numbers handed out without a database call, see
+        # enable_sequence_blocks: user_id -> (next, end) of the reserved block
+        self.sequence_block_size = 1
+        self._sequence_blocks: dict = {}
+        self._sequence_lock = threading.Lock()
+
+    def configure_from_env(self):
+        """Apply the settings every backend supports
+
+        STORAGE_COMPRESSION (zlib, zstd or off) and
+        STORAGE_COMPRESSION_THRESHOLD configure text compression.
+        SEQUENCE_BLOCK_SIZE (1 disables) sets how many sequence numbers
+        are reserved at once; blocks stay off when SOCKETIO_MESSAGE_QUEUE
+        is set, since several processes then hand out numbers. Method
+        timings are recorded unless METRICS_ENABLED is false.
+
+        Returns:
+            ClipboardStorage: self for chaining
+        """
+        block_size = int(os.getenv('SEQUENCE_BLOCK_SIZE', str(SEQUENCE_BLOCK_SIZE)))
+        if block_size > 1 and os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+            print("Sequence blocks disabled: several server processes share the database")
+        elif block_size > 1:
+            self.enable_sequence_blocks(block_size)
+
+        compression = os.getenv('STORAGE_COMPRESSION', 'zlib').lower()
+        if compression != 'off':
+            self.enable_compression(
+                encoding=compression,
+                threshold=int(os.getenv(
+                    'STORAGE_COMPRESSION_THRESHOLD', str(DEFAULT_THRESHOLD)
+                ))
+            )
+
+        if metrics.REGISTRY.enabled:
+            self.enable_metrics()
+        return self
+
+    def enable_compression(
+        self,
+        encoding: str = 'zlib',
+        threshold: int = DEFAULT_THRESHOLD
+    ):
+        """Store large text content compressed
+
+        Compressed transactions keep a plain ``preview``/``truncated`` pair
+        for metadata-only reads and record the codec in
+        ``content_encoding``; every read returning full transactions
+        decompresses them again, so callers always see plain text.
+
+        Args:
+            encoding (str): 'zlib', or 'zstd' (needs zstd support, see
+                clip_compression)
+            threshold (int): Minimum text size in bytes worth compressing
+
+        Returns:
+            ClipboardStorage: self for chaining
+        """
+        self.compression = encoding
+        self.compression_threshold = threshold
+        return self
+
+    def enable_sequence_blocks(self, block_size: int = SEQUENCE_BLOCK_SIZE):
+        """Reserve sequence numbers by blocks instead of one per clip
+
+        next_sequence then only reaches the database once every
+        ``block_size`` numbers. The numbers left in a block when the
+        process stops are never used, which only leaves gaps. Only one
+        process may hand out a user's numbers: with several, a process
+        still using an older block would announce clips with lower numbers
+        than ones already sent, and reconnecting clients would skip them.
+
+        Args:
+            block_size (int): Sequence numbers reserved per counter update
+
+        Returns:
+            ClipboardStorage: self for chaining
+        """
+        with self._sequence_lock:
+            self.sequence_block_size = block_size
+            self._sequence_blocks.clear()
+        return self
+
+    def next_sequence(self, user_id: int, count: int = 1) -> int:
+        """Reserve the next sequence number(s) of a user's clipboard stream
+
+        Sequence numbers increase by one per entry and are never reused, so
+        a client that remembers the last one it saw can ask for the rest.
+
+        Args:
+            user_id (int): The user's ID
+            count (int): Number of consecutive sequence numbers to reserve
+
+        Returns:
+            int: The first reserved sequence number (the very first one is 1)
+        """
+        if self.sequence_block_size <= 1:
+            return self.reserve_sequences(user_id, count)
+        with self._sequence_lock:
+            start, end = self._sequence_blocks.get(user_id, (0, 0))
+            if end - start < count:
+                # Batches come from the same blocks, so numbers keep increasing
+                size = max(self.sequence_block_size, count)
+                start = self.reserve_sequences(user_id, size)
+                end = start + size
+            self._sequence_blocks[user_id] = (start + count, end)
+        return start
+
+    def enable_metrics(self):
+        """Record the duration of every storage method call
+
+        Timings go to the syncclipboard_db_operation_duration_seconds
+        histogram labelled by method, and the write-behind buffer depth
+        is reported on scrape (see metrics.py).
+
+        Returns:
+            ClipboardStorage: self for chaining
+        """
+        metrics.instrument(self, INSTRUMENTED_METHODS)
+        metrics.WRITE_BEHIND_DEPTH.set_function(
+            lambda: self.write_behind.depth() if self.write_behind is not None else 0
+        )
+        return self
+
+    def flush(self):
+        """Wait until every buffered write has landed
+
+        Returns:
+            ClipboardStorage: self for chaining
+        """
+        return self
+
+    def close(self) -> None:
+        """Flush buffered writes and release the connection"""
+
+    def _build_transaction(
+        self,
+        user_id: int,
+        obj: ClipObject,
+        image_digest: Optional[str],
+        seq: int
+    ) -> dict:
+        """Build a transaction document, storing its image blob if needed"""
+        image_bytes = obj.get_image_bytes() if obj.is_image() else None
+        if image_digest is None and image_bytes:
+            image_digest = self.insert_blob(image_bytes)
+
+        if image_bytes is not None:
+            size = len(image_bytes)
+        else:
+            size = len(obj.get_content().encode('utf-8'))
+
+        transaction = {
+            # Assigned here so the ID is known before a buffered write lands
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "seq": seq,
+            "content": obj.get_content(),
+            "content_type": obj.get_content_type(),
+            "image_digest": image_digest,
+            "size": size,
+            "timestamp": time.time(),
+            # BSON date used by the optional TTL index
+            "created_at": datetime.now(timezone.utc)
+        }
+        if obj.trace_id is not None:
+            transaction["trace_id"] = obj.trace_id
+        return transaction
+
+    def _stored_form(self, transaction: dict) -> dict:
+        """Get the document written for a transaction (compressed if enabled)"""
+        text = transaction["content"]
+        if self.compression is None or transaction["content_type"] != "text" \
+                or not isinstance(text, str):
+            return transaction
+        content, encoding = compress_text(
+            text, self.compression, self.compression_threshold
+        )
+        if encoding is None:
+            return transaction
+        return dict(
+            transaction,
+            content=content,
+            content_encoding=encoding,
+            preview=text[:PREVIEW_LENGTH],
+            truncated=len(text) > PREVIEW_LENGTH
+        )
+
+    @abstractmethod
+    def ensure_indexes(self):
+        """Create the indexes backing every query method (idempotent)"""
+
+    @abstractmethod
+    def ensure_ttl_index(self, max_age: float):
+        """Expire transactions older than max_age seconds where supported"""
+
+    @abstractmethod
+    def check_query_plans(self) -> dict:
+        """Map each query method not served by an index to its plan steps"""
+
+    @abstractmethod
+    def insert_user(self, user: ClipUser):
+        """Insert a new user"""
+
+    @abstractmethod
+    def insert_blob(self, data: bytes, mime_type: str = "image/png") -> str:
+        """Store a payload once, returning its SHA-256 hex digest"""
+
+    @abstractmethod
+    def get_blob(self, digest: str) -> Optional[dict]:
+        """Get a blob (``data``, ``size``, ``mime_type``) by digest"""
+
+    @abstractmethod
+    def insert_transaction(
+        self,
+        user_id: int,
+        obj: ClipObject,
+        image_digest: Optional[str] = None,
+        seq: Optional[int] = None
+    ):
+        """Insert a clipboard transaction (a sequence number is reserved when
+        ``seq`` is None)"""
+
+    @abstractmethod
+    def insert_transactions(self, user_id: int, objs: List[ClipObject]) -> list:
+        """Insert several transactions with consecutive sequence numbers,
+        returning them with plain content"""
+
+    @abstractmethod
+    def reserve_sequences(self, user_id: int, count: int = 1) -> int:
+        """Reserve ``count`` sequence numbers of a user in the database,
+        returning the first"""
+
+    @abstractmethod
+    def get_last_sequence(self, user_id: int) -> int:
+        """Get the last sequence number reserved for a user (0 if none)"""
+
+    @abstractmethod
+    def get_last_stored_sequence(self, user_id: int) -> int:
+        """Get the highest sequence number of a user's stored transactions
+        (0 if none)"""
+
+    @abstractmethod
+    def get_transactions_since(
+        self,
+        user_id: int,
+        since: int,
+        limit: int = REPLAY_LIMIT
+    ) -> list:
+        """Get up to ``limit`` transactions after ``since``, oldest first"""
+
+    @abstractmethod
+    def get_user(self, username: str, password: str) -> Optional[ClipUser]:
+        """Get a user by username and password"""
+
+    @abstractmethod
+    def get_user_by_id(self, user_id: int) -> Optional[ClipUser]:
+        """Get a user by ID"""
+
+    @abstractmethod
+    def get_last_user_transaction(self, user_id: int) -> dict:
+        """Get the newest transaction of a user (empty dict if none)"""
+
+    @abstractmethod
+    def get_n_last_user_transaction(
+        self,
+        user_id: int,
+        n: int,
+        metadata_only: bool = False,
+        before: Optional[str] = None
+    ) -> list:
+        """Get a page of a user's history, newest first by (timestamp, _id)"""
+
+    @abstractmethod
+    def get_user_transaction(self, user_id: int, transaction_id: str) -> Optional[dict]:
+        """Get one transaction of a user with its full payload"""
+
+    @abstractmethod
+    def update_user(self, user_id: int, update_data: dict):
+        """Set fields of a user"""
+
+    @abstractmethod
+    def update_transaction(self, transaction_id: str, update_data: dict):
+        """Set fields of a transaction"""
+
+    @abstractmethod
+    def delete_user(self, user_id: int):
+        """Delete a user and all their transactions"""
+
+    @abstractmethod
+    def delete_transaction(self, transaction_id: str):
+        """Delete one transaction"""
+
+    @abstractmethod
+    def get_user_ids_with_transactions(self) -> list:
+        """Get the IDs of every user with stored transactions"""
+
+    @abstractmethod
+    def iter_user_transaction_sizes(self, user_id: int) -> Iterator[dict]:
+        """Iterate over a user's transactions newest first, with only
+        ``_id``, ``timestamp``, ``size`` and ``image_digest``"""
+
+    @abstractmethod
+    def delete_transactions(self, transaction_ids: Iterable) -> int:
+        """Delete several transactions, returning how many were deleted"""
+
+    @abstractmethod
+    def delete_orphan_blobs(self, older_than: datetime) -> int:
+        """Delete blobs stored before ``older_than`` that no transaction
+        references, returning how many were deleted"""
+
+
+def storage_from_env() -> ClipboardStorage:
+    """Create the storage backend selected by STORAGE_BACKEND
+
+    ``mongo`` (the default) connects to MONGODB_HOST/MONGODB_PORT;
+    ``sqlite`` opens the database file at SQLITE_PATH.
+
+    Raises:
+        ValueError: If STORAGE_BACKEND names no known backend
+
+    Returns:
+        ClipboardStorage: The configured backend
+    """
+    backend = os.getenv('STORAGE_BACKEND', 'mongo').lower()
+    if backend == 'mongo':
+        from db_management import MongoCRUD
+        return MongoCRUD.from_env()
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteCRUD
+        return SQLiteCRUD.from_env()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend!r} (expected mongo or sqlite)")
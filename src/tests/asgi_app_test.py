@@ -0,0 +1,193 @@
+import json
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+
+import asgi_app
+from clip_user import ClipUser
+
+
+def call_raw(method, path, body=b'', query=b'', headers=None):
+    """Send one HTTP request through the ASGI app
+
+    Returns:
+        tuple: Status, response headers (dict) and body bytes
+    """
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query,
+        'headers': headers or [(b'content-type', b'application/json')],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi_app.app(scope, receive, send))
+    return messages[0]['status'], dict(messages[0]['headers']), messages[1]['body']
+
+
+def call(method, path, payload=None, query=b''):
+    """Send one JSON request through the ASGI app"""
+    body = json.dumps(payload).encode() if payload is not None else b''
+    status, _, response = call_raw(method, path, body, query)
+    return status, json.loads(response)
+
+
+@pytest.fixture
+def mock_db():
+    """Mock the database"""
+    with patch('asgi_app.db') as mock:
+        yield mock
+
+
+@pytest.fixture
+def mock_emit():
+    """Mock socket broadcasts"""
+    with patch.object(asgi_app.sio, 'emit', new_callable=AsyncMock) as mock:
+        yield mock
+
+
+def test_login_success(mock_db):
+    """Test successful login through the async stack"""
+    mock_db.get_user.return_value = ClipUser('testuser', 'testpass', 'test@example.com')
+
+    status, data = call('POST', '/api/login', {'username': 'testuser', 'password': 'testpass'})
+
+    assert status == 200
+    assert data['username'] == 'testuser'
+
+
+def test_login_failure(mock_db):
+    """Test failed login"""
+    mock_db.get_user.return_value = None
+
+    status, data = call('POST', '/api/login', {'username': 'x', 'password': 'y'})
+
+    assert status == 401
+    assert data['success'] is False
+
+
+def test_register(mock_db):
+    """Test user registration"""
+    status, data = call('POST', '/api/register', {
+        'username': 'testuser', 'password': 'testpass', 'email': 'test@example.com'
+    })
+
+    assert status == 200
+    mock_db.insert_user.assert_called_once()
+
+
+def test_add_clipboard_broadcasts_and_stores(mock_db, mock_emit):
+    """Test posting a clip emits to the user's room and stores it"""
+    mock_db.next_sequence.return_value = 8
+    status, data = call('POST', '/api/clipboard', {'user_id': 123, 'content': 'hello'})
+
+    assert status == 200
+    event, payload = mock_emit.call_args[0]
+    assert event == 'clipboard_update'
+    assert payload['content'] == 'hello'
+    assert payload['seq'] == 8
+    assert mock_emit.call_args[1]['room'][0] == '123'
+    assert mock_db.insert_transaction.call_args[0][0] == 123
+    assert mock_db.insert_transaction.call_args[1]['seq'] == 8
+
+
+def test_add_clipboard_image_binary(mock_db, mock_emit):
+    """Test raw image bytes are stored as a blob and announced by digest"""
+    mock_db.insert_blob.return_value = 'ab' * 32
+    mock_db.next_sequence.return_value = 3
+
+    status, _, body = call_raw(
+        'POST', '/api/clipboard/123/image', b'\x89PNG bytes', query=b'content=shot',
+        headers=[(b'content-type', b'image/png')]
+    )
+
+    assert status == 200
+    assert json.loads(body)['image_digest'] == 'ab' * 32
+    mock_db.insert_blob.assert_called_once_with(b'\x89PNG bytes', 'image/png')
+    event, payload = mock_emit.call_args[0]
+    assert (event, payload['image_digest'], payload['content']) == \
+        ('clipboard_update', 'ab' * 32, 'shot')
+    assert mock_db.insert_transaction.call_args[1]['image_digest'] == 'ab' * 32
+
+
+def test_get_blob_and_entry(mock_db):
+    """Test blobs are streamed with a permanent ETag and entries fetched by id"""
+    digest = 'cd' * 32
+    mock_db.get_blob.return_value = {'data': b'png', 'mime_type': 'image/png'}
+
+    status, headers, body = call_raw('GET', f'/api/blob/{digest}')
+    assert (status, body, headers[b'content-type']) == (200, b'png', b'image/png')
+    assert headers[b'etag'] == f'"{digest}"'.encode()
+    assert call_raw('GET', f'/api/blob/{digest}',
+                    headers=[(b'if-none-match', headers[b'etag'])])[0] == 304
+    assert call('GET', '/api/blob/nothex')[0] == 400
+
+    mock_db.get_user_transaction.return_value = {'_id': 'a1', 'content': 'full'}
+    status, data = call('GET', '/api/clipboard/123/a1')
+    assert (status, data['entry']['content']) == (200, 'full')
+    mock_db.get_user_transaction.assert_called_once_with(123, 'a1')
+    mock_db.get_user_transaction.return_value = None
+    assert call('GET', '/api/clipboard/123/a2')[0] == 404
+
+
+def test_index_and_cache_stats(mock_db):
+    """Test the web UI page and cache statistics routes"""
+    status, headers, body = call_raw('GET', '/')
+    assert status == 200 and headers[b'content-type'].startswith(b'text/html')
+    assert b'<html' in body.lower()
+
+    mock_db.history_cache = None
+    assert call('GET', '/api/cache/stats') == (200, {'success': True, 'enabled': False})
+
+
+def test_add_clipboard_missing_data(mock_db, mock_emit):
+    """Test posting a clip without content"""
+    status, data = call('POST', '/api/clipboard', {'user_id': 123})
+
+    assert status == 400
+    mock_emit.assert_not_called()
+
+
+def test_add_clipboard_batch(mock_db, mock_emit):
+    """Test a batch upload is stored and broadcast once"""
+    mock_db.insert_transactions.return_value = [
+        {'_id': 'a1', 'seq': 1, 'content': 'a'},
+        {'_id': 'a2', 'seq': 2, 'content': 'b'}
+    ]
+
+    status, data = call('POST', '/api/clipboard/123/batch', {
+        'clips': [{'content': 'a'}, {'content': 'b'}]
+    })
+
+    assert status == 200
+    assert data['last_seq'] == 2
+    mock_emit.assert_called_once()
+    assert mock_emit.call_args[0][0] == 'clipboard_batch'
+    assert mock_emit.call_args[1]['room'][0] == '123'
+    assert call('POST', '/api/clipboard/123/batch', {'clips': []})[0] == 400
+
+
+def test_get_clipboard_history(mock_db):
+    """Test fetching history"""
+    mock_db.get_n_last_user_transaction.return_value = [
+        {'content': 'item1', 'timestamp': 1234567890}
+    ]
+
+    status, data = call('GET', '/api/clipboard/123', query=b'limit=10')
+
+    assert status == 200
+    assert data['history'][0]['content'] == 'item1'
+    assert mock_db.get_n_last_user_transaction.call_args[0] == (123, 10)
+
+
+def test_unknown_route_and_method(mock_db):
+    """Test routing errors"""
+    assert call('GET', '/api/nothing')[0] == 404
+    assert call('GET', '/api/login')[0] == 405
@@ -0,0 +1,85 @@
+import os
+
+from clip_buffer import ClipRingBuffer, estimate_item_bytes
+from clip_object import ClipObject
+
+
+def test_ring_buffer_keeps_newest_items():
+    """Test the count limit drops the oldest entries"""
+    buffer = ClipRingBuffer(max_items=3)
+
+    for i in range(5):
+        buffer.append(ClipObject(f"clip {i}"))
+
+    assert len(buffer) == 3
+    assert [clip.get_content() for clip in buffer] == ["clip 2", "clip 3", "clip 4"]
+    assert buffer[-1].get_content() == "clip 4"
+
+
+def test_ring_buffer_byte_limit_drops_oldest():
+    """Test payload beyond the byte limit is evicted without a spill directory"""
+    buffer = ClipRingBuffer(max_items=100, max_bytes=500)
+
+    for i in range(5):
+        buffer.append(ClipObject.from_image_bytes(bytes([i]) * 100))
+
+    assert len(buffer) == 2
+    assert buffer.memory_bytes <= 500
+    assert buffer[0].get_image_bytes() == bytes([3]) * 100
+
+
+def test_ring_buffer_spills_older_images(tmp_path):
+    """Test older images move to disk and load back on access"""
+    buffer = ClipRingBuffer(max_items=100, max_bytes=250, spill_dir=str(tmp_path))
+    images = [bytes([i]) * 100 for i in range(5)]
+
+    for image in images:
+        buffer.append(ClipObject.from_image_bytes(image))
+
+    assert len(buffer) == 5
+    assert buffer.memory_bytes <= 250
+    assert [clip.get_image_bytes() for clip in buffer] == images
+    assert buffer[0].get_content() == "Image (PNG)"
+
+    buffer.clear()
+    assert os.listdir(tmp_path) == []
+
+
+def test_image_size_counts_cached_base64():
+    """Test an image clip is sized with the base64 text it caches on upload"""
+    clip_obj = ClipObject.from_image_bytes(b'\x00' * 300)
+    estimated = estimate_item_bytes(clip_obj)
+
+    clip_obj.get_image_data()
+
+    assert estimated == len(clip_obj.get_content()) + 300 + len(clip_obj.image_data)
+    assert estimate_item_bytes(clip_obj) == estimated
+
+
+def test_buffers_sharing_a_spill_dir_use_distinct_files(tmp_path):
+    """Test two buffers spilling to one directory never overwrite each other"""
+    copied = ClipRingBuffer(max_items=100, max_bytes=250, spill_dir=str(tmp_path))
+    pasted = ClipRingBuffer(max_items=100, max_bytes=250, spill_dir=str(tmp_path))
+
+    for buffer, byte in ((copied, 1), (pasted, 2)):
+        buffer.append(ClipObject.from_image_bytes(bytes([byte]) * 100))
+        buffer.append(ClipObject("newest"))
+
+    assert len(os.listdir(tmp_path)) == 2
+    assert copied[0].get_image_bytes() == bytes([1]) * 100
+    assert pasted[0].get_image_bytes() == bytes([2]) * 100
+
+    copied.clear()
+    pasted.clear()
+    assert os.listdir(tmp_path) == []
+
+
+def test_ring_buffer_holds_strings():
+    """Test the pasted buffer use with plain strings"""
+    buffer = ClipRingBuffer(max_items=2)
+
+    buffer.append('')
+    buffer.append('pasted')
+
+    assert len(buffer) != 0
+    assert buffer[-1] == 'pasted'
@@ -0,0 +1,71 @@
+import random
+import string
+import pytest
+
+import clip_compression
+from clip_compression import (
+    compress_text, decompress_text, encode_event, decode_event, negotiate
+)
+
+
+LOG_TEXT = "".join(
+    f"2024-01-01 12:00:{i % 60:02d} INFO worker-{i % 8} processed job {i}\n"
+    for i in range(200)
+)
+
+
+def test_large_text_round_trip():
+    """Test large text is compressed and restored exactly"""
+    content, encoding = compress_text(LOG_TEXT, 'zlib')
+
+    assert encoding == 'zlib'
+    assert len(content) < len(LOG_TEXT) / 4
+    assert decompress_text(content, encoding) == LOG_TEXT
+
+
+def test_small_and_incompressible_text_stays_plain(monkeypatch):
+    """Test compression is skipped when it does not pay off"""
+    assert compress_text("short", 'zlib') == ("short", None)
+
+    # Random printable text only shrinks by about a fifth
+    rng = random.Random(1)
+    noise = ''.join(rng.choice(string.printable) for _ in range(4096))
+    monkeypatch.setattr(clip_compression, 'MIN_SAVING', 0.5)
+    assert compress_text(noise, 'zlib') == (noise, None)
+    assert decompress_text("plain", None) == "plain"
+
+
+def test_unknown_encoding_is_rejected():
+    """Test an unsupported codec raises instead of storing garbage"""
+    with pytest.raises(ValueError):
+        compress_text(LOG_TEXT, 'brotli')
+
+
+def test_event_round_trip():
+    """Test update and batch payloads are encoded for a client and decoded back"""
+    payload = {
+        'seq': 3,
+        'entries': [
+            {'content': LOG_TEXT, 'content_type': 'text'},
+            {'content': 'small', 'content_type': 'text'},
+            {'content': 'Image (PNG)', 'content_type': 'image'}
+        ]
+    }
+
+    encoded = encode_event(payload, 'zlib')
+
+    assert encoded is not payload
+    assert isinstance(encoded['entries'][0]['content'], bytes)
+    assert encoded['entries'][1] is payload['entries'][1]
+    assert payload['entries'][0]['content'] == LOG_TEXT
+    assert decode_event(encoded)['entries'][0]['content'] == LOG_TEXT
+    assert encode_event({'content': 'small'}, 'zlib') == {'content': 'small'}
+    assert encode_event(payload, None) is payload
+
+
+def test_negotiate():
+    """Test the first codec both sides support is chosen"""
+    assert negotiate(['brotli', 'zlib']) == 'zlib'
+    assert negotiate(['brotli']) is None
+    assert negotiate(None) is None
+    assert negotiate('zlib') is None
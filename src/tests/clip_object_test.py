@@ -27,6 +27,9 @@ def test_clip_object_json():
         "image_data": None
     }
 
+    obj.trace_id = "abc123"
+    assert obj.to_json()["trace_id"] == "abc123"
+
 
 def test_clip_object_image():
     """Test image clipboard object initialization"""
@@ -47,3 +50,21 @@ def test_clip_object_from_image_bytes():
     assert obj.get_content() == "Image (PNG)"
     assert obj.get_image_data() is not None
     assert obj.get_image_bytes() == image_bytes
+
+
+def test_clip_object_from_image_bytes_is_lazy():
+    """Test raw image bytes are kept and only base64 encoded on demand"""
+    image_bytes = b'\x89PNG\r\n\x1a\n'
+    obj = ClipObject.from_image_bytes(image_bytes)
+
+    assert obj.get_image_bytes() is image_bytes
+    assert obj.image_data is None
+    assert obj.to_json()["image_data"] == "iVBORw0KGgo="
+
+
+def test_clip_object_content_hash():
+    """Test the content hash depends on the type and payload only"""
+    assert ClipObject("same").get_content_hash() == ClipObject("same").get_content_hash()
+    assert ClipObject("same").get_content_hash() != ClipObject("other").get_content_hash()
+    assert ClipObject.from_image_bytes(b"same").get_content_hash() != \
+        ClipObject("same").get_content_hash()
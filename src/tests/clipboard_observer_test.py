@@ -0,0 +1,190 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from clipboard_observer import (
+    ClipboardObserver, ClipboardSubject, ClipDeduplicator, ServerClipboardObserver
+)
+from upload_queue import UploadError
+from clip_object import ClipObject
+
+
+class RecordingObserver(ClipboardObserver):
+    """Observer keeping every notified clip"""
+
+    def __init__(self):
+        self.clips = []
+
+    def update(self, user_id, clip_obj):
+        self.clips.append(clip_obj.get_content())
+
+
+def make_subject(**kwargs):
+    subject = ClipboardSubject(deduplicator=ClipDeduplicator(**kwargs))
+    observer = RecordingObserver()
+    subject.attach(observer)
+    return subject, observer
+
+
+def test_notify_without_deduplicator_sends_everything():
+    """Test the subject forwards every clip by default"""
+    subject = ClipboardSubject()
+    observer = RecordingObserver()
+    subject.attach(observer)
+
+    subject.notify(1, ClipObject("same"))
+    subject.notify(1, ClipObject("same"))
+
+    assert observer.clips == ["same", "same"]
+
+
+def test_consecutive_duplicates_are_suppressed():
+    """Test repeated Ctrl+C on the same content uploads once"""
+    subject, observer = make_subject(window=0)
+
+    for _ in range(5):
+        subject.notify(1, ClipObject("same"))
+    subject.notify(1, ClipObject("other"))
+
+    assert observer.clips == ["same", "other"]
+    assert subject.deduplicator.suppressed == 4
+
+
+def test_repeats_within_window_are_suppressed():
+    """Test A, B, A in quick succession does not upload A twice"""
+    subject, observer = make_subject(window=60)
+
+    subject.notify(1, ClipObject("a"))
+    subject.notify(1, ClipObject("b"))
+    subject.notify(1, ClipObject("a"))
+
+    assert observer.clips == ["a", "b"]
+
+
+def test_repeats_after_window_are_sent():
+    """Test a repeat after the window is a genuine new copy"""
+    subject, observer = make_subject(window=2)
+
+    with patch('clipboard_observer.time.monotonic', side_effect=[0, 1, 10]):
+        subject.notify(1, ClipObject("a"))
+        subject.notify(1, ClipObject("b"))
+        subject.notify(1, ClipObject("a"))
+
+    assert observer.clips == ["a", "b", "a"]
+
+
+def test_remembered_server_updates_are_not_echoed():
+    """Test content written from a server update is not uploaded back"""
+    subject, observer = make_subject(window=0)
+
+    subject.deduplicator.remember(ClipObject("from server"))
+    subject.notify(1, ClipObject("from server"))
+
+    assert observer.clips == []
+
+
+def test_images_are_compared_by_bytes():
+    """Test identical image payloads are duplicates whatever their description"""
+    subject, observer = make_subject(window=0)
+    first = ClipObject.from_image_bytes(b"\x89PNG same")
+    second = ClipObject.from_image_bytes(b"\x89PNG same")
+    second.content = "Screenshot"
+
+    subject.notify(1, first)
+    subject.notify(1, second)
+
+    assert len(observer.clips) == 1
+
+
+def test_failed_uploads_can_be_copied_again():
+    """Test a clip given up on is not treated as known to the server"""
+    subject, observer = make_subject(window=60)
+    clip_obj = ClipObject("a")
+
+    subject.notify(1, clip_obj)
+    subject.notify(1, ClipObject("a"))
+    subject.deduplicator.forget(clip_obj)
+    subject.notify(1, ClipObject("a"))
+
+    assert observer.clips == ["a", "a"]
+
+
+def test_confirmed_uploads_stay_known():
+    """Test a clip the server accepted is still dropped when copied again"""
+    subject, observer = make_subject(window=60)
+    clip_obj = ClipObject("a")
+
+    subject.notify(1, clip_obj)
+    subject.deduplicator.confirm(clip_obj)
+    subject.notify(1, ClipObject("b"))
+    subject.notify(1, ClipObject("a"))
+
+    assert observer.clips == ["a", "b"]
+
+
+def test_server_observer_reports_uploads_to_deduplicator():
+    """Test a rejected upload is retried when the content is copied again"""
+    subject = ClipboardSubject(deduplicator=ClipDeduplicator(window=60))
+    observer = ServerClipboardObserver(
+        'http://server', max_retries=0, deduplicator=subject.deduplicator
+    )
+    observer.session = MagicMock()
+    observer.session.post.side_effect = [
+        MagicMock(status_code=400), MagicMock(status_code=200)
+    ]
+    subject.attach(observer)
+
+    for _ in range(3):
+        subject.notify(7, ClipObject("hello"))
+        assert observer.queue.flush(5)
+
+    assert observer.session.post.call_count == 2
+    assert observer.queue.stats()['failed'] == 1
+    assert observer.queue.stats()['sent'] == 1
+    observer.close()
+
+
+def test_server_observer_uploads_in_background():
+    """Test update() queues the clip and a pooled session sends it"""
+    observer = ServerClipboardObserver('http://server', max_retries=0)
+    observer.session = MagicMock()
+    observer.session.post.return_value.status_code = 200
+
+    observer.update(7, ClipObject("hello"))
+    assert observer.queue.flush(5)
+
+    url = observer.session.post.call_args[0][0]
+    assert url == 'http://server/api/clipboard'
+    assert observer.session.post.call_args[1]['json']['content'] == "hello"
+    observer.close()
+
+
+def test_server_observer_classifies_failures():
+    """Test server errors are retryable and rejections are not"""
+    observer = ServerClipboardObserver('http://server')
+    observer.session = MagicMock()
+
+    observer.session.post.return_value.status_code = 503
+    with pytest.raises(UploadError) as error:
+        observer.send(7, ClipObject("hello"))
+    assert error.value.retryable is True
+
+    observer.session.post.return_value.status_code = 400
+    with pytest.raises(UploadError) as error:
+        observer.send(7, ClipObject("hello"))
+    assert error.value.retryable is False
+    observer.close()
+
+
+def test_server_observer_sends_batches():
+    """Test several clips are posted to the batch endpoint in one request"""
+    observer = ServerClipboardObserver('http://server')
+    observer.session = MagicMock()
+    observer.session.post.return_value.status_code = 200
+
+    observer.send_batch(7, [ClipObject("a"), ClipObject("b")])
+
+    url = observer.session.post.call_args[0][0]
+    assert url == 'http://server/api/clipboard/7/batch'
+    clips = observer.session.post.call_args[1]['json']['clips']
+    assert [clip['content'] for clip in clips] == ["a", "b"]
+    observer.close()
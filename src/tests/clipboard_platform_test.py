@@ -0,0 +1,183 @@
+import time
+from unittest.mock import MagicMock, patch
+
+from clipboard_platform import ClipboardPlatform, ClipboardWatcher, find_command
+from clip_object import ClipObject
+
+
+class FakeClipboard:
+    """Clipboard stand-in with a change counter as its change token"""
+
+    os_type = 'test'
+
+    def __init__(self, text=None, token=True, empty_token=None):
+        self.text = text
+        self.counter = 0
+        self.reads = 0
+        self.token = token
+        self.empty_token = empty_token
+
+    def copy(self, text):
+        self.text = text
+        self.counter += 1
+
+    def get_change_token(self):
+        return self.counter if self.token else self.empty_token
+
+    def get_clipboard_content(self):
+        self.reads += 1
+        return ClipObject(content=self.text) if self.text else None
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_watcher_reports_each_new_copy():
+    """Test every change is reported once and the startup content is not"""
+    clipboard = FakeClipboard('already there')
+    changes = []
+    watcher = ClipboardWatcher(
+        lambda clip: changes.append(clip.get_content()),
+        clipboard=clipboard, min_interval=0.01, max_interval=0.02
+    )
+    assert watcher.mode == 'poll'
+
+    watcher.start()
+    clipboard.copy('first')
+    assert wait_for(lambda: changes == ['first'])
+    clipboard.copy('second')
+    assert wait_for(lambda: changes == ['first', 'second'])
+    watcher.stop()
+
+
+def test_watcher_detects_copies_with_empty_tokens():
+    """Test a constant empty token (owner without TIMESTAMP) still polls content"""
+    for empty_token in (b'', ()):
+        clipboard = FakeClipboard('start', token=False, empty_token=empty_token)
+        changes = []
+        watcher = ClipboardWatcher(
+            lambda clip: changes.append(clip.get_content()),
+            clipboard=clipboard, min_interval=0.01, max_interval=0.02
+        )
+
+        watcher.start()
+        clipboard.copy('copied')
+        assert wait_for(lambda: changes == ['copied'])
+        watcher.stop()
+
+
+def test_watcher_skips_payload_reads_while_token_unchanged():
+    """Test polling only reads the payload after the change token moved"""
+    clipboard = FakeClipboard('text')
+    watcher = ClipboardWatcher(
+        MagicMock(), clipboard=clipboard, min_interval=0.01, max_interval=0.01
+    )
+
+    watcher.start()
+    time.sleep(0.2)
+    watcher.stop()
+
+    # Only the startup read: the token never changed
+    assert clipboard.reads == 1
+
+
+def test_watcher_ignores_remembered_content():
+    """Test content set from a server update is not reported back"""
+    clipboard = FakeClipboard(token=False)
+    on_change = MagicMock()
+    watcher = ClipboardWatcher(on_change, clipboard=clipboard)
+
+    remote = ClipObject(content='from server')
+    watcher.remember(remote)
+    clipboard.copy('from server')
+
+    assert watcher.check() is False
+    on_change.assert_not_called()
+
+    clipboard.copy('local copy')
+    assert watcher.check() is True
+    on_change.assert_called_once()
+
+
+def _xclip_platform():
+    """ClipboardPlatform on the xclip backend, without the X11 connection"""
+    clipboard = ClipboardPlatform()
+    clipboard.os_type = 'linux'
+    clipboard.linux_backend = 'xclip'
+    clipboard._x11_checked = True
+    return clipboard
+
+
+def _fake_xclip(timestamp, targets):
+    def run(command, **kwargs):
+        target = command[command.index('-t') + 1]
+        stdout = {'TIMESTAMP': timestamp[0], 'TARGETS': targets}.get(target, b'')
+        return MagicMock(returncode=0, stdout=stdout)
+    return run
+
+
+def test_clipboard_content_cached_until_token_changes():
+    """Test an unchanged clipboard costs one token probe and no payload read"""
+    clipboard = _xclip_platform()
+    timestamp = [b'1000']
+    with patch('clipboard_platform.subprocess.run',
+               side_effect=_fake_xclip(timestamp, b'UTF8_STRING\nTEXT')) as run, \
+            patch('clipboard_platform.pyperclip.paste', return_value='hello') as paste:
+        first = clipboard.get_clipboard_content()
+        calls_after_first = run.call_count
+        second = clipboard.get_clipboard_content()
+
+        assert first.get_content() == second.get_content() == 'hello'
+        # TIMESTAMP + TARGETS, and no image read since no image/png target
+        assert calls_after_first == 2
+        assert run.call_count == 3
+        paste.assert_called_once()
+
+        timestamp[0] = b'2000'
+        clipboard.get_clipboard_content()
+        assert paste.call_count == 2
+
+
+def test_owner_without_timestamp_is_never_cached():
+    """Test an empty TIMESTAMP reply disables caching instead of freezing it"""
+    clipboard = _xclip_platform()
+    with patch('clipboard_platform.subprocess.run',
+               side_effect=_fake_xclip([b''], b'UTF8_STRING')), \
+            patch('clipboard_platform.pyperclip.paste', side_effect=['first', 'second']):
+        assert clipboard.get_change_token() is None
+        assert clipboard.get_clipboard_content().get_content() == 'first'
+        assert clipboard.get_clipboard_content().get_content() == 'second'
+
+
+def test_is_image_available_uses_cached_targets():
+    """Test the image probe reuses the TARGETS list of the current owner"""
+    clipboard = _xclip_platform()
+    with patch('clipboard_platform.subprocess.run',
+               side_effect=_fake_xclip([b'1000'], b'TARGETS\nimage/png')) as run:
+        assert clipboard.is_image_available() is True
+        assert clipboard.is_image_available() is True
+
+    commands = [call[0][0] for call in run.call_args_list]
+    assert sum('TARGETS' in command for command in commands) == 1
+
+
+def test_command_exists_reports_missing_commands():
+    """Test a missing tool is reported as missing"""
+    assert ClipboardPlatform._command_exists('syncclipboard-missing-tool') is False
+
+
+def test_find_command_probes_each_tool_once():
+    """Test PATH is searched once per tool name"""
+    find_command.cache_clear()
+    with patch('clipboard_platform.shutil.which', return_value='/usr/bin/xclip') as which:
+        assert find_command('xclip') == '/usr/bin/xclip'
+        assert ClipboardPlatform._command_exists('xclip') is True
+    find_command.cache_clear()
+
+    which.assert_called_once_with('xclip')
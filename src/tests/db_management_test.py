@@ -1,9 +1,19 @@
 import pytest
 from unittest.mock import Mock, patch, MagicMock
+from datetime import datetime, timezone
 
-from db_management import MongoCRUD
+from bson.objectid import ObjectId
+
+from pymongo.read_preferences import SecondaryPreferred
+
+import db_management
+from db_management import (
+    MongoCRUD, PoolMetricsListener, make_history_cursor, parse_history_cursor,
+    metadata_view, shared_client
+)
 from clip_user import ClipUser
 from clip_object import ClipObject
+import metrics
 
 
 @pytest.fixture
@@ -79,4 +89,435 @@ def test_get_n_last_user_transaction(mock_mongo):
     result = my_db.get_n_last_user_transaction(12345, 2)
 
     assert len(result) == 2
-    my_db.transactions.find.assert_called_once_with({"user_id": 12345})
\ No newline at end of file
+    my_db.transactions.find.assert_called_once_with({"user_id": 12345})
+
+
+def test_insert_transaction_image_uses_blob_store(mock_mongo):
+    """Test image transactions store a digest reference instead of inline data"""
+    my_db = MongoCRUD()
+    my_db.blobs = MagicMock()
+    my_db.blobs.update_one.return_value.matched_count = 0
+    clip_obj = ClipObject.from_image_bytes(b"fake png bytes")
+
+    my_db.insert_transaction(12345, clip_obj)
+
+    my_db.blobs.insert_one.assert_called_once()
+    blob = my_db.blobs.insert_one.call_args[0][0]
+    transaction = my_db.transactions.insert_one.call_args[0][0]
+    assert transaction["image_digest"] == blob["_id"]
+    assert "image_data" not in transaction
+    assert bytes(blob["data"]) == b"fake png bytes"
+    assert isinstance(blob["created_at"], datetime)
+
+
+def test_insert_blob_deduplicates(mock_mongo):
+    """Test storing an already known blob only refreshes its created_at"""
+    my_db = MongoCRUD()
+    my_db.blobs.update_one.return_value.matched_count = 1
+
+    first = my_db.insert_blob(b"same bytes")
+    second = my_db.insert_blob(b"same bytes")
+
+    assert first == second
+    my_db.blobs.insert_one.assert_not_called()
+    query, update = my_db.blobs.update_one.call_args[0]
+    assert query == {"_id": first}
+    assert isinstance(update["$set"]["created_at"], datetime)
+
+
+def test_get_n_last_user_transaction_metadata_only(mock_mongo):
+    """Test metadata-only history uses a projection without full payloads"""
+    my_db = MongoCRUD()
+    mock_cursor = MagicMock()
+    mock_cursor.sort.return_value.limit.return_value = []
+    my_db.transactions.find.return_value = mock_cursor
+
+    my_db.get_n_last_user_transaction(12345, 50, metadata_only=True)
+
+    projection = my_db.transactions.find.call_args[1]["projection"]
+    assert "content" not in projection
+    assert "image_data" not in projection
+    assert "preview" in projection
+
+
+def test_get_user_transaction_invalid_id(mock_mongo):
+    """Test fetching a transaction with a malformed ID"""
+    my_db = MongoCRUD()
+
+    assert my_db.get_user_transaction(12345, "not-an-id") is None
+    my_db.transactions.find_one.assert_not_called()
+
+
+def test_get_n_last_user_transaction_before_cursor(mock_mongo):
+    """Test paging with a cursor uses a keyset range query"""
+    my_db = MongoCRUD()
+    mock_cursor = MagicMock()
+    mock_cursor.sort.return_value.limit.return_value = []
+    my_db.transactions.find.return_value = mock_cursor
+    last = {"_id": ObjectId("65a000000000000000000001"), "timestamp": 1234.5}
+
+    my_db.get_n_last_user_transaction(12345, 2, before=make_history_cursor(last))
+
+    query = my_db.transactions.find.call_args[0][0]
+    assert query["user_id"] == 12345
+    assert query["$or"] == [
+        {"timestamp": {"$lt": 1234.5}},
+        {"timestamp": 1234.5, "_id": {"$lt": last["_id"]}}
+    ]
+    mock_cursor.sort.assert_called_once_with([("timestamp", -1), ("_id", -1)])
+
+
+def test_parse_history_cursor_invalid():
+    """Test malformed cursors are rejected"""
+    with pytest.raises(ValueError):
+        parse_history_cursor("garbage")
+
+
+def test_ensure_indexes(mock_mongo):
+    """Test index provisioning creates the history and user indexes"""
+    my_db = MongoCRUD()
+
+    result = my_db.ensure_indexes()
+
+    assert result == my_db
+    created = [call[0][0] for call in my_db.transactions.create_index.call_args_list]
+    assert [("user_id", 1), ("timestamp", -1), ("_id", -1)] in created
+    assert [("user_id", 1), ("seq", 1)] in created
+    assert [("username", 1)] in created
+    assert [("id", 1)] in created
+
+
+def _explain_cursor(winning_plan):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.explain.return_value = {"queryPlanner": {"winningPlan": winning_plan}}
+    return cursor
+
+
+def test_check_query_plans_index_backed(mock_mongo):
+    """Test no query is reported when every plan uses an index"""
+    my_db = MongoCRUD()
+    my_db.transactions.find.return_value = _explain_cursor(
+        {"stage": "LIMIT", "inputStage": {"stage": "FETCH",
+                                          "inputStage": {"stage": "IXSCAN"}}}
+    )
+
+    assert my_db.check_query_plans() == {}
+
+
+def test_check_query_plans_collection_scan(mock_mongo):
+    """Test collection scans and in-memory sorts are reported"""
+    my_db = MongoCRUD()
+    my_db.transactions.find.return_value = _explain_cursor(
+        {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}
+    )
+
+    unindexed = my_db.check_query_plans()
+
+    assert "get_n_last_user_transaction" in unindexed
+    assert unindexed["get_n_last_user_transaction"] == ["SORT", "COLLSCAN"]
+
+
+def test_insert_transaction_write_behind(mock_mongo):
+    """Test buffered inserts are written together with insert_many"""
+    my_db = MongoCRUD().enable_write_behind(max_batch=10, max_delay=60)
+
+    my_db.insert_transaction(12345, ClipObject("first"))
+    my_db.insert_transaction(12345, ClipObject("second"))
+    my_db.transactions.insert_one.assert_not_called()
+
+    my_db.flush()
+
+    my_db.transactions.insert_many.assert_called_once()
+    written = my_db.transactions.insert_many.call_args[0][0]
+    assert [t["content"] for t in written] == ["first", "second"]
+    assert all("_id" in t for t in written)
+    my_db.close()
+
+
+def test_delete_orphan_blobs(mock_mongo):
+    """Test the sweep deletes old blobs without remaining references"""
+    my_db = MongoCRUD()
+    my_db.blobs = MagicMock()
+    my_db.blobs.find.return_value = [{"_id": "orphan"}, {"_id": "still-used"}]
+    my_db.blobs.delete_one.return_value.deleted_count = 1
+    my_db.transactions.find_one.side_effect = lambda query, projection: (
+        {"_id": 1} if query["image_digest"] == "still-used" else None
+    )
+    cutoff = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    deleted = my_db.delete_orphan_blobs(cutoff)
+
+    assert deleted == 1
+    my_db.blobs.find.assert_called_once_with({"created_at": {"$lte": cutoff}}, {"_id": 1})
+    # A blob stored again since the find no longer matches the delete
+    my_db.blobs.delete_one.assert_called_once_with(
+        {"created_at": {"$lte": cutoff}, "_id": "orphan"}
+    )
+
+
+def test_from_env_creates_indexes(mock_mongo, monkeypatch):
+    """Test indexes are created at startup unless opted out"""
+    monkeypatch.setattr(db_management, '_shared_clients', {})
+    threads = []
+    original = MongoCRUD.ensure_indexes_in_background
+
+    def record(self):
+        threads.append(original(self))
+        return threads[-1]
+
+    monkeypatch.setattr(MongoCRUD, 'ensure_indexes_in_background', record)
+    monkeypatch.delenv('MONGODB_ENSURE_INDEXES', raising=False)
+    my_db = MongoCRUD.from_env()
+    threads[0].join(5)
+    index_names = [call[1]["name"] for call in my_db.transactions.create_index.call_args_list]
+    assert "user_id_timestamp_id" in index_names
+
+    monkeypatch.setenv('MONGODB_ENSURE_INDEXES', 'false')
+    MongoCRUD.from_env()
+    assert len(threads) == 1
+
+
+def test_history_cache_is_opt_in(mock_mongo, monkeypatch):
+    """Test from_env only caches history in single-process setups that ask for it"""
+    monkeypatch.delenv('HISTORY_CACHE_USERS', raising=False)
+    monkeypatch.delenv('SOCKETIO_MESSAGE_QUEUE', raising=False)
+    monkeypatch.setattr(db_management, '_shared_clients', {})
+    assert MongoCRUD.from_env().history_cache is None
+
+    monkeypatch.setenv('HISTORY_CACHE_USERS', '100')
+    assert MongoCRUD.from_env().history_cache is not None
+
+    monkeypatch.setenv('SOCKETIO_MESSAGE_QUEUE', 'redis://cache:6379/0')
+    assert MongoCRUD.from_env().history_cache is None
+
+
+def test_history_cache_serves_repeated_reads(mock_mongo):
+    """Test cached history avoids the database and follows writes"""
+    my_db = MongoCRUD().enable_history_cache(depth=10)
+    mock_cursor = MagicMock()
+    mock_cursor.sort.return_value.limit.return_value = [
+        {"_id": "b", "content": "item2", "timestamp": 2},
+        {"_id": "a", "content": "item1", "timestamp": 1}
+    ]
+    my_db.transactions.find.return_value = mock_cursor
+
+    my_db.get_n_last_user_transaction(12345, 10)
+    my_db.insert_transaction(12345, ClipObject("item3"))
+    result = my_db.get_n_last_user_transaction(12345, 2, metadata_only=True)
+
+    my_db.transactions.find.assert_called_once()
+    assert [t["preview"] for t in result] == ["item3", "item2"]
+    assert my_db.history_cache.stats()["hits"] == 1
+
+
+def test_history_cache_load_includes_buffered_writes(mock_mongo):
+    """Test a cache miss flushes write-behind before loading the history"""
+    my_db = MongoCRUD().enable_write_behind(max_batch=10, max_delay=60)
+    my_db.enable_history_cache(depth=10)
+    stored = []
+    my_db.transactions.insert_many.side_effect = lambda docs, **kwargs: stored.extend(docs)
+    mock_cursor = MagicMock()
+    mock_cursor.sort.return_value.limit.side_effect = lambda n: list(reversed(stored))[:n]
+    my_db.transactions.find.return_value = mock_cursor
+
+    my_db.insert_transaction(12345, ClipObject("buffered"))
+    first = my_db.get_n_last_user_transaction(12345, 10)
+    my_db.insert_transaction(12345, ClipObject("cached"))
+    second = my_db.get_n_last_user_transaction(12345, 10)
+
+    assert [t["content"] for t in first] == ["buffered"]
+    assert [t["content"] for t in second] == ["cached", "buffered"]
+    my_db.transactions.find.assert_called_once()
+    my_db.close()
+
+
+def test_insert_transaction_assigns_sequence(mock_mongo):
+    """Test each transaction gets the next sequence number of its user"""
+    my_db = MongoCRUD()
+    my_db.counters = MagicMock()
+    my_db.counters.find_one_and_update.return_value = {"_id": 12345, "seq": 7}
+
+    my_db.insert_transaction(12345, ClipObject("content"))
+
+    assert my_db.counters.find_one_and_update.call_args[0][:2] == (
+        {"_id": 12345}, {"$inc": {"seq": 1}}
+    )
+    assert my_db.transactions.insert_one.call_args[0][0]["seq"] == 7
+
+
+def test_insert_transaction_reserved_sequence(mock_mongo):
+    """Test a sequence number reserved by the caller is used as is"""
+    my_db = MongoCRUD()
+    my_db.counters = MagicMock()
+
+    my_db.insert_transaction(12345, ClipObject("content"), seq=3)
+
+    my_db.counters.find_one_and_update.assert_not_called()
+    assert my_db.transactions.insert_one.call_args[0][0]["seq"] == 3
+
+
+def test_get_transactions_since(mock_mongo):
+    """Test delta sync only asks for entries after the given sequence"""
+    my_db = MongoCRUD()
+    mock_cursor = MagicMock()
+    mock_cursor.sort.return_value.limit.return_value = [{"seq": 4}, {"seq": 5}]
+    my_db.transactions.find.return_value = mock_cursor
+
+    result = my_db.get_transactions_since(12345, 3, limit=10)
+
+    assert result == [{"seq": 4}, {"seq": 5}]
+    my_db.transactions.find.assert_called_once_with(
+        {"user_id": 12345, "seq": {"$gt": 3}}
+    )
+    mock_cursor.sort.assert_called_once_with("seq", 1)
+    mock_cursor.sort.return_value.limit.assert_called_once_with(10)
+
+
+def test_get_last_stored_sequence(mock_mongo):
+    """Test the resume point comes from stored transactions, not the counter"""
+    my_db = MongoCRUD()
+    my_db.transactions.find_one.return_value = {"seq": 6}
+
+    assert my_db.get_last_stored_sequence(12345) == 6
+    assert my_db.transactions.find_one.call_args[1]["sort"] == [("seq", -1)]
+    my_db.transactions.find_one.return_value = None
+    assert my_db.get_last_stored_sequence(12345) == 0
+
+
+def test_insert_transactions_single_round_trip(mock_mongo):
+    """Test a batch reserves one block of sequence numbers and one insert_many"""
+    my_db = MongoCRUD()
+    my_db.counters = MagicMock()
+    my_db.transactions = MagicMock()
+    my_db.counters.find_one_and_update.return_value = {"_id": 12345, "seq": 12}
+
+    result = my_db.insert_transactions(
+        12345, [ClipObject("a"), ClipObject("b"), ClipObject("c")]
+    )
+
+    assert my_db.counters.find_one_and_update.call_args[0][1] == {"$inc": {"seq": 3}}
+    my_db.transactions.insert_many.assert_called_once()
+    my_db.transactions.insert_one.assert_not_called()
+    assert [t["seq"] for t in result] == [10, 11, 12]
+    assert [t["content"] for t in my_db.transactions.insert_many.call_args[0][0]] == \
+        ["a", "b", "c"]
+
+
+def test_compressed_text_is_decoded_on_read(mock_mongo):
+    """Test large text is stored compressed and read back as plain text"""
+    my_db = MongoCRUD().enable_compression('zlib', threshold=100)
+    my_db.transactions = MagicMock()
+    large = "log line\n" * 100
+
+    my_db.insert_transaction(12345, ClipObject(large), seq=1)
+    my_db.insert_transaction(12345, ClipObject("small"), seq=2)
+
+    stored = my_db.transactions.insert_one.call_args_list[0][0][0]
+    assert stored["content_encoding"] == "zlib"
+    assert isinstance(stored["content"], bytes)
+    assert stored["preview"] == large[:200] and stored["truncated"] is True
+    assert "content_encoding" not in my_db.transactions.insert_one.call_args[0][0]
+    assert metadata_view(stored)["preview"] == large[:200]
+
+    my_db.transactions.find_one.return_value = stored
+    entry = my_db.get_user_transaction(12345, str(stored["_id"]))
+    assert entry["content"] == large
+    assert "content_encoding" not in entry
+
+
+def test_enable_metrics_times_methods(mock_mongo):
+    """Test database calls are recorded per method once metrics are enabled"""
+    my_db = MongoCRUD().enable_metrics()
+    my_db.counters = MagicMock()
+    my_db.counters.find_one.return_value = {"seq": 4}
+    before = metrics.DB_OPERATION_SECONDS.count(method="get_last_sequence")
+
+    assert my_db.get_last_sequence(12345) == 4
+
+    assert metrics.DB_OPERATION_SECONDS.count(method="get_last_sequence") == before + 1
+
+
+def test_pool_options_from_env(mock_mongo, monkeypatch):
+    """Test pool and timeout variables become MongoClient options"""
+    monkeypatch.setenv('MONGODB_MAX_POOL_SIZE', '20')
+    monkeypatch.setenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', '500')
+    monkeypatch.setenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '2000')
+    monkeypatch.delenv('MONGODB_SOCKET_TIMEOUT_MS', raising=False)
+
+    MongoCRUD()
+
+    kwargs = db_management.MongoClient.call_args.kwargs
+    assert kwargs == {
+        'maxPoolSize': 20, 'waitQueueTimeoutMS': 500, 'serverSelectionTimeoutMS': 2000
+    }
+
+
+def test_shared_client_is_reused(mock_mongo, monkeypatch):
+    """Test instances from the environment share one lazily connected client"""
+    monkeypatch.setattr(db_management, '_shared_clients', {})
+    monkeypatch.setenv('MONGODB_MAX_POOL_SIZE', '30')
+
+    assert shared_client() is shared_client()
+    assert db_management.MongoClient.call_count == 1
+    assert db_management.MongoClient.call_args.kwargs['connect'] is False
+    assert MongoCRUD(shared_client()).client is mock_mongo
+
+    monkeypatch.setenv('MONGODB_MAX_POOL_SIZE', '40')
+    shared_client()
+    assert db_management.MongoClient.call_count == 2
+
+
+def test_configure_operations(mock_mongo):
+    """Test read preference and write concerns per operation class"""
+    my_db = MongoCRUD().configure_operations(
+        history_read_preference='secondaryPreferred',
+        clip_write_concern='1',
+        account_write_concern='majority',
+        max_staleness=120,
+        wtimeout_ms=1000
+    )
+
+    assert isinstance(my_db.history_read_preference, SecondaryPreferred)
+    assert my_db.history_read_preference.max_staleness == 120
+    assert my_db.clip_write_concern.document == {'w': 1, 'wtimeout': 1000}
+    assert my_db.account_write_concern.document == {'w': 'majority', 'wtimeout': 1000}
+    mock_mongo['prod_env'].get_collection.assert_any_call(
+        'transactions', read_preference=my_db.history_read_preference
+    )
+
+    with pytest.raises(ValueError):
+        my_db.configure_operations(history_read_preference='fastest')
+    with pytest.raises(ValueError):
+        my_db.configure_operations(clip_write_concern='all')
+
+
+def test_pool_metrics_listener():
+    """Test pool events update the connection gauges and wait histogram"""
+    # Event constructors differ between pymongo versions
+    event = Mock(address=('db-test', 27017), options={'maxPoolSize': 5}, reason='timeout')
+    listener = PoolMetricsListener()
+    waits = metrics.MONGO_POOL_WAIT_SECONDS.count(address='db-test:27017')
+    failures = metrics.MONGO_POOL_CHECKOUT_FAILURES.value(
+        address='db-test:27017', reason='timeout'
+    )
+
+    listener.pool_created(event)
+    listener.connection_created(event)
+    listener.connection_check_out_started(event)
+    listener.connection_checked_out(event)
+
+    assert metrics.MONGO_POOL_MAX_SIZE.value(address='db-test:27017') == 5
+    assert metrics.MONGO_POOL_CONNECTIONS.value(address='db-test:27017') == 1
+    assert metrics.MONGO_POOL_CHECKED_OUT.value(address='db-test:27017') == 1
+
+    listener.connection_checked_in(event)
+    listener.connection_check_out_started(event)
+    listener.connection_check_out_failed(event)
+
+    assert metrics.MONGO_POOL_CHECKED_OUT.value(address='db-test:27017') == 0
+    assert metrics.MONGO_POOL_WAIT_SECONDS.count(address='db-test:27017') == waits + 2
+    assert metrics.MONGO_POOL_CHECKOUT_FAILURES.value(
+        address='db-test:27017', reason='timeout'
+    ) == failures + 1
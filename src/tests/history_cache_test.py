@@ -0,0 +1,79 @@
+from history_cache import HistoryCache, ENTRY_OVERHEAD_BYTES
+
+
+def make_history(count, start=0):
+    """Newest-first transactions"""
+    return [{'_id': str(i), 'content': f'item{i}'} for i in reversed(range(start, start + count))]
+
+
+def test_get_miss_then_hit():
+    """Test a cached user is served and counted as a hit"""
+    cache = HistoryCache(depth=5)
+
+    assert cache.get(1, 5) is None
+    cache.put(1, make_history(5))
+
+    assert [t['_id'] for t in cache.get(1, 2)] == ['4', '3']
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_get_more_than_cached():
+    """Test requests deeper than the cached history miss unless it is complete"""
+    cache = HistoryCache(depth=3)
+    cache.put(1, make_history(3))
+    cache.put(2, make_history(2))
+
+    assert cache.get(1, 10) is None
+    assert len(cache.get(2, 10)) == 2
+
+
+def test_push_keeps_newest_entries():
+    """Test writes are prepended and the history stays at depth"""
+    cache = HistoryCache(depth=3)
+    cache.put(1, make_history(3))
+
+    cache.push(1, {'_id': 'new', 'content': 'new'})
+    cache.push(2, {'_id': 'other', 'content': 'ignored'})
+
+    assert [t['_id'] for t in cache.get(1, 3)] == ['new', '2', '1']
+    assert cache.stats()['users'] == 1
+
+
+def test_invalidate_transaction():
+    """Test updating or deleting a transaction drops its user's history"""
+    cache = HistoryCache(depth=3)
+    cache.put(1, make_history(3))
+
+    cache.invalidate_transaction('1')
+
+    assert cache.get(1, 1) is None
+
+
+def test_lru_eviction_by_users_and_bytes():
+    """Test least recently used users are evicted first"""
+    cache = HistoryCache(max_users=2, depth=1)
+    cache.put(1, make_history(1))
+    cache.put(2, make_history(1))
+    cache.get(1, 1)
+    cache.put(3, make_history(1))
+
+    assert cache.get(2, 1) is None
+    assert cache.get(1, 1) is not None
+    assert cache.stats()['evictions'] == 1
+
+    small = HistoryCache(max_bytes=ENTRY_OVERHEAD_BYTES * 2, depth=1)
+    small.put(1, make_history(1))
+    small.put(2, make_history(1))
+    assert small.stats()['users'] == 1
+
+
+def test_put_discarded_after_racing_write():
+    """Test a load that raced a write is not cached"""
+    cache = HistoryCache(depth=3)
+
+    cache.begin_load(1)
+    cache.push(1, {'_id': 'new', 'content': 'new'})
+    cache.put(1, make_history(3))
+
+    assert cache.get(1, 1) is None
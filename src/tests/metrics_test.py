@@ -0,0 +1,107 @@
+import pytest
+
+from metrics import (
+    INGESTED_CLIPS, BROADCAST_BYTES, MetricsRegistry, _Metric, instrument,
+    record_broadcast, record_ingest
+)
+
+
+def test_render_prometheus_text():
+    """Test counters, gauges and histograms render in the exposition format"""
+    registry = MetricsRegistry()
+    counter = registry.counter('clips_total', 'Clips', ('content_type',))
+    gauge = registry.gauge('connections', 'Connections')
+    histogram = registry.histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1))
+
+    counter.inc(content_type='text')
+    counter.inc(2, content_type='te"xt')
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    histogram.observe(0.05, route='/a')
+    histogram.observe(0.5, route='/a')
+
+    text = registry.render()
+    assert '# TYPE clips_total counter' in text
+    assert 'clips_total{content_type="text"} 1' in text
+    assert 'clips_total{content_type="te\\"xt"} 2' in text
+    assert 'connections 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{route="/a"} 2' in text
+
+
+def test_gauge_function_is_evaluated_on_scrape():
+    """Test callback gauges are computed when rendered"""
+    registry = MetricsRegistry()
+    depth = [3]
+    registry.gauge('queue_depth', 'Depth').set_function(lambda: depth[0])
+
+    assert 'queue_depth 3' in registry.render()
+    depth[0] = 5
+    assert 'queue_depth 5' in registry.render()
+
+
+def test_disabled_registry_ignores_updates():
+    """Test instrumentation can be switched off"""
+    registry = MetricsRegistry(enabled=False)
+    counter = registry.counter('clips_total', 'Clips')
+    histogram = registry.histogram('latency_seconds', 'Latency')
+
+    counter.inc()
+    with histogram.time():
+        pass
+
+    assert counter.value() == 0
+    assert histogram.count() == 0
+
+
+def test_instrument_times_method_calls():
+    """Test instrumented methods keep their result and record a duration"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram('db_seconds', 'DB', ('method',))
+
+    class Store:
+        def get(self, key):
+            return key * 2
+
+    store = Store()
+    instrument(store, ['get'], histogram)
+
+    assert store.get(21) == 42
+    assert store.get.__name__ == 'get'
+    assert histogram.count(method='get') == 1
+
+
+def test_client_content_types_cannot_add_series():
+    """Test unknown content types share the 'other' label"""
+    before = INGESTED_CLIPS.value(content_type='other')
+
+    record_ingest('text', 5)
+    record_ingest('x-random-1', 5)
+    record_ingest(['not', 'hashable'], 5)
+    record_broadcast('clipboard_update', {'content_type': 'x-random-2', 'content': 'hi'})
+
+    assert INGESTED_CLIPS.value(content_type='other') == before + 2
+    assert INGESTED_CLIPS.value(content_type='x-random-1') == 0
+    assert BROADCAST_BYTES.value(event='clipboard_update', content_type='x-random-2') == 0
+
+
+def test_broadcast_bytes_count_payload_fields():
+    """Test text and image payload lengths of every replayed entry are counted"""
+    before = BROADCAST_BYTES.value(event='clipboard_replay', content_type='image')
+
+    record_broadcast('clipboard_replay', {'entries': [
+        {'content_type': 'image', 'content': 'Image (PNG)', 'image_data': 'aGVsbG8='},
+        {'content_type': 'image', 'content': 'Image (PNG)', 'image_data': b'raw'},
+    ]})
+
+    assert BROADCAST_BYTES.value(event='clipboard_replay', content_type='image') == \
+        before + 11 + 8 + 11 + 3
+
+
+def test_metric_base_is_abstract():
+    """Test metric types must implement children and samples"""
+    with pytest.raises(TypeError):
+        _Metric(MetricsRegistry(), 'name', 'help')
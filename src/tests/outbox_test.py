@@ -0,0 +1,83 @@
+import threading
+
+from outbox import ClipOutbox
+from upload_queue import UploadError, UploadQueue
+from clip_object import ClipObject
+
+
+def test_outbox_round_trip(tmp_path):
+    """Test text and image clips are stored and read back oldest first"""
+    outbox = ClipOutbox(str(tmp_path / 'outbox.db'))
+    image = ClipObject.from_image_bytes(b'\x89PNG data')
+    image.content = 'Screenshot'
+
+    outbox.add(1, ClipObject('text', trace_id='abc123'))
+    outbox.add(1, image)
+    entries = outbox.peek(10)
+
+    assert [entry[2].get_content() for entry in entries] == ['text', 'Screenshot']
+    assert [entry[2].trace_id for entry in entries] == ['abc123', None]
+    assert entries[1][2].get_image_bytes() == b'\x89PNG data'
+    outbox.remove([entries[0][0]])
+    assert len(outbox) == 1
+    outbox.close()
+
+
+def test_outbox_survives_restart(tmp_path):
+    """Test waiting clips are still there after reopening the file"""
+    path = str(tmp_path / 'outbox.db')
+    outbox = ClipOutbox(path)
+    outbox.add(1, ClipObject('offline copy'))
+    outbox.close()
+
+    reopened = ClipOutbox(path)
+    assert [entry[2].get_content() for entry in reopened.peek(10)] == ['offline copy']
+    reopened.close()
+
+
+def test_outbox_compacts_superseded_clips(tmp_path):
+    """Test duplicates are replaced and the caps drop the oldest clips"""
+    outbox = ClipOutbox(str(tmp_path / 'outbox.db'), max_entries=3)
+
+    superseded = [outbox.add(1, ClipObject(content)) for content in 'abacd']
+
+    assert superseded == [0, 0, 1, 0, 1]
+    assert [entry[2].get_content() for entry in outbox.peek(10)] == ['a', 'c', 'd']
+    outbox.close()
+
+
+def test_outbox_byte_cap(tmp_path):
+    """Test the byte cap keeps the newest clips"""
+    outbox = ClipOutbox(str(tmp_path / 'outbox.db'), max_bytes=25)
+
+    for content in ('x' * 10, 'y' * 10, 'z' * 10):
+        outbox.add(1, ClipObject(content))
+
+    assert outbox.size_bytes() == 20
+    assert len(outbox) == 2
+    outbox.close()
+
+
+def test_queue_keeps_clips_while_server_unreachable(tmp_path):
+    """Test clips copied offline stay in the outbox and are replayed later"""
+    outbox = ClipOutbox(str(tmp_path / 'outbox.db'))
+    online = threading.Event()
+    sent = []
+
+    def send(user_id, clip_obj):
+        if not online.is_set():
+            raise UploadError('connection refused')
+        sent.append(clip_obj.get_content())
+
+    queue = UploadQueue(send, max_retries=0, max_backoff=0.05, store=outbox)
+    queue.put(1, ClipObject('first'))
+    queue.put(1, ClipObject('second'))
+    assert queue.flush(0.2) is False
+    assert len(outbox) == 2
+
+    online.set()
+    assert queue.flush(5)
+    assert sent == ['first', 'second']
+    assert len(outbox) == 0
+    queue.close()
+    outbox.close()
@@ -0,0 +1,87 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from retention import RetentionPolicy, HistoryCompactor
+
+
+def make_db(transactions):
+    """Mock database holding one user's history, newest first"""
+    db = MagicMock()
+    db.get_user_ids_with_transactions.return_value = [1]
+    db.iter_user_transaction_sizes.return_value = transactions
+    db.delete_transactions.side_effect = lambda ids: len(ids)
+    return db
+
+
+HISTORY = [
+    {'_id': 'e', 'timestamp': 500, 'size': 10},
+    {'_id': 'd', 'timestamp': 400, 'size': 10, 'image_digest': 'img'},
+    {'_id': 'c', 'timestamp': 300, 'size': 10},
+    {'_id': 'b', 'timestamp': 200, 'size': 10, 'image_digest': 'img'},
+    {'_id': 'a', 'timestamp': 100, 'size': 10},
+]
+
+
+def deleted_ids(db):
+    return [i for call in db.delete_transactions.call_args_list for i in call[0][0]]
+
+
+def test_compact_max_entries():
+    """Test only the newest N entries are kept"""
+    db = make_db(HISTORY)
+    compactor = HistoryCompactor(db, RetentionPolicy(max_entries=2))
+
+    assert compactor.compact_user(1) == 3
+    assert deleted_ids(db) == ['c', 'b', 'a']
+    db.delete_orphan_blobs.assert_not_called()
+
+
+def test_compact_max_age():
+    """Test entries older than max_age are deleted"""
+    db = make_db(HISTORY)
+    compactor = HistoryCompactor(db, RetentionPolicy(max_age=350))
+
+    assert compactor.compact_user(1, now=600) == 2
+    assert deleted_ids(db) == ['b', 'a']
+
+
+def test_compact_max_bytes_in_batches():
+    """Test the byte limit and batched deletes"""
+    db = make_db(HISTORY)
+    compactor = HistoryCompactor(db, RetentionPolicy(max_bytes=25), batch_size=2)
+
+    assert compactor.compact_user(1) == 3
+    assert [len(call[0][0]) for call in db.delete_transactions.call_args_list] == [2, 1]
+
+
+def test_compact_all_sweeps_blobs_after_grace_period(monkeypatch):
+    """Test a pass ends with a sweep of blobs older than the grace period"""
+    db = make_db(HISTORY)
+    monkeypatch.setattr('retention.time.time', lambda: 5000.0)
+    compactor = HistoryCompactor(db, RetentionPolicy(max_entries=2), blob_grace=1000)
+
+    assert compactor.compact_all() == 3
+    db.delete_orphan_blobs.assert_called_once_with(
+        datetime.fromtimestamp(4000, timezone.utc)
+    )
+
+
+def test_compact_all_disabled_policy():
+    """Test an empty policy never touches the database"""
+    db = make_db(HISTORY)
+
+    assert HistoryCompactor(db, RetentionPolicy()).compact_all() == 0
+    db.get_user_ids_with_transactions.assert_not_called()
+
+
+def test_policy_from_env(monkeypatch):
+    """Test reading the policy from the environment"""
+    monkeypatch.setenv('RETENTION_MAX_ENTRIES', '1000')
+    monkeypatch.setenv('RETENTION_MAX_AGE_DAYS', '30')
+    monkeypatch.delenv('RETENTION_MAX_BYTES', raising=False)
+
+    policy = RetentionPolicy.from_env()
+
+    assert policy.max_entries == 1000
+    assert policy.max_age == 30 * 86400
+    assert policy.max_bytes is None
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import socket
+import threading
+import subprocess
+from multiprocessing.connection import Client
+
+import pytest
+import requests
+import socketio
+
+from socket_manager import (
+    LocalBroker, LocalPubSubManager, UserRooms, create_client_manager, decode_message,
+    encode_message, parse_local_url
+)
+
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs webapp.py on the given port with the database mocked out
+WORKER_SCRIPT = """
+import sys
+from unittest.mock import MagicMock
+import webapp
+webapp.db = MagicMock()
+webapp.db.next_sequence.return_value = 1
+webapp.db.get_last_sequence.return_value = 0
+webapp.db.get_last_stored_sequence.return_value = 0
+webapp.socketio.run(webapp.app, host='127.0.0.1', port=int(sys.argv[1]),
+                    allow_unsafe_werkzeug=True)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 15) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Worker on port {port} did not start")
+
+
+@pytest.fixture(autouse=True)
+def broker_authkey(monkeypatch):
+    """Shared secret of the local broker, inherited by the workers"""
+    monkeypatch.setenv('SOCKETIO_BROKER_AUTHKEY', 'test-secret')
+
+
+@pytest.fixture
+def broker():
+    """Local message broker shared by the workers"""
+    local_broker = LocalBroker().start()
+    yield local_broker
+    local_broker.close()
+
+
+def test_parse_local_url():
+    """Test local broker URLs"""
+    assert parse_local_url('local://127.0.0.1:6380') == ('127.0.0.1', 6380)
+    with pytest.raises(ValueError):
+        parse_local_url('local://nohost')
+
+
+def test_create_client_manager():
+    """Test picking a backend from the message queue URL"""
+    assert create_client_manager(None) is None
+    assert create_client_manager('') is None
+    assert isinstance(create_client_manager('local://127.0.0.1:1'), LocalPubSubManager)
+
+
+def test_local_broker_requires_authkey(monkeypatch):
+    """Test there is no default broker secret"""
+    monkeypatch.delenv('SOCKETIO_BROKER_AUTHKEY')
+    with pytest.raises(ValueError):
+        LocalBroker()
+    with pytest.raises(ValueError):
+        create_client_manager('local://127.0.0.1:1')
+
+
+def test_messages_are_json_with_bytes_and_tuples():
+    """Test broker messages round-trip without pickle"""
+    message = {'channel': 'c', 'data': {'data': b'\x00zlib', 'callback': ('sid', '/', 1)}}
+
+    raw = encode_message(message)
+
+    assert raw.startswith(b'{')
+    assert decode_message(raw) == message
+
+
+def test_local_broker_fans_out_to_every_subscriber(broker):
+    """Test a message published by one manager reaches all listeners"""
+    publisher = LocalPubSubManager(broker.url)
+    listeners = [LocalPubSubManager(broker.url) for _ in range(2)]
+    streams = [listener._listen() for listener in listeners]
+    received = []
+    threads = [
+        threading.Thread(target=lambda s=stream: received.append(next(s)))
+        for stream in streams
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+
+    publisher._publish({'method': 'emit', 'event': 'clipboard_update', 'data': b'raw'})
+
+    for thread in threads:
+        thread.join(2)
+    assert received == [{'method': 'emit', 'event': 'clipboard_update', 'data': b'raw'}] * 2
+
+
+def test_local_broker_drops_unknown_roles(broker):
+    """Test a connection opening with anything but a raw role is closed"""
+    conn = Client(parse_local_url(broker.url), authkey=b'test-secret')
+    conn.send('subscribe')
+
+    # Closed without a reply: a pickled role is never unpickled
+    assert conn.poll(2)
+    with pytest.raises((EOFError, OSError)):
+        conn.recv_bytes()
+
+
+@pytest.mark.integration
+def test_update_reaches_client_on_other_worker(broker):
+    """Test a clip posted to worker A is pushed to a client of worker B"""
+    env = dict(os.environ, SOCKETIO_MESSAGE_QUEUE=broker.url)
+    ports = [free_port(), free_port()]
+    workers = [
+        subprocess.Popen(
+            [sys.executable, '-c', WORKER_SCRIPT, str(port)],
+            cwd=SRC_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for port in ports
+    ]
+    client = socketio.Client()
+    try:
+        for port in ports:
+            wait_for_port(port)
+
+        received = threading.Event()
+        updates = []
+
+        def on_update(data):
+            updates.append(data)
+            received.set()
+
+        client.on('clipboard_update', on_update)
+        client.connect(f'http://127.0.0.1:{ports[1]}')
+        client.emit('join', {'user_id': 42})
+        time.sleep(0.5)
+
+        response = requests.post(
+            f'http://127.0.0.1:{ports[0]}/api/clipboard',
+            json={'user_id': 42, 'content': 'from worker A'}
+        )
+
+        assert response.status_code == 200
+        assert received.wait(5)
+        assert updates[0]['content'] == 'from worker A'
+    finally:
+        if client.connected:
+            client.disconnect()
+        for worker in workers:
+            worker.terminate()
+            worker.wait(5)
+
+
+def test_user_rooms_group_payloads_by_encoding():
+    """Test small events go to every room at once, large ones per encoding"""
+    rooms = UserRooms(['zlib'], threshold=100)
+
+    assert rooms.join(7, ['zlib']) == ('7:zlib', 'zlib')
+    assert rooms.join(7, None) == ('7', None)
+    assert UserRooms([]).join(7, ['zlib']) == ('7', None)
+
+    small = {'content': 'hi'}
+    assert rooms.emissions(7, small) == [(small, ['7', '7:zlib'])]
+
+    large = {'content': 'x' * 1000}
+    (plain, plain_rooms), (encoded, encoded_rooms) = rooms.emissions(7, large)
+    assert (plain, plain_rooms) == (large, ['7'])
+    assert encoded_rooms == ['7:zlib']
+    assert encoded['content_encoding'] == 'zlib'
@@ -0,0 +1,177 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from sqlite_storage import SQLiteCRUD
+from storage import ClipboardStorage, make_history_cursor, storage_from_env
+from retention import RetentionPolicy, HistoryCompactor
+from clip_object import ClipObject
+from clip_user import ClipUser
+
+
+@pytest.fixture
+def db(tmp_path):
+    store = SQLiteCRUD(str(tmp_path / 'clipboard.db'))
+    yield store
+    store.close()
+
+
+def test_history_pages_and_metadata(db):
+    """Test history is newest first, paginated by cursor and previewed"""
+    for index in range(5):
+        db.insert_transaction(1, ClipObject(f"clip {index} " + "x" * 300 * (index == 0)))
+    db.insert_transaction(2, ClipObject("other user"))
+
+    page = db.get_n_last_user_transaction(1, 3)
+    assert [trans['content'] for trans in page] == ['clip 4 ', 'clip 3 ', 'clip 2 ']
+    assert [trans['seq'] for trans in page] == [5, 4, 3]
+
+    rest = db.get_n_last_user_transaction(
+        1, 3, metadata_only=True, before=make_history_cursor(page[-1])
+    )
+    assert [trans['preview'][:6] for trans in rest] == ['clip 1', 'clip 0']
+    assert [trans['truncated'] for trans in rest] == [False, True]
+    assert 'content' not in rest[0]
+    assert db.get_user_transaction(1, str(page[0]['_id']))['content'] == 'clip 4 '
+    assert db.get_user_transaction(2, str(page[0]['_id'])) is None
+    assert db.get_last_user_transaction(2)['content'] == 'other user'
+
+
+def test_compressed_text_and_images_round_trip(db):
+    """Test compressed text is decoded and images go to the blob store"""
+    db.enable_compression('zlib', threshold=100)
+    text = "copied log line\n" * 100
+    image = ClipObject.from_image_bytes(b'\x89PNG data')
+
+    db.insert_transaction(1, ClipObject(text, trace_id='abc123'))
+    db.insert_transaction(1, image)
+
+    image_entry, text_entry = db.get_n_last_user_transaction(1, 2)
+    assert text_entry['content'] == text
+    assert text_entry['trace_id'] == 'abc123'
+    assert 'content_encoding' not in text_entry
+    assert db.get_blob(image_entry['image_digest'])['data'] == b'\x89PNG data'
+    metadata = db.get_n_last_user_transaction(1, 2, metadata_only=True)
+    assert metadata[1]['preview'] == text[:200] and metadata[1]['truncated'] is True
+
+
+def test_sequences_and_replay(db):
+    """Test sequence blocks are reserved and replays start after ``since``"""
+    assert db.get_last_sequence(1) == 0
+    assert db.next_sequence(1) == 1
+    stored = db.insert_transactions(1, [ClipObject("a"), ClipObject("b")])
+
+    assert [trans['seq'] for trans in stored] == [2, 3]
+    assert [trans['content'] for trans in db.get_transactions_since(1, 2)] == ['b']
+    assert db.get_last_sequence(1) == 3
+    assert db.get_last_stored_sequence(1) == 3
+    db.next_sequence(1)
+    assert (db.get_last_sequence(1), db.get_last_stored_sequence(1)) == (4, 3)
+    assert db.get_last_stored_sequence(2) == 0
+
+
+def test_sequence_blocks(db, tmp_path, monkeypatch):
+    """Test sequence numbers come from reserved blocks and keep increasing"""
+    db.enable_sequence_blocks(10)
+
+    assert [db.next_sequence(1) for _ in range(3)] == [1, 2, 3]
+    assert db.get_last_sequence(1) == 10
+    assert [trans['seq'] for trans in db.insert_transactions(
+        1, [ClipObject("a"), ClipObject("b")])] == [4, 5]
+    assert db.next_sequence(1, count=8) == 11
+    assert db.get_last_sequence(1) == 20
+
+    # A restarted server skips what is left of the block
+    restarted = SQLiteCRUD(db.path).enable_sequence_blocks(10)
+    assert restarted.next_sequence(1) == 21
+    restarted.close()
+
+    # Several server processes must each reserve per clip
+    monkeypatch.setenv('SOCKETIO_MESSAGE_QUEUE', 'local://127.0.0.1:6380')
+    shared = SQLiteCRUD(str(tmp_path / 'queue.db')).configure_from_env()
+    assert shared.sequence_block_size == 1
+    shared.close()
+
+
+def test_users_updates_and_deletes(db):
+    """Test users and transactions follow the MongoCRUD semantics"""
+    user = ClipUser("alice", "secret", "alice@example.com")
+    db.insert_user(user)
+    db.insert_transaction(user.get_id(), ClipObject("hello"))
+    entry = db.get_last_user_transaction(user.get_id())
+
+    assert db.get_user("alice", "secret").get_email() == "alice@example.com"
+    assert db.get_user("alice", "wrong") is None
+    db.update_user(user.get_id(), {"email": "new@example.com"})
+    assert db.get_user_by_id(user.get_id()).get_email() == "new@example.com"
+
+    db.update_transaction(str(entry['_id']), {"content": "edited", "pinned": True})
+    updated = db.get_last_user_transaction(user.get_id())
+    assert (updated['content'], updated['pinned']) == ("edited", True)
+
+    db.delete_user(user.get_id())
+    assert db.get_user_by_id(user.get_id()) is None
+    assert db.get_user_ids_with_transactions() == []
+
+
+def test_retention_compactor_runs_on_sqlite(db):
+    """Test compaction deletes old entries and their orphaned blobs"""
+    image = ClipObject.from_image_bytes(b'old screenshot')
+    db.insert_transaction(1, image)
+    digest = db.get_last_user_transaction(1)['image_digest']
+    for index in range(3):
+        db.insert_transaction(1, ClipObject(f"clip {index}"))
+
+    compactor = HistoryCompactor(db, RetentionPolicy(max_entries=2), blob_grace=0)
+
+    assert compactor.compact_all() == 2
+    assert [trans['content'] for trans in db.get_n_last_user_transaction(1, 10)] == \
+        ['clip 2', 'clip 1']
+    assert db.get_blob(digest) is None
+
+
+def test_orphan_sweep_spares_recently_stored_blobs(db):
+    """Test unreferenced blobs are only deleted after the grace period"""
+    image = ClipObject.from_image_bytes(b'expired screenshot')
+    db.insert_transaction(1, image)
+    digest = db.get_last_user_transaction(1)['image_digest']
+    # e.g. expired by a TTL index: nothing references the blob any more
+    db.delete_user(1)
+    stored_at = db.get_blob(digest)['created_at']
+
+    assert db.delete_orphan_blobs(stored_at - timedelta(seconds=1)) == 0
+    assert db.get_blob(digest) is not None
+
+    # Storing it again (a new upload of the same image) restarts the grace period
+    db.insert_blob(b'expired screenshot')
+    assert db.get_blob(digest)['created_at'] >= stored_at
+    assert db.delete_orphan_blobs(stored_at - timedelta(seconds=1)) == 0
+
+    assert db.delete_orphan_blobs(datetime.now(timezone.utc)) == 1
+    assert db.get_blob(digest) is None
+
+
+def test_queries_are_index_backed(db, tmp_path):
+    """Test every query method is served by an index"""
+    assert db.check_query_plans() == {}
+
+    # Explained statements are cached per connection: use a fresh one
+    other = SQLiteCRUD(str(tmp_path / 'other.db'))
+    other._conn.execute("DROP INDEX transactions_user_seq")
+    assert list(other.check_query_plans()) == ['get_transactions_since']
+    other.close()
+
+
+def test_storage_from_env_selects_sqlite(tmp_path, monkeypatch):
+    """Test STORAGE_BACKEND picks the backend"""
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'env.db'))
+    monkeypatch.setenv('STORAGE_COMPRESSION', 'off')
+
+    store = storage_from_env()
+    assert isinstance(store, SQLiteCRUD) and isinstance(store, ClipboardStorage)
+    assert store.compression is None
+    store.close()
+
+    monkeypatch.setenv('STORAGE_BACKEND', 'cassandra')
+    with pytest.raises(ValueError):
+        storage_from_env()
@@ -0,0 +1,78 @@
+import json
+from unittest.mock import MagicMock
+
+from tracing import Tracer, clean_trace_id, load, summarize
+from clip_object import ClipObject
+from clipboard_observer import ServerClipboardObserver
+import clipboard_observer
+
+
+def test_disabled_tracer_records_nothing():
+    """Test clips get no trace id and spans are no-ops without a file"""
+    tracer = Tracer()
+    clip = ClipObject('hello')
+
+    tracer.begin(clip, 0.0)
+    with tracer.span('client.upload', 'abc'):
+        pass
+
+    assert clip.trace_id is None
+    assert tracer.enabled is False
+
+
+def test_tracer_appends_stage_records(tmp_path):
+    """Test capture and spans are written as JSON lines with durations"""
+    path = tmp_path / 'trace.jsonl'
+    tracer = Tracer(str(path))
+    clip = ClipObject('hello')
+
+    tracer.begin(clip, 100.0)
+    with tracer.span('client.upload', [clip.trace_id, None, 'other'], batch_size=2):
+        pass
+    tracer.close()
+
+    records = load([str(path)])
+    assert [record['stage'] for record in records] == \
+        ['client.capture', 'client.upload', 'client.upload']
+    assert records[0]['trace_id'] == clip.trace_id
+    assert records[0]['duration_ms'] > 0
+    assert records[2] == dict(records[2], trace_id='other', batch_size=2)
+
+
+def test_summarize_stage_durations_and_waits():
+    """Test the breakdown has per-stage durations, waits and end to end time"""
+    records = [
+        {'trace_id': 't1', 'stage': 'client.upload', 'start': 10.010, 'duration_ms': 20},
+        {'trace_id': 't1', 'stage': 'client.capture', 'start': 10.000, 'duration_ms': 5},
+        {'trace_id': 't1', 'stage': 'server.emit', 'start': 10.020, 'duration_ms': 2},
+        {'trace_id': 't2', 'stage': 'client.capture', 'start': 20.000, 'duration_ms': 7},
+    ]
+
+    summary = summarize(records)
+
+    assert summary['traces'] == 2
+    assert list(summary['stages']) == ['client.capture', 'client.upload', 'server.emit']
+    assert summary['stages']['client.capture']['count'] == 2
+    assert summary['stages']['client.capture']['max_ms'] == 7
+    assert summary['waits']['client.capture -> client.upload']['p50_ms'] == 5.0
+    assert summary['end_to_end']['max_ms'] == 30.0
+
+
+def test_trace_id_travels_with_the_upload(tmp_path, monkeypatch):
+    """Test the observer sends the trace id and records the upload"""
+    path = tmp_path / 'trace.jsonl'
+    tracer = Tracer(str(path))
+    monkeypatch.setattr(clipboard_observer, 'TRACER', tracer)
+    observer = ServerClipboardObserver('http://server')
+    observer.session = MagicMock()
+    observer.session.post.return_value.status_code = 200
+
+    observer.send(7, ClipObject('hello', trace_id='abc123'))
+    observer.close()
+    tracer.close()
+
+    assert observer.session.post.call_args[1]['json']['trace_id'] == 'abc123'
+    record = json.loads(path.read_text())
+    assert (record['trace_id'], record['stage']) == ('abc123', 'client.upload')
+    assert clean_trace_id('abc123') == 'abc123'
+    assert clean_trace_id('not a trace id') is None
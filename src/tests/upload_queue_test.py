@@ -0,0 +1,185 @@
+import threading
+from unittest.mock import MagicMock
+
+from upload_queue import UploadError, UploadQueue
+from clip_object import ClipObject
+
+
+def test_put_does_not_wait_for_upload():
+    """Test a slow upload never blocks the caller"""
+    release = threading.Event()
+    sent = []
+
+    def send(user_id, clip_obj):
+        release.wait(5)
+        sent.append(clip_obj.get_content())
+
+    queue = UploadQueue(send)
+    queue.put(1, ClipObject("first"))
+    queue.put(1, ClipObject("second"))
+    assert sent == []
+
+    release.set()
+    assert queue.flush(5)
+    assert sent == ["first", "second"]
+    queue.close()
+
+
+def test_retryable_failures_are_retried():
+    """Test a transient failure is retried until the upload succeeds"""
+    send = MagicMock(side_effect=[UploadError("down"), ConnectionError(), None])
+    queue = UploadQueue(send, max_retries=3, backoff=0.001)
+
+    queue.put(1, ClipObject("clip"))
+    assert queue.flush(5)
+
+    assert send.call_count == 3
+    assert queue.stats()['sent'] == 1
+    assert queue.stats()['retries'] == 2
+    queue.close()
+
+
+def test_rejected_uploads_are_given_up():
+    """Test a non-retryable failure is dropped and reported once"""
+    send = MagicMock(side_effect=UploadError("rejected", retryable=False))
+    on_give_up = MagicMock()
+    queue = UploadQueue(send, backoff=0.001, on_give_up=on_give_up)
+
+    queue.put(1, ClipObject("clip"))
+    assert queue.flush(5)
+
+    send.assert_called_once()
+    on_give_up.assert_called_once()
+    assert queue.stats()['failed'] == 1
+    queue.close()
+
+
+def test_full_queue_supersedes_oldest_clips():
+    """Test backpressure drops the oldest waiting clips, and duplicates coalesce"""
+    release = threading.Event()
+    sent = []
+
+    def send(user_id, clip_obj):
+        release.wait(5)
+        sent.append(clip_obj.get_content())
+
+    # The clip being uploaded keeps its slot until it is sent
+    queue = UploadQueue(send, max_size=3)
+    queue.put(1, ClipObject("in flight"))
+    assert queue.flush(0.1) is False
+    for content in ("a", "b", "a", "c"):
+        queue.put(1, ClipObject(content))
+
+    release.set()
+    assert queue.flush(5)
+
+    assert sent == ["in flight", "a", "c"]
+    assert queue.stats()['superseded'] == 2
+    queue.close()
+
+
+def test_waiting_clips_are_sent_in_batches():
+    """Test clips that piled up go out in one batch per user"""
+    release = threading.Event()
+    batches = []
+
+    def send(user_id, clip_obj):
+        release.wait(5)
+
+    def send_batch(user_id, clips):
+        batches.append((user_id, [clip.get_content() for clip in clips]))
+
+    queue = UploadQueue(send, send_batch=send_batch)
+    queue.put(1, ClipObject("in flight"))
+    assert queue.flush(0.1) is False
+    for user_id, content in ((1, "a"), (1, "b"), (2, "c")):
+        queue.put(user_id, ClipObject(content))
+
+    release.set()
+    assert queue.flush(5)
+
+    assert batches == [(1, ["a", "b"])]
+    assert queue.stats()['sent'] == 4
+    assert queue.stats()['batches'] == 1
+    queue.close()
+
+
+def test_image_clips_are_never_batched():
+    """Test image clips are uploaded one by one between text batches"""
+    release = threading.Event()
+    singles = []
+    batches = []
+
+    def send(user_id, clip_obj):
+        release.wait(5)
+        singles.append(clip_obj.get_content_type())
+
+    def send_batch(user_id, clips):
+        batches.append([clip.get_content() for clip in clips])
+
+    queue = UploadQueue(send, send_batch=send_batch)
+    queue.put(1, ClipObject("in flight"))
+    assert queue.flush(0.1) is False
+    queue.put(1, ClipObject("a"))
+    queue.put(1, ClipObject("b"))
+    queue.put(1, ClipObject.from_image_bytes(b"first"))
+    queue.put(1, ClipObject.from_image_bytes(b"second"))
+    queue.put(1, ClipObject("c"))
+    queue.put(1, ClipObject("d"))
+
+    release.set()
+    assert queue.flush(5)
+
+    assert batches == [["a", "b"], ["c", "d"]]
+    assert singles == ["text", "image", "image"]
+    assert queue.stats()['sent'] == 7
+    assert queue.stats()['batches'] == 2
+    queue.close()
+
+
+def test_rejected_batch_falls_back_to_single_uploads():
+    """Test a rejected batch is retried clip by clip"""
+    release = threading.Event()
+    sent = []
+
+    def send(user_id, clip_obj):
+        release.wait(5)
+        if clip_obj.get_content() == "bad":
+            raise UploadError("rejected", retryable=False)
+        sent.append(clip_obj.get_content())
+
+    send_batch = MagicMock(side_effect=UploadError("not found", retryable=False))
+    queue = UploadQueue(send, send_batch=send_batch)
+    queue.put(1, ClipObject("in flight"))
+    assert queue.flush(0.1) is False
+    for content in ("a", "bad", "b"):
+        queue.put(1, ClipObject(content))
+
+    release.set()
+    assert queue.flush(5)
+
+    send_batch.assert_called_once()
+    assert sent == ["in flight", "a", "b"]
+    assert queue.stats()['failed'] == 1
+    queue.close()
+
+
+def test_outcomes_are_reported():
+    """Test on_sent and on_give_up get the clips of each outcome"""
+    outcomes = []
+
+    def send(user_id, clip_obj):
+        if clip_obj.get_content() == "bad":
+            raise UploadError("rejected", retryable=False)
+
+    queue = UploadQueue(
+        send,
+        on_sent=lambda user_id, clip_obj: outcomes.append(("sent", clip_obj.get_content())),
+        on_give_up=lambda user_id, clip_obj: outcomes.append(("given up", clip_obj.get_content()))
+    )
+    for content in ("good", "bad"):
+        queue.put(1, ClipObject(content))
+    assert queue.flush(5)
+
+    assert outcomes == [("sent", "good"), ("given up", "bad")]
+    queue.close()
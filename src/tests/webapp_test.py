@@ -1,8 +1,9 @@
+import zlib
 import pytest
 import json
 from unittest.mock import Mock, patch, MagicMock
 
-from webapp import app, db
+from webapp import app, db, socketio
 from clip_user import ClipUser
 
 
@@ -84,17 +85,21 @@ def test_login_failure(client, mock_db):
 def test_add_clipboard(client, mock_db):
     """Test adding a clipboard entry"""
     mock_db.insert_transaction.return_value = mock_db
+    mock_db.next_sequence.return_value = 4
 
     response = client.post('/api/clipboard',
                           data=json.dumps({
                               'user_id': 123,
-                              'content': 'test clipboard content'
+                              'content': 'test clipboard content',
+                              'trace_id': 'abc123'
                           }),
                           content_type='application/json')
 
     assert response.status_code == 200
     data = json.loads(response.data)
     assert data['success'] is True
+    assert mock_db.insert_transaction.call_args[1]['seq'] == 4
+    assert mock_db.insert_transaction.call_args[0][1].trace_id == 'abc123'
 
 
 def test_add_clipboard_missing_data(client):
@@ -110,6 +115,43 @@ def test_add_clipboard_missing_data(client):
     assert data['success'] is False
 
 
+def test_add_clipboard_batch(client, mock_db):
+    """Test a batch is stored at once and announced with one event"""
+    mock_db.insert_transactions.return_value = [
+        {'_id': 'a1', 'seq': 5, 'content': 'first'},
+        {'_id': 'a2', 'seq': 6, 'content': 'second'}
+    ]
+
+    with patch.object(socketio, 'emit') as mock_emit:
+        response = client.post('/api/clipboard/123/batch',
+                              data=json.dumps({'clips': [
+                                  {'content': 'first'}, {'content': 'second'}
+                              ]}),
+                              content_type='application/json')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert (data['count'], data['first_seq'], data['last_seq']) == (2, 5, 6)
+    user_id, clips = mock_db.insert_transactions.call_args[0]
+    assert user_id == 123
+    assert [clip.get_content() for clip in clips] == ['first', 'second']
+    mock_emit.assert_called_once()
+    event, payload = mock_emit.call_args[0]
+    assert event == 'clipboard_batch'
+    assert [entry['seq'] for entry in payload['entries']] == [5, 6]
+    assert payload['seq'] == 6
+
+
+def test_add_clipboard_batch_invalid(client, mock_db):
+    """Test a batch with an invalid clip is rejected as a whole"""
+    response = client.post('/api/clipboard/123/batch',
+                          data=json.dumps({'clips': [{'content': 'ok'}, {}]}),
+                          content_type='application/json')
+
+    assert response.status_code == 400
+    mock_db.insert_transactions.assert_not_called()
+
+
 def test_get_clipboard_history(client, mock_db):
     """Test getting clipboard history"""
     mock_transactions = [
@@ -125,3 +167,258 @@ def test_get_clipboard_history(client, mock_db):
     assert data['success'] is True
     assert len(data['history']) == 2
     assert data['history'][0]['content'] == 'item1'
+
+
+def test_get_clipboard_history_limit_is_clamped(client, mock_db):
+    """Test the page size stays within 1..HISTORY_PAGE_LIMIT"""
+    mock_db.get_n_last_user_transaction.return_value = []
+
+    client.get('/api/clipboard/123?limit=0')
+    assert mock_db.get_n_last_user_transaction.call_args[0] == (123, 1)
+    client.get('/api/clipboard/123?limit=1000000')
+    assert mock_db.get_n_last_user_transaction.call_args[0] == (123, 200)
+    client.get('/api/clipboard/123?limit=many')
+    assert mock_db.get_n_last_user_transaction.call_args[0] == (123, 50)
+
+
+def test_get_blob(client, mock_db):
+    """Test streaming a blob by digest"""
+    digest = 'a' * 64
+    mock_db.get_blob.return_value = {
+        '_id': digest,
+        'data': b'png bytes',
+        'mime_type': 'image/png'
+    }
+
+    response = client.get(f'/api/blob/{digest}')
+
+    assert response.status_code == 200
+    assert response.data == b'png bytes'
+    assert response.mimetype == 'image/png'
+    assert response.headers['ETag'] == f'"{digest}"'
+
+
+def test_get_blob_not_found(client, mock_db):
+    """Test requesting an unknown blob"""
+    mock_db.get_blob.return_value = None
+
+    response = client.get(f'/api/blob/{"b" * 64}')
+
+    assert response.status_code == 404
+
+
+def test_get_blob_invalid_digest(client, mock_db):
+    """Test requesting a blob with a malformed digest"""
+    response = client.get('/api/blob/not-a-digest')
+
+    assert response.status_code == 400
+    mock_db.get_blob.assert_not_called()
+
+
+def test_add_clipboard_image_binary(client, mock_db):
+    """Test uploading an image clip as raw bytes"""
+    digest = 'c' * 64
+    mock_db.insert_blob.return_value = digest
+
+    response = client.post('/api/clipboard/123/image?content=Screenshot',
+                          data=b'\x89PNG raw bytes',
+                          content_type='image/png')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['success'] is True
+    assert data['image_digest'] == digest
+    mock_db.insert_blob.assert_called_once_with(b'\x89PNG raw bytes', 'image/png')
+    args, kwargs = mock_db.insert_transaction.call_args
+    assert args[0] == 123
+    assert args[1].get_content() == 'Screenshot'
+    assert kwargs['image_digest'] == digest
+
+
+def test_add_clipboard_image_empty_body(client, mock_db):
+    """Test uploading an image clip without a body"""
+    response = client.post('/api/clipboard/123/image',
+                          data=b'',
+                          content_type='image/png')
+
+    assert response.status_code == 400
+    mock_db.insert_blob.assert_not_called()
+
+
+def test_get_clipboard_history_metadata(client, mock_db):
+    """Test metadata-only clipboard history"""
+    mock_db.get_n_last_user_transaction.return_value = [
+        {'_id': 'abc', 'content_type': 'text', 'size': 5000,
+         'preview': 'item1', 'truncated': True, 'timestamp': 1234567890}
+    ]
+
+    response = client.get('/api/clipboard/123?view=metadata')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    mock_db.get_n_last_user_transaction.assert_called_once_with(
+        123, 50, metadata_only=True, before=None
+    )
+    entry = data['history'][0]
+    assert entry['id'] == 'abc'
+    assert entry['preview'] == 'item1'
+    assert entry['truncated'] is True
+    assert 'content' not in entry
+    assert 'image_data' not in entry
+
+
+def test_get_clipboard_entry(client, mock_db):
+    """Test fetching the full payload of one clipboard entry"""
+    mock_db.get_user_transaction.return_value = {
+        '_id': 'abc', 'content': 'full text', 'timestamp': 1234567890
+    }
+
+    response = client.get('/api/clipboard/123/abc')
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['entry']['content'] == 'full text'
+    mock_db.get_user_transaction.assert_called_once_with(123, 'abc')
+
+
+def test_get_clipboard_entry_not_found(client, mock_db):
+    """Test fetching a clipboard entry that doesn't exist"""
+    mock_db.get_user_transaction.return_value = None
+
+    response = client.get('/api/clipboard/123/abc')
+
+    assert response.status_code == 404
+
+
+def test_get_clipboard_history_next_cursor(client, mock_db):
+    """Test a full history page returns a cursor for the next one"""
+    mock_db.get_n_last_user_transaction.return_value = [
+        {'_id': '65a000000000000000000002', 'content': 'item2', 'timestamp': 2.5},
+        {'_id': '65a000000000000000000001', 'content': 'item1', 'timestamp': 1.5}
+    ]
+
+    response = client.get('/api/clipboard/123?limit=2&before=3.0_65a000000000000000000003')
+
+    data = json.loads(response.data)
+    assert data['next_cursor'] == '1.5_65a000000000000000000001'
+    mock_db.get_n_last_user_transaction.assert_called_once_with(
+        123, 2, metadata_only=False, before='3.0_65a000000000000000000003'
+    )
+
+
+def test_get_clipboard_history_last_page(client, mock_db):
+    """Test a partial history page has no next cursor"""
+    mock_db.get_n_last_user_transaction.return_value = [
+        {'_id': '65a000000000000000000001', 'content': 'item1', 'timestamp': 1.5}
+    ]
+
+    response = client.get('/api/clipboard/123?limit=2')
+
+    assert json.loads(response.data)['next_cursor'] is None
+
+
+def test_get_clipboard_history_invalid_cursor(client, mock_db):
+    """Test a malformed cursor is rejected"""
+    mock_db.get_n_last_user_transaction.side_effect = ValueError('Invalid history cursor')
+
+    response = client.get('/api/clipboard/123?before=garbage')
+
+    assert response.status_code == 400
+
+
+def test_metrics_endpoint(client, mock_db):
+    """Test /metrics exposes request timings and ingested bytes"""
+    mock_db.next_sequence.return_value = 1
+    client.post('/api/clipboard',
+               data=json.dumps({'user_id': 123, 'content': 'hello'}),
+               content_type='application/json')
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    text = response.get_data(as_text=True)
+    assert 'syncclipboard_http_request_duration_seconds_count{' \
+        'method="POST",endpoint="add_clipboard",status="200"}' in text
+    assert 'syncclipboard_ingested_bytes_total{content_type="text"}' in text
+    assert 'syncclipboard_socket_connections' in text
+
+
+def _join(mock_db, data):
+    """Join a room with the Socket.IO test client and return received events"""
+    sio_client = socketio.test_client(app)
+    sio_client.emit('join', data)
+    received = sio_client.get_received()
+    sio_client.disconnect()
+    return {event['name']: event['args'][0] for event in received}
+
+
+def test_join_without_since_sends_current_sequence(mock_db):
+    """Test a first join only tells the client where the stored stream stands"""
+    # Clip 10 is announced but not stored yet
+    mock_db.get_last_sequence.return_value = 10
+    mock_db.get_last_stored_sequence.return_value = 9
+
+    events = _join(mock_db, {'user_id': 123})
+
+    assert events['clipboard_replay']['entries'] == []
+    assert events['clipboard_replay']['seq'] == 9
+    mock_db.get_transactions_since.assert_not_called()
+
+
+def test_join_since_replays_missed_entries(mock_db):
+    """Test a reconnecting client gets exactly the entries it missed"""
+    mock_db.get_last_sequence.return_value = 6
+    mock_db.get_transactions_since.return_value = [
+        {'_id': 'a', 'seq': 5, 'content': 'missed 1', 'timestamp': 1},
+        {'_id': 'b', 'seq': 6, 'content': 'missed 2', 'timestamp': 2}
+    ]
+
+    events = _join(mock_db, {'user_id': 123, 'since': 4})
+
+    replay = events['clipboard_replay']
+    assert [entry['content'] for entry in replay['entries']] == ['missed 1', 'missed 2']
+    assert replay['seq'] == 6
+    assert replay['truncated'] is False
+    assert mock_db.get_transactions_since.call_args[0][:2] == (123, 4)
+
+
+def test_join_resumes_from_stored_entries_not_counter(mock_db):
+    """Test clips reserved but not stored yet are not skipped on resume"""
+    # Clips 7 and 8 are announced, only 5 and 6 are stored so far
+    mock_db.get_last_sequence.return_value = 8
+    mock_db.get_transactions_since.return_value = [
+        {'_id': 'a', 'seq': 5, 'content': 'stored 1', 'timestamp': 1},
+        {'_id': 'b', 'seq': 6, 'content': 'stored 2', 'timestamp': 2}
+    ]
+
+    assert _join(mock_db, {'user_id': 123, 'since': 4})['clipboard_replay']['seq'] == 6
+
+    mock_db.get_transactions_since.return_value = []
+    replay = _join(mock_db, {'user_id': 123, 'since': 6})['clipboard_replay']
+    assert (replay['entries'], replay['seq']) == ([], 6)
+
+
+def test_join_up_to_date_skips_query(mock_db):
+    """Test a client that missed nothing costs no history query"""
+    mock_db.get_last_sequence.return_value = 6
+
+    events = _join(mock_db, {'user_id': 123, 'since': 6})
+
+    assert events['clipboard_replay']['entries'] == []
+    mock_db.get_transactions_since.assert_not_called()
+
+
+def test_join_with_encoding_gets_compressed_replay(mock_db):
+    """Test a client announcing zlib receives large text compressed"""
+    large = 'line of a long log\n' * 200
+    mock_db.get_last_sequence.return_value = 2
+    mock_db.get_transactions_since.return_value = [
+        {'_id': 'a', 'seq': 2, 'content': large, 'timestamp': 1}
+    ]
+
+    events = _join(mock_db, {'user_id': 123, 'since': 1, 'encodings': ['zlib']})
+
+    entry = events['clipboard_replay']['entries'][0]
+    assert entry['content_encoding'] == 'zlib'
+    assert zlib.decompress(entry['content']).decode() == large
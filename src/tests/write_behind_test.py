@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from write_behind import WriteBehindQueue
+
+
+class RecordingWriter:
+    """Collects written batches"""
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+        self.written = threading.Event()
+
+    def __call__(self, documents):
+        if self.fail:
+            raise RuntimeError("write failed")
+        self.batches.append(list(documents))
+        self.written.set()
+
+
+def test_flush_on_batch_size():
+    """Test a full batch is written without waiting for the delay"""
+    writer = RecordingWriter()
+    queue = WriteBehindQueue(writer, max_batch=3, max_delay=60)
+
+    for i in range(3):
+        queue.put({"n": i})
+
+    assert writer.written.wait(1)
+    assert writer.batches == [[{"n": 0}, {"n": 1}, {"n": 2}]]
+    queue.close()
+
+
+def test_flush_on_delay():
+    """Test a partial batch is written once the delay expires"""
+    writer = RecordingWriter()
+    queue = WriteBehindQueue(writer, max_batch=100, max_delay=0.01)
+
+    queue.put({"n": 1})
+
+    assert writer.written.wait(1)
+    assert writer.batches == [[{"n": 1}]]
+    queue.close()
+
+
+def test_flush_and_close_write_pending_documents():
+    """Test flush() and close() drain the buffer"""
+    writer = RecordingWriter()
+    queue = WriteBehindQueue(writer, max_batch=100, max_delay=60)
+
+    queue.put({"n": 1})
+    queue.flush()
+    assert writer.batches == [[{"n": 1}]]
+
+    queue.put({"n": 2})
+    queue.close()
+    assert writer.batches == [[{"n": 1}], [{"n": 2}]]
+    assert queue.documents_written == 2
+
+    with pytest.raises(RuntimeError):
+        queue.put({"n": 3})
+
+
+def test_durable_put_raises_write_error():
+    """Test durable mode reports failed batch writes to the caller"""
+    queue = WriteBehindQueue(RecordingWriter(fail=True), max_delay=0.01, durable=True)
+
+    with pytest.raises(RuntimeError, match="write failed"):
+        queue.put({"n": 1})
+
+    assert queue.failed_documents == 1
+    queue.close()
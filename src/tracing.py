@@ -0,0 +1,288 @@
+"""
+Per-stage timing of clips on their way from copy to remote paste.
+
+A trace id is given to a clip when it is captured and travels with it
+through the upload, storage and broadcast (``trace_id`` in the upload
+body, the stored transaction and the socket events). Every stage the
+clip goes through appends one JSON line to a local file:
+
+    {"trace_id": "9f0c...", "stage": "client.upload", "start": 1700000000.125,
+     "duration_ms": 12.5, "pid": 4242}
+
+Tracing is off unless a file is set: TRACE_FILE on the server,
+``--trace-file`` on the client. Summarize the files of both ends with
+
+    python tracing.py summarize client.jsonl server.jsonl
+
+for the duration of each stage and the waits between them. Stages
+recorded on different machines are compared on wall-clock time, so the
+waits across the network are only as accurate as the clocks' sync.
+"""
+import os
+import re
+import sys
+import json
+import time
+import secrets
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+# Stages in the order a clip normally goes through them
+STAGES = (
+    'client.capture',   # reading the local clipboard
+    'client.enqueue',   # handing the clip to the upload queue (and outbox)
+    'client.upload',    # HTTP request to the server
+    'server.blob',      # storing the bytes of an image
+    'server.emit',      # broadcast to the user's Socket.IO rooms
+    'server.store',     # writing the transaction
+    'client.receive',   # decoding the event on another client
+    'client.paste',     # writing the received content to its clipboard
+)
+
+TRACE_ID_PATTERN = re.compile(r'^[0-9A-Za-z_-]{1,64}$')
+
+TraceIds = Union[Optional[str], Iterable[Optional[str]]]
+
+
+def new_trace_id() -> str:
+    """Get a random trace id
+
+    Returns:
+        str: 32 hex characters
+    """
+    return secrets.token_hex(16)
+
+
+def clean_trace_id(value) -> Optional[str]:
+    """Validate a trace id received from a peer
+
+    Args:
+        value: The received value
+
+    Returns:
+        Optional[str]: The trace id, or None if missing or malformed
+    """
+    if isinstance(value, str) and TRACE_ID_PATTERN.match(value):
+        return value
+    return None
+
+
+class Tracer:
+    """Appends stage timings of traced clips to a JSON lines file"""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """Initialize the tracer
+
+        Args:
+            path (Optional[str]): File the records are appended to (tracing
+                is disabled when None)
+        """
+        self._file = None
+        self._lock = threading.Lock()
+        self.path = None
+        self.configure(path)
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def configure(self, path: Optional[str]) -> None:
+        """Start writing to another file, or stop tracing
+
+        Args:
+            path (Optional[str]): The file, or None to disable tracing
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.path = path
+            if path:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # Line buffered: each record reaches the file on its own
+                self._file = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def begin(self, clip_obj, start: float) -> None:
+        """Give a captured clip a trace id and record its capture
+
+        Args:
+            clip_obj (ClipObject): The clip read from the clipboard
+            start (float): time.time() when the clipboard read started
+        """
+        if not self.enabled:
+            return
+        clip_obj.trace_id = new_trace_id()
+        self.record('client.capture', clip_obj.trace_id, start, time.time(),
+                    content_type=clip_obj.get_content_type())
+
+    def record(self, stage: str, trace_ids: TraceIds, start: float,
+               end: Optional[float] = None, **fields) -> None:
+        """Record a stage of one or several clips
+
+        Args:
+            stage (str): Stage name (see STAGES)
+            trace_ids: A trace id or several (None entries are skipped)
+            start (float): time.time() when the stage started
+            end (Optional[float]): time.time() when it ended (same as start
+                for an instant)
+            **fields: Extra JSON-serializable values stored with the record
+        """
+        if not self.enabled:
+            return
+        if trace_ids is None or isinstance(trace_ids, str):
+            trace_ids = [trace_ids]
+        duration_ms = round(((end if end is not None else start) - start) * 1000, 3)
+        lines = [
+            json.dumps(dict(
+                fields, trace_id=trace_id, stage=stage, start=start,
+                duration_ms=duration_ms, pid=os.getpid()
+            )) + '\n'
+            for trace_id in trace_ids if trace_id
+        ]
+        if not lines:
+            return
+        with self._lock:
+            if self._file is not None:
+                self._file.write(''.join(lines))
+
+    @contextmanager
+    def span(self, stage: str, trace_ids: TraceIds, **fields) -> Iterator[None]:
+        """Record the duration of a block as a stage
+
+        Args:
+            stage (str): Stage name (see STAGES)
+            trace_ids: A trace id or several
+            **fields: Extra values stored with the record
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, trace_ids, start, time.time(), **fields)
+
+    def close(self) -> None:
+        """Stop tracing and close the file"""
+        self.configure(None)
+
+
+# Process-wide tracer; the client points it elsewhere with configure()
+TRACER = Tracer(os.getenv('TRACE_FILE') or None)
+
+
+def load(paths: Iterable[str]) -> List[dict]:
+    """Read trace records, skipping lines that are not valid JSON
+
+    Args:
+        paths (Iterable[str]): Trace files
+
+    Returns:
+        List[dict]: The records
+    """
+    records = []
+    for path in paths:
+        with open(path, encoding='utf-8') as trace_file:
+            for line in trace_file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+def _stats(values: List[float]) -> dict:
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50_ms': round(_percentile(values, 0.5), 3),
+        'p95_ms': round(_percentile(values, 0.95), 3),
+        'max_ms': round(values[-1], 3)
+    }
+
+
+def summarize(records: Iterable[dict]) -> dict:
+    """Build latency breakdowns from trace records
+
+    Args:
+        records (Iterable[dict]): Records of one or several trace files
+
+    Returns:
+        dict: ``stages`` (duration statistics per stage), ``waits``
+            (time between the end of a stage and the start of the next
+            one of the same clip) and ``end_to_end`` (first start to last
+            end of each clip); statistics are in milliseconds
+    """
+    traces: Dict[str, List[dict]] = {}
+    for record in records:
+        if record.get('trace_id') and record.get('stage'):
+            traces.setdefault(record['trace_id'], []).append(record)
+
+    durations: Dict[str, List[float]] = {}
+    waits: Dict[str, List[float]] = {}
+    end_to_end: List[float] = []
+    for events in traces.values():
+        events.sort(key=lambda event: event['start'])
+        ends = [event['start'] + event.get('duration_ms', 0) / 1000 for event in events]
+        for event in events:
+            durations.setdefault(event['stage'], []).append(event.get('duration_ms', 0))
+        for previous, previous_end, event in zip(events, ends, events[1:]):
+            key = f"{previous['stage']} -> {event['stage']}"
+            waits.setdefault(key, []).append((event['start'] - previous_end) * 1000)
+        if len(events) > 1:
+            end_to_end.append((max(ends) - events[0]['start']) * 1000)
+
+    def stage_order(name: str) -> tuple:
+        return (STAGES.index(name) if name in STAGES else len(STAGES), name)
+
+    return {
+        'traces': len(traces),
+        'stages': {name: _stats(durations[name]) for name in sorted(durations, key=stage_order)},
+        'waits': {
+            name: _stats(values) for name, values in sorted(
+                waits.items(), key=lambda item: [stage_order(part) for part in item[0].split(' -> ')]
+            )
+        },
+        'end_to_end': _stats(end_to_end) if end_to_end else None
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Clip trace tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    summary_parser = commands.add_parser('summarize', help='Latency breakdown per stage')
+    summary_parser.add_argument('files', nargs='+', help='Trace files of the clients and server')
+    summary_parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args(argv)
+
+    summary = summarize(load(args.files))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+
+    print(f"{summary['traces']} traced clips")
+    for title in ('stages', 'waits'):
+        print(f"\n{title:34s} {'count':>7s} {'p50 ms':>10s} {'p95 ms':>10s} {'max ms':>10s}")
+        for name, stats in summary[title].items():
+            print(f"{name:34s} {stats['count']:7d} {stats['p50_ms']:10.2f} "
+                  f"{stats['p95_ms']:10.2f} {stats['max_ms']:10.2f}")
+    if summary['end_to_end']:
+        stats = summary['end_to_end']
+        print(f"\n{'end to end':34s} {stats['count']:7d} {stats['p50_ms']:10.2f} "
+              f"{stats['p95_ms']:10.2f} {stats['max_ms']:10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,365 @@
+import random
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from clip_object import ClipObject
+
+
+class UploadError(Exception):
+    """Upload failure raised by an UploadQueue send function"""
+
+    def __init__(self, message: str, retryable: bool = True) -> None:
+        """Initialize the error
+
+        Args:
+            message (str): Error description
+            retryable (bool): False when retrying cannot succeed (e.g. the
+                server rejected the clip)
+        """
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class MemoryClipStore:
+    """In-memory store of clips waiting for upload
+
+    Adding a clip replaces a waiting clip of the same user and content,
+    and supersedes the oldest waiting clip once ``max_size`` is reached.
+    """
+
+    # Waiting clips are lost when the process exits
+    durable = False
+
+    def __init__(self, max_size: int = 100) -> None:
+        """Initialize the store
+
+        Args:
+            max_size (int): Maximum number of waiting clips
+        """
+        self.max_size = max_size
+        self._entries: 'OrderedDict[int, Tuple[int, ClipObject]]' = OrderedDict()
+        self._ids = itertools.count()
+
+    def add(self, user_id: int, clip_obj: 'ClipObject', in_flight=()) -> int:
+        """Store a clip
+
+        Args:
+            user_id (int): The user ID who made the change
+            clip_obj (ClipObject): The clip
+            in_flight: IDs of clips being uploaded, never superseded
+
+        Returns:
+            int: Number of waiting clips it superseded
+        """
+        content_hash = clip_obj.get_content_hash()
+        superseded = [
+            entry_id for entry_id, (entry_user, entry_clip) in self._entries.items()
+            if entry_id not in in_flight and entry_user == user_id
+            and entry_clip.get_content_hash() == content_hash
+        ]
+        waiting = [
+            entry_id for entry_id in self._entries
+            if entry_id not in in_flight and entry_id not in superseded
+        ]
+        overflow = len(self._entries) - len(superseded) + 1 - self.max_size
+        superseded += waiting[:max(overflow, 0)]
+
+        for entry_id in superseded:
+            del self._entries[entry_id]
+        self._entries[next(self._ids)] = (user_id, clip_obj)
+        return len(superseded)
+
+    def peek(self, limit: int) -> List[tuple]:
+        """Get the oldest waiting clips without removing them
+
+        Args:
+            limit (int): Maximum number of clips
+
+        Returns:
+            List[tuple]: (entry_id, user_id, clip) tuples, oldest first
+        """
+        return [
+            (entry_id, user_id, clip_obj)
+            for entry_id, (user_id, clip_obj)
+            in itertools.islice(self._entries.items(), limit)
+        ]
+
+    def remove(self, entry_ids: List[int]) -> None:
+        """Remove handled clips
+
+        Args:
+            entry_ids (List[int]): IDs returned by peek
+        """
+        for entry_id in entry_ids:
+            self._entries.pop(entry_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class UploadQueue:
+    """Queue of clips uploaded by a background worker
+
+    put() never blocks on the network. Failed uploads are retried with
+    exponential backoff. With a durable store (see outbox.ClipOutbox),
+    clips that cannot reach the server stay stored and are replayed once
+    it is reachable again, instead of being dropped after the last retry.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int, 'ClipObject'], None],
+        max_size: int = 100,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        on_give_up: Optional[Callable[[int, 'ClipObject'], None]] = None,
+        store=None,
+        batch_size: int = 50,
+        send_batch: Optional[Callable[[int, List['ClipObject']], None]] = None,
+        on_sent: Optional[Callable[[int, 'ClipObject'], None]] = None
+    ) -> None:
+        """Initialize the queue and start its worker thread
+
+        Args:
+            send (Callable): Uploads one clip, raising UploadError (or any
+                exception, treated as retryable) on failure
+            max_size (int): Maximum number of clips waiting in the default
+                in-memory store
+            max_retries (int): Retries after the first failed attempt
+            backoff (float): Delay before the first retry in seconds,
+                doubled after each failure
+            max_backoff (float): Longest delay between two attempts
+            on_give_up (Optional[Callable]): Called with clips dropped
+                without being uploaded
+            store: Where waiting clips are kept (defaults to a
+                MemoryClipStore of max_size clips)
+            batch_size (int): Clips read from the store at once
+            send_batch (Optional[Callable]): Uploads several clips of one
+                user in one request; consecutive waiting clips of a user
+                go through it, falling back to send() if it is rejected
+            on_sent (Optional[Callable]): Called with clips the server
+                accepted
+        """
+        self.send = send
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.on_give_up = on_give_up
+        self.store = store if store is not None else MemoryClipStore(max_size)
+        self.batch_size = batch_size
+        self.send_batch = send_batch
+        self.on_sent = on_sent
+
+        # IDs of the stored clips the worker is uploading
+        self._in_flight: set = set()
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self.enqueued = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self.superseded = 0
+        self.batches = 0
+        self.max_depth = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, user_id: int, clip_obj: 'ClipObject') -> None:
+        """Queue a clip for upload without waiting for the network
+
+        Args:
+            user_id (int): The user ID who made the change
+            clip_obj (ClipObject): The clip to upload
+        """
+        with self._condition:
+            if self._closed:
+                print("Upload queue is closed, dropping clip")
+                return
+            self.superseded += self.store.add(user_id, clip_obj, self._in_flight)
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self.store))
+            self._condition.notify_all()
+
+    def depth(self) -> int:
+        """Get the number of clips waiting for upload
+
+        Returns:
+            int: Waiting clip count
+        """
+        with self._condition:
+            return len(self.store)
+
+    def stats(self) -> dict:
+        """Get queue counters
+
+        Returns:
+            dict: depth, max_depth, enqueued, sent, retries, failed,
+                superseded and batches
+        """
+        with self._condition:
+            return {
+                'depth': len(self.store),
+                'max_depth': self.max_depth,
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'retries': self.retries,
+                'failed': self.failed,
+                'superseded': self.superseded,
+                'batches': self.batches
+            }
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued clip has been handled
+
+        Args:
+            timeout (Optional[float]): Longest wait in seconds
+
+        Returns:
+            bool: True if the queue drained in time
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not len(self.store) and not self._in_flight, timeout
+            )
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Stop accepting clips and let the worker finish the queue
+
+        Clips of a durable store that could not be sent stay stored.
+
+        Args:
+            timeout (Optional[float]): Longest wait for the worker
+
+        Returns:
+            bool: True if the worker has stopped
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self) -> None:
+        """Worker thread main loop"""
+        while True:
+            with self._condition:
+                while not len(self.store) and not self._closed:
+                    self._condition.wait()
+                if not len(self.store):
+                    return
+                entries = self.store.peek(self.batch_size)
+                self._in_flight = {entry[0] for entry in entries}
+
+            handled, sent, given_up, unreachable = [], [], [], False
+            for run in self._runs(entries):
+                if len(run) > 1:
+                    result = self._upload(
+                        self.send_batch, run[0][1], [entry[2] for entry in run]
+                    )
+                    if result != 'rejected':
+                        if result == 'sent':
+                            with self._condition:
+                                self.batches += 1
+                        unreachable = self._settle(run, result, handled, sent, given_up)
+                        if unreachable:
+                            break
+                        continue
+                    # Find out which clips the server rejected, one by one
+                for entry in run:
+                    result = self._upload(self.send, entry[1], entry[2])
+                    unreachable = self._settle([entry], result, handled, sent, given_up)
+                    if unreachable:
+                        break
+                if unreachable:
+                    break
+
+            with self._condition:
+                self.store.remove(handled)
+                self.sent += len(sent)
+                self.failed += len(given_up)
+                self._in_flight = set()
+                self._condition.notify_all()
+
+            if self.on_sent is not None:
+                for user_id, clip_obj in sent:
+                    self.on_sent(user_id, clip_obj)
+            if self.on_give_up is not None:
+                for user_id, clip_obj in given_up:
+                    self.on_give_up(user_id, clip_obj)
+
+            if unreachable:
+                with self._condition:
+                    # Wait for the server to come back (or for close())
+                    if self._condition.wait_for(lambda: self._closed, self.max_backoff):
+                        return
+
+    def _runs(self, entries: List[tuple]) -> List[List[tuple]]:
+        """Group peeked entries into uploads
+
+        Consecutive text clips of the same user form one batch when
+        send_batch is set; otherwise every clip is uploaded on its own.
+        Image clips are never batched: they go one at a time through the
+        binary image endpoint instead of as base64 inside a JSON batch.
+        """
+        if self.send_batch is None:
+            return [[entry] for entry in entries]
+        runs: List[List[tuple]] = []
+        for entry in entries:
+            if (runs and runs[-1][0][1] == entry[1]
+                    and not entry[2].is_image() and not runs[-1][0][2].is_image()):
+                runs[-1].append(entry)
+            else:
+                runs.append([entry])
+        return runs
+
+    def _settle(self, run: List[tuple], result: str, handled: list,
+                sent: list, given_up: list) -> bool:
+        """Record the upload result of entries
+
+        Returns:
+            bool: True if the entries stay stored until the server is back
+        """
+        if result == 'unreachable' and self.store.durable:
+            return True
+        handled.extend(entry[0] for entry in run)
+        outcome = sent if result == 'sent' else given_up
+        outcome.extend((entry[1], entry[2]) for entry in run)
+        return False
+
+    def _upload(self, send: Callable, user_id: int, payload) -> str:
+        """Send one clip or batch, retrying retryable failures
+
+        Returns:
+            str: 'sent', 'rejected' or 'unreachable'
+        """
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                send(user_id, payload)
+                return 'sent'
+            except UploadError as e:
+                error = e
+                if not e.retryable:
+                    print(f"Error sending clipboard to server: {error}")
+                    return 'rejected'
+            except Exception as e:
+                error = e
+
+            if attempt == self.max_retries or self._closed:
+                break
+            with self._condition:
+                self.retries += 1
+            # Jitter keeps clients from retrying in lockstep after an outage
+            delay = min(delay, self.max_backoff)
+            time.sleep(delay / 2 + random.uniform(0, delay / 2))
+            delay *= 2
+
+        print(f"Error sending clipboard to server: {error}")
+        return 'unreachable'
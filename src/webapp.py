@@ -1,15 +1,67 @@
-from flask import Flask, render_template, request, jsonify
+import io
+import os
+import time
+from flask import Flask, Response, g, render_template, request, jsonify, send_file
 from flask_socketio import SocketIO, emit, join_room
-from db_management import MongoCRUD
-from clip_user import ClipUser
-from clip_object import ClipObject
-from datetime import datetime
+from storage import storage_from_env
+from socket_manager import UserRooms, create_client_manager
+from retention import start_compactor_from_env
+from metrics import (
+    REGISTRY, CONTENT_TYPE, HTTP_REQUEST_SECONDS, SOCKET_CONNECTIONS,
+    record_broadcast, watch_socketio_server
+)
+import clipboard_api
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-db = MongoCRUD()
+# Set SOCKETIO_MESSAGE_QUEUE to share rooms between several server processes
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    client_manager=create_client_manager(os.getenv('SOCKETIO_MESSAGE_QUEUE'))
+)
+
+# MongoDB by default; STORAGE_BACKEND=sqlite uses an embedded database
+db = storage_from_env()
+# Clients announcing compression support get large text compressed
+user_rooms = UserRooms.from_env()
+# Room count and send queue depth are read from the server on scrape
+watch_socketio_server(socketio.server)
+
+
+def emit_to_user(event: str, user_id: int, payload: dict) -> None:
+    """Emit an event to every client of a user
+
+    Clients that negotiated compression receive large text compressed.
+
+    Args:
+        event (str): Event name
+        user_id (int): The user's ID
+        payload (dict): The plain event payload
+    """
+    record_broadcast(event, payload)
+    for data, rooms in user_rooms.emissions(user_id, payload):
+        socketio.emit(event, data, room=rooms)
+
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started, for the latency histogram"""
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    """Record the request duration by endpoint and status"""
+    start = g.get('request_start')
+    if start is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            endpoint=request.endpoint or 'unmatched',
+            status=response.status_code
+        )
+    return response
 
 
 @app.route('/')
@@ -18,124 +70,139 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/metrics')
+def get_metrics():
+    """Expose metrics in the Prometheus text format"""
+    if not REGISTRY.enabled:
+        return jsonify({'success': False, 'message': 'Metrics are disabled'}), 404
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 @app.route('/api/login', methods=['POST'])
 def login():
     """Login endpoint"""
-    data = request.json
-    username = data.get('username')
-    password = data.get('password')
-
-    user = db.get_user(username, password)
-    if user:
-        return jsonify({
-            'success': True,
-            'user_id': user.get_id(),
-            'username': user.get_username()
-        })
-    return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+    status, payload = clipboard_api.login(db, request.get_json(silent=True))
+    return jsonify(payload), status
 
 
 @app.route('/api/register', methods=['POST'])
 def register():
     """Register new user endpoint"""
-    data = request.json
-    username = data.get('username')
-    password = data.get('password')
-    email = data.get('email')
-
-    try:
-        user = ClipUser(username, password, email)
-        db.insert_user(user)
-        return jsonify({
-            'success': True,
-            'user_id': user.get_id(),
-            'username': user.get_username()
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': str(e)
-        }), 400
+    status, payload = clipboard_api.register(db, request.get_json(silent=True))
+    return jsonify(payload), status
 
 
 @app.route('/api/clipboard', methods=['POST'])
 def add_clipboard():
     """Add a new clipboard entry (text or image)"""
-    data = request.json
-    user_id = data.get('user_id')
-    content = data.get('content')
-    content_type = data.get('content_type', 'text')
-    image_data = data.get('image_data')
-
-    if not user_id or not content:
-        return jsonify({
-            'success': False,
-            'message': 'Missing user_id or content'
-        }), 400
-
-    try:
-        # Create ClipObject with type and image data
-        clip_obj = ClipObject(
-            content=content,
-            content_type=content_type,
-            image_data=image_data
-        )
-        db.insert_transaction(user_id, clip_obj)
+    status, payload = clipboard_api.add_clip(db, emit_to_user, request.get_json(silent=True))
+    return jsonify(payload), status
+
+
+@app.route('/api/clipboard/<int:user_id>/image', methods=['POST'])
+def add_clipboard_image(user_id):
+    """Add an image clipboard entry from raw PNG bytes
+
+    The request body is the image itself (no JSON, no base64). An optional
+    ``content`` query parameter holds the image description.
+    """
+    # Read the body once, straight from the WSGI stream, without caching it
+    status, payload = clipboard_api.add_image(
+        db, emit_to_user, user_id, request.get_data(cache=False),
+        content=request.args.get('content'),
+        mime_type=request.mimetype,
+        trace_id=request.args.get('trace_id')
+    )
+    return jsonify(payload), status
 
-        # Notify all connected clients for this user
-        socketio.emit('clipboard_update', {
-            'user_id': user_id,
-            'content': content,
-            'content_type': content_type,
-            'image_data': image_data,
-            'timestamp': datetime.now().isoformat()
-        }, room=str(user_id))
 
-        return jsonify({'success': True})
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+@app.route('/api/clipboard/<int:user_id>/batch', methods=['POST'])
+def add_clipboard_batch(user_id):
+    """Add several clipboard entries in one request (see clipboard_api.add_batch)"""
+    status, payload = clipboard_api.add_batch(
+        db, emit_to_user, user_id, request.get_json(silent=True)
+    )
+    return jsonify(payload), status
 
 
 @app.route('/api/clipboard/<int:user_id>', methods=['GET'])
 def get_clipboard_history(user_id):
-    """Get clipboard history for a user"""
-    limit = request.args.get('limit', 50, type=int)
-
-    try:
-        transactions = db.get_n_last_user_transaction(user_id, limit)
-        result = []
-        for trans in transactions:
-            result.append({
-                'content': trans.get('content'),
-                'content_type': trans.get('content_type', 'text'),
-                'image_data': trans.get('image_data'),
-                'timestamp': trans.get('timestamp')
-            })
-        return jsonify({'success': True, 'history': result})
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+    """Get clipboard history for a user (see clipboard_api.get_history)"""
+    status, payload = clipboard_api.get_history(
+        db, user_id,
+        limit=request.args.get('limit'),
+        view=request.args.get('view'),
+        before=request.args.get('before')
+    )
+    return jsonify(payload), status
+
+
+@app.route('/api/clipboard/<int:user_id>/<transaction_id>', methods=['GET'])
+def get_clipboard_entry(user_id, transaction_id):
+    """Get the full payload of a single clipboard entry"""
+    status, payload = clipboard_api.get_entry(db, user_id, transaction_id)
+    return jsonify(payload), status
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get history cache hit/miss counters"""
+    status, payload = clipboard_api.cache_stats(db)
+    return jsonify(payload), status
+
+
+@app.route('/api/blob/<digest>', methods=['GET'])
+def get_blob(digest):
+    """Stream a stored blob (e.g. an image clip) by its digest"""
+    status, blob = clipboard_api.get_blob(db, digest)
+    if status != 200:
+        return jsonify(blob), status
+
+    # Blobs are content-addressed, so the digest is a strong, permanent ETag
+    response = send_file(
+        io.BytesIO(blob['data']),
+        mimetype=blob.get('mime_type', 'application/octet-stream'),
+        etag=digest,
+        max_age=31536000
+    )
+    response.cache_control.immutable = True
+    return response
 
 
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
     print('Client connected')
+    SOCKET_CONNECTIONS.inc()
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
     print('Client disconnected')
+    SOCKET_CONNECTIONS.dec()
 
 
 @socketio.on('join')
 def handle_join(data):
-    """Join a room based on user_id for targeted updates"""
+    """Join a room based on user_id for targeted updates
+
+    Clients pass ``since``, the last sequence number they saw, to get the
+    entries they missed replayed in one ``clipboard_replay`` message. Every
+    join is answered with a replay (empty without ``since``) holding the
+    current sequence number. ``encodings`` lists the compression codecs
+    the client can decode (see clip_compression).
+    """
     user_id = data.get('user_id')
     if user_id:
-        join_room(str(user_id))
+        room, encoding = user_rooms.join(user_id, data.get('encodings'))
+        join_room(room)
         print(f'User {user_id} joined their room')
+        replay = clipboard_api.build_replay(db, user_id, data.get('since'))
+        record_broadcast('clipboard_replay', replay)
+        emit('clipboard_replay', user_rooms.encode(replay, encoding))
 
 
 if __name__ == '__main__':
+    start_compactor_from_env(db)
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,31 +1,59 @@
 import socketio
 import pyperclip
 import threading
+from typing import Callable, Optional
+
+from clip_object import ClipObject
+from clip_compression import available_encodings, decode_event
+from tracing import TRACER
 
 
 class WebSocketClipboardClient:
     """Client that connects to the server via WebSocket for real-time updates"""
 
-    def __init__(self, server_url: str, user_id: int):
+    def __init__(
+        self,
+        server_url: str,
+        user_id: int,
+        before_copy: Optional[Callable[[ClipObject], None]] = None
+    ):
         """Initialize the WebSocket client
 
         Args:
             server_url (str): The URL of the server
             user_id (int): The user's ID
+            before_copy (Optional[Callable[[ClipObject], None]]): Called with
+                each received content right before it is put on the
+                clipboard (e.g. Client.remember_remote, so it is not
+                uploaded again)
         """
         self.server_url = server_url
         self.user_id = user_id
+        self.before_copy = before_copy
         self.sio = socketio.Client()
+        # Sequence number of the newest entry received, sent on reconnect
+        # so the server only replays what was missed
+        self.last_seq = None
 
         # Register event handlers
         self.sio.on('connect', self.on_connect)
         self.sio.on('disconnect', self.on_disconnect)
         self.sio.on('clipboard_update', self.on_clipboard_update)
+        self.sio.on('clipboard_replay', self.on_clipboard_replay)
+        self.sio.on('clipboard_batch', self.on_clipboard_batch)
+
+    def join(self):
+        """Join the user's room, asking for entries after last_seq"""
+        # Announcing the codecs it decodes gets large text sent compressed
+        data = {'user_id': self.user_id, 'encodings': available_encodings()}
+        if self.last_seq is not None:
+            data['since'] = self.last_seq
+        self.sio.emit('join', data)
 
     def on_connect(self):
         """Handle connection to server"""
         print(f'Connected to server at {self.server_url}')
-        self.sio.emit('join', {'user_id': self.user_id})
+        self.join()
 
     def on_disconnect(self):
         """Handle disconnection from server"""
@@ -37,11 +65,70 @@ class WebSocketClipboardClient:
         Args:
             data (dict): Update data containing content and timestamp
         """
+        trace_id = data.get('trace_id')
+        with TRACER.span('client.receive', trace_id):
+            decode_event(data)
+        seq = data.get('seq')
+        if seq is not None:
+            self.last_seq = max(seq, self.last_seq or 0)
         content = data.get('content')
         if content:
             print(f'Received clipboard update: {content[:50]}...')
             # Update local clipboard
-            pyperclip.copy(content)
+            with TRACER.span('client.paste', trace_id):
+                self.copy(content)
+
+    def copy(self, content: str) -> None:
+        """Put received text on the local clipboard
+
+        Args:
+            content (str): The text
+        """
+        if self.before_copy is not None:
+            self.before_copy(ClipObject(content=content, content_type='text'))
+        pyperclip.copy(content)
+
+    def on_clipboard_replay(self, data):
+        """Handle the entries missed while disconnected
+
+        Only the newest text entry is copied: the older ones would be
+        overwritten straight away.
+
+        Args:
+            data (dict): Replay containing entries (oldest first), the
+                sequence number to resume from and a truncated flag
+        """
+        entries = data.get('entries') or []
+        with TRACER.span('client.receive', [entry.get('trace_id') for entry in entries]):
+            decode_event(data)
+        text_entries = [
+            entry for entry in entries
+            if entry.get('content_type', 'text') == 'text' and entry.get('content')
+        ]
+        if text_entries:
+            content = text_entries[-1]['content']
+            print(f'Caught up on {len(entries)} missed clipboard entries')
+            with TRACER.span('client.paste', text_entries[-1].get('trace_id')):
+                self.copy(content)
+
+        seq = data.get('seq')
+        if seq is not None:
+            self.last_seq = max(seq, self.last_seq or 0)
+        if data.get('truncated'):
+            # More entries were missed than fit in one replay
+            self.join()
+
+    def on_clipboard_batch(self, data):
+        """Handle several entries uploaded in one batch
+
+        The payload has the clipboard_replay shape, and likewise only the
+        newest text entry is copied.
+
+        Args:
+            data (dict): Batch containing entries (oldest first) and the
+                sequence number of the last one
+        """
+        self.on_clipboard_replay(data)
 
     def connect(self):
         """Connect to the server"""
@@ -0,0 +1,160 @@
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+class _Ticket:
+    """Completion handle for a document written in durable mode"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+
+
+class WriteBehindQueue:
+    """Buffers documents and writes them in batches from a background thread
+
+    A batch is flushed as soon as it reaches ``max_batch`` documents or its
+    oldest document has waited ``max_delay`` seconds, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[dict]], None],
+        max_batch: int = 100,
+        max_delay: float = 0.05,
+        durable: bool = False
+    ) -> None:
+        """Initialize the queue and start its flusher thread
+
+        Args:
+            write_batch (Callable): Writes a list of documents (e.g. insert_many)
+            max_batch (int): Flush once this many documents are pending
+            max_delay (float): Flush once the oldest pending document is this
+                many seconds old
+            durable (bool): Make put() block until its batch is written and
+                raise if the write failed
+        """
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.durable = durable
+
+        self._pending: list = []
+        self._oldest: Optional[float] = None
+        self._in_flight = 0
+        self._flushing = False
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self.batches_written = 0
+        self.documents_written = 0
+        self.failed_documents = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, document: dict) -> None:
+        """Queue a document for writing
+
+        Args:
+            document (dict): The document to write
+
+        Raises:
+            RuntimeError: If the queue has been closed
+            Exception: In durable mode, the error raised by the batch write
+        """
+        ticket = _Ticket() if self.durable else None
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Write-behind queue is closed")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((document, ticket))
+            self._condition.notify_all()
+
+        if ticket is not None:
+            ticket.done.wait()
+            if ticket.error is not None:
+                raise ticket.error
+
+    def depth(self) -> int:
+        """Get the number of documents waiting to be written
+
+        Returns:
+            int: Pending document count
+        """
+        with self._condition:
+            return len(self._pending)
+
+    def flush(self) -> None:
+        """Block until every document queued so far has been written"""
+        with self._condition:
+            self._flushing = True
+            self._condition.notify_all()
+            while self._pending or self._in_flight:
+                self._condition.wait()
+
+    def close(self) -> None:
+        """Write everything still pending and stop the flusher thread"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _take_batch(self) -> Optional[list]:
+        """Wait until a batch is due and remove it from the pending list"""
+        with self._condition:
+            while True:
+                if self._pending:
+                    if self._closed or self._flushing or \
+                            len(self._pending) >= self.max_batch:
+                        break
+                    remaining = self._oldest + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            if self._pending:
+                self._oldest = time.monotonic()
+            else:
+                self._oldest = None
+                self._flushing = False
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self) -> None:
+        """Flusher thread main loop"""
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+
+            error = None
+            try:
+                self.write_batch([document for document, _ in batch])
+            except Exception as e:
+                error = e
+                print(f"Error writing batch of {len(batch)} documents: {e}")
+
+            with self._condition:
+                if error is None:
+                    self.batches_written += 1
+                    self.documents_written += len(batch)
+                else:
+                    self.failed_documents += len(batch)
+                self._in_flight = 0
+                self._condition.notify_all()
+
+            for _, ticket in batch:
+                if ticket is not None:
+                    ticket.error = error
+                    ticket.done.set()